@@ -1,7 +1,8 @@
 # uvicorn app.app:app --host 0.0.0.0 --port 8000 --reload
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from app.core.config import settings
 from app.core.database import (
     connect_to_mongo, 
@@ -12,6 +13,15 @@ from app.core.database import (
     get_redis
 )
 from app.routes import auth, generation, diagrams, workspace
+from app.services.llm_service import llm_service
+from app.services.llm_scheduler import QueueFullError
+from app.services.token_budget_service import token_budget_service
+from app.services.context_budget import ContextBudgetError, context_budget_manager
+from app.services.thumbnail_service import thumbnail_service
+from app.services.fewshot_service import fewshot_service
+from app.services.job_service import job_service
+from app.services.workspace_service import workspace_service
+from app.services.warmup_service import warmup_service
 
 def create_app() -> FastAPI:
     """Create FastAPI application"""
@@ -29,6 +39,23 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
     
+    @app.exception_handler(QueueFullError)
+    async def queue_full_handler(request: Request, exc: QueueFullError):
+        """LLM queue overflow -> 429 with Retry-After"""
+        return JSONResponse(
+            status_code=429,
+            content={"detail": str(exc)},
+            headers={"Retry-After": str(exc.retry_after)}
+        )
+    
+    @app.exception_handler(ContextBudgetError)
+    async def context_budget_handler(request: Request, exc: ContextBudgetError):
+        """Diagram does not fit into the model's context -> 413 before any LLM call"""
+        return JSONResponse(
+            status_code=413,
+            content={"detail": str(exc), "model": exc.model, "needed_tokens": exc.needed, "available_tokens": exc.available}
+        )
+    
     app.include_router(auth.router, prefix="/auth", tags=["auth"])
     app.include_router(generation.router, prefix="/generate", tags=["generation"])
     app.include_router(diagrams.router, prefix="/diagrams", tags=["diagrams"])
@@ -44,12 +71,24 @@ async def startup_event():
     print("=== Text to Diagram API Starting ===")
     await connect_to_mongo()
     await connect_to_redis()
+    await llm_service.start()
+    await warmup_service.start()
+    await token_budget_service.start()
+    await thumbnail_service.start()
+    await fewshot_service.start()
+    await job_service.ensure_group()
     print("=====================================")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Close connections on shutdown"""
     print("=== Shutting down API ===")
+    await workspace_service.stop()
+    await fewshot_service.stop()
+    await thumbnail_service.stop()
+    await token_budget_service.stop()
+    await warmup_service.stop()
+    await llm_service.close()
     await close_mongo_connection()
     await close_redis_connection()
     print("======================")
@@ -101,6 +140,17 @@ async def health_check_databases():
         "overall": "healthy" if mongo_status == "connected" and redis_status == "connected" else "unhealthy"
     }
 
+@app.get("/health/llm")
+async def health_check_llm():
+    """LLM scheduler metrics: limits, queue depth and queue wait times"""
+    metrics = llm_service.get_metrics()
+    metrics["token_budgets"] = token_budget_service.get_status()
+    metrics["thumbnails"] = thumbnail_service.get_status()
+    metrics["few_shot"] = fewshot_service.get_status()
+    metrics["context_budget"] = context_budget_manager.get_status()
+    metrics["jobs"] = await job_service.get_status()
+    return metrics
+
 if __name__ == "__main__":
     import uvicorn
     print("Starting Text to Diagram API server...")
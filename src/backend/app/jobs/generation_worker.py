@@ -0,0 +1,257 @@
+# src/backend/app/jobs/generation_worker.py
+"""Generation worker: runs jobs queued through POST /generate/jobs.
+
+Reads the Redis stream with XREADGROUP as one consumer of the shared group,
+so workers can be started in any number of processes and on any host that
+reaches the same Redis and LM Studio. Each job goes through
+GenerationService.generate_and_log (scheduler, cache, few-shot, logging).
+Messages are acknowledged only after the result is stored; while a job
+runs its message is re-claimed periodically to keep the idle time low, so
+jobs of a crashed worker become idle and are taken over with XAUTOCLAIM by
+the others. A job delivered jobs_max_attempts times is marked failed.
+
+Run from src/backend:
+    python -m app.jobs.generation_worker --concurrency 4
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import time
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.core.database import connect_to_mongo, close_mongo_connection, connect_to_redis, close_redis_connection, get_redis
+from app.services.job_service import job_service, FINISHED
+from app.services.llm_scheduler import QueueFullError
+from app.services.llm_service import llm_service
+from app.services.token_budget_service import token_budget_service
+from app.services.fewshot_service import fewshot_service
+from app.services.generation_service import generation_service
+
+
+async def run_generate(job: dict) -> dict:
+    payload = job["payload"]
+    code, error = await generation_service.generate_and_log(
+        user_id=job["user_id"],
+        prompt=payload["prompt"],
+        diagram_type=payload["diagram_type"],
+        diagram_id=payload.get("diagram_id"),
+        model=payload.get("model"),
+        use_cache=payload.get("use_cache", True)
+    )
+    if not code:
+        raise ValueError(error or "Failed to generate diagram")
+    return {
+        "mermaid_code": code,
+        "original_prompt": payload["prompt"],
+        "diagram_type": payload["diagram_type"],
+        "model": payload.get("model") or settings.default_model,
+        "is_valid": error is None,
+        "validation_error": error
+    }
+
+
+# Обработчики по типу задачи
+HANDLERS = {
+    "generate": run_generate
+}
+
+
+class GenerationWorker:
+    """One consumer of the jobs group with up to `concurrency` jobs in flight"""
+
+    def __init__(self, consumer: str, concurrency: int):
+        self.consumer = consumer
+        self.concurrency = concurrency
+        self.slot_freed = asyncio.Event()
+        self.claim_cursor = "0-0"
+        self.in_flight: Dict[str, asyncio.Task] = {}  # id сообщения -> задача
+        self.stopping = asyncio.Event()
+        self.processed = 0
+        self.failed = 0
+        self.reclaimed = 0
+
+    def stop(self):
+        print(f"🛑 Worker {self.consumer}: finishing {len(self.in_flight)} jobs in flight")
+        self.stopping.set()
+
+    async def _ack(self, message_id: str):
+        await get_redis().xack(settings.jobs_stream, settings.jobs_group, message_id)
+
+    async def _handle(self, job_id: str) -> Optional[bool]:
+        """Run one job; None means the message should stay pending"""
+        job = await job_service.get(job_id)
+        if job is None or job["status"] in FINISHED:
+            return True  # Истекла или уже выполнена другим воркером
+
+        attempts = await job_service.mark_running(job_id, self.consumer)
+        if attempts > settings.jobs_max_attempts:
+            await job_service.finish(job_id, error=f"Job failed after {settings.jobs_max_attempts} attempts")
+            return False
+
+        handler = HANDLERS.get(job["kind"])
+        if handler is None:
+            await job_service.finish(job_id, error=f"Unknown job kind: {job['kind']}")
+            return False
+
+        while True:
+            try:
+                result = await handler(job)
+                break
+            except QueueFullError as e:
+                # Очередь LLM этого процесса полна - ждем, сообщение остается за нами
+                if self.stopping.is_set():
+                    return None
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                print(f"❌ Job {job_id} failed: {e}")
+                await job_service.finish(job_id, error=str(e))
+                return False
+
+        await job_service.finish(job_id, result=result)
+        return True
+
+    async def _process(self, message_id: str, job_id: str):
+        try:
+            succeeded = await self._handle(job_id)
+            if succeeded is not None:
+                await self._ack(message_id)
+                self.processed += 1
+                self.failed += not succeeded
+        except Exception as e:
+            # Redis недоступен и т.п. - сообщение останется в PEL и будет забрано повторно
+            print(f"❌ Job {job_id} left pending: {e}")
+        finally:
+            self.in_flight.pop(message_id, None)
+            self.slot_freed.set()
+
+    def _start(self, messages: list):
+        for message_id, fields in messages:
+            message_id = message_id.decode()
+            job_id = fields[b"job_id"].decode()
+            self.in_flight[message_id] = asyncio.create_task(self._process(message_id, job_id))
+
+    async def _reclaim(self, count: int) -> list:
+        """Take over jobs left pending by workers that stopped responding"""
+        try:
+            # Redis 7 добавляет третьим элементом список удаленных записей
+            response = await get_redis().xautoclaim(
+                settings.jobs_stream, settings.jobs_group, self.consumer,
+                min_idle_time=settings.jobs_claim_idle * 1000, start_id=self.claim_cursor, count=count
+            )
+        except Exception as e:
+            print(f"❌ XAUTOCLAIM failed: {e}")
+            return []
+
+        self.claim_cursor, messages = response[0], response[1]
+        # Удаленные из потока записи приходят как (id, None) - их XAUTOCLAIM уже убрал из PEL
+        messages = [(message_id, fields) for message_id, fields in messages
+                    if fields and message_id.decode() not in self.in_flight]
+        for message_id, _ in messages:
+            print(f"♻️ Reclaimed job message {message_id.decode()}")
+        self.reclaimed += len(messages)
+        return messages
+
+    async def _read(self, count: int) -> list:
+        try:
+            response = await get_redis().xreadgroup(
+                settings.jobs_group, self.consumer, {settings.jobs_stream: ">"},
+                count=count, block=settings.jobs_block_ms
+            )
+        except Exception as e:
+            print(f"❌ XREADGROUP failed: {e}")
+            await asyncio.sleep(1)
+            return []
+        return [message for _, stream_messages in response or [] for message in stream_messages]
+
+    async def consume_loop(self):
+        """Reclaim stale jobs every jobs_claim_idle / 2 seconds, otherwise read new ones"""
+        next_claim = 0.0
+        while not self.stopping.is_set():
+            while len(self.in_flight) >= self.concurrency:
+                self.slot_freed.clear()
+                await self.slot_freed.wait()
+            if self.stopping.is_set():
+                break
+
+            free = self.concurrency - len(self.in_flight)
+            if time.monotonic() >= next_claim:
+                messages = await self._reclaim(free)
+                self._start(messages)
+                free -= len(messages)
+                # Курсор дошел до конца PEL - следующий проход через полпериода
+                if self.claim_cursor in (b"0-0", "0-0"):
+                    next_claim = time.monotonic() + settings.jobs_claim_idle / 2
+                if not free:
+                    continue
+
+            self._start(await self._read(free))
+
+    async def heartbeat_loop(self):
+        """Reset idle time of our pending messages so others do not reclaim running jobs"""
+        redis = get_redis()
+        while True:
+            await asyncio.sleep(settings.jobs_heartbeat_interval)
+            if not self.in_flight:
+                continue
+            try:
+                # Только сообщения, которые все еще за нами: забранные другим воркером не отбираем
+                owned = await redis.xpending_range(
+                    settings.jobs_stream, settings.jobs_group, min="-", max="+",
+                    count=10 * self.concurrency, consumername=self.consumer
+                )
+                message_ids = [entry["message_id"] for entry in owned if entry["message_id"].decode() in self.in_flight]
+                if message_ids:
+                    await redis.xclaim(
+                        settings.jobs_stream, settings.jobs_group, self.consumer,
+                        min_idle_time=0, message_ids=message_ids, justid=True
+                    )
+            except Exception as e:
+                print(f"❌ Heartbeat failed: {e}")
+
+    async def run(self):
+        print(f"👷 Worker {self.consumer} reading {settings.jobs_stream} ({settings.jobs_group}), concurrency {self.concurrency}")
+        heartbeat = asyncio.create_task(self.heartbeat_loop())
+        consumer = asyncio.create_task(self.consume_loop())
+
+        await self.stopping.wait()
+        # Чтение завершится не позже чем через jobs_block_ms, взятые сообщения будут выполнены
+        self.slot_freed.set()
+        await asyncio.gather(consumer, return_exceptions=True)
+        # Незавершенные задачи дорабатываем - иначе их заберут только через jobs_claim_idle
+        if self.in_flight:
+            await asyncio.gather(*self.in_flight.values(), return_exceptions=True)
+        heartbeat.cancel()
+        print(f"✅ Worker {self.consumer} stopped: {self.processed} jobs, {self.failed} failed, {self.reclaimed} reclaimed")
+
+
+async def main(consumer: str, concurrency: int):
+    await connect_to_mongo()
+    await connect_to_redis()
+    await llm_service.start()
+    await token_budget_service.start()
+    await fewshot_service.start()
+    try:
+        await job_service.ensure_group()
+        worker = GenerationWorker(consumer, concurrency)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, worker.stop)
+        await worker.run()
+    finally:
+        await fewshot_service.stop()
+        await token_budget_service.stop()
+        await llm_service.close()
+        await close_redis_connection()
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=settings.jobs_worker_concurrency)
+    parser.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}",
+                        help="consumer name, unique per worker process")
+    args = parser.parse_args()
+    asyncio.run(main(args.name, args.concurrency))
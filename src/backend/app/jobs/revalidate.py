@@ -0,0 +1,181 @@
+# src/backend/app/jobs/revalidate.py
+"""Re-validate stored diagrams after validator changes.
+
+Streams generation_logs and diagrams in _id order, validates code in a
+process pool and writes is_valid / validation error back with bulk_write.
+Progress is checkpointed per collection, so an interrupted run continues
+where it stopped. Documents already checked by the current
+VALIDATOR_VERSION are skipped.
+
+Run from src/backend:
+    python -m app.jobs.revalidate --collections generation_logs diagrams --batch-size 2000
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from app.core.database import connect_to_mongo, close_mongo_connection, get_database
+from app.utils.mermaid_validator import validate_mermaid_syntax, VALIDATOR_VERSION
+
+CHECKPOINT_COLLECTION = "job_checkpoints"
+
+# Поля кода и результата в каждой коллекции
+COLLECTIONS = {
+    "generation_logs": {"code": "generated_code", "error": "error_message"},
+    "diagrams": {"code": "mermaid_code", "error": "validation_error"}
+}
+
+
+def validate_chunk(items: List[Tuple[object, str, str]]) -> List[Tuple[object, bool, Optional[str]]]:
+    """Runs in a worker process: validate (id, code, diagram_type) items"""
+    results = []
+    for doc_id, code, diagram_type in items:
+        is_valid, error = validate_mermaid_syntax(code, diagram_type)
+        results.append((doc_id, is_valid, error))
+    return results
+
+
+def _split(items: list, parts: int) -> List[list]:
+    size = max(len(items) // parts + (len(items) % parts > 0), 1)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class RevalidationJob:
+    """Re-validates one collection with checkpointing"""
+
+    def __init__(self, collection: str, pool: ProcessPoolExecutor, workers: int, batch_size: int):
+        self.collection = collection
+        self.fields = COLLECTIONS[collection]
+        self.pool = pool
+        self.workers = workers
+        self.batch_size = batch_size
+        self.checkpoint_id = f"revalidate:{collection}"
+        self.processed = 0
+        self.changed = 0
+
+    async def load_checkpoint(self, restart: bool) -> Optional[object]:
+        checkpoints = get_database()[CHECKPOINT_COLLECTION]
+        if restart:
+            await checkpoints.delete_one({"_id": self.checkpoint_id})
+            return None
+
+        checkpoint = await checkpoints.find_one({"_id": self.checkpoint_id})
+        # Чекпоинт от другой версии валидатора не годится - начинаем заново
+        if not checkpoint or checkpoint.get("validator_version") != VALIDATOR_VERSION:
+            return None
+        self.processed = checkpoint.get("processed", 0)
+        self.changed = checkpoint.get("changed", 0)
+        print(f"↩️ {self.collection}: resuming after _id={checkpoint['last_id']} ({self.processed} done)")
+        return checkpoint["last_id"]
+
+    async def save_checkpoint(self, last_id: object, finished: bool = False):
+        await get_database()[CHECKPOINT_COLLECTION].update_one(
+            {"_id": self.checkpoint_id},
+            {"$set": {
+                "last_id": last_id,
+                "validator_version": VALIDATOR_VERSION,
+                "processed": self.processed,
+                "changed": self.changed,
+                "finished": finished,
+                "updated_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+
+    async def _read_batch(self, cursor) -> list:
+        batch = []
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                break
+        return batch
+
+    async def _validate(self, docs: list) -> List[Tuple[object, bool, Optional[str]]]:
+        items = [(doc["_id"], doc.get(self.fields["code"]) or "", doc.get("diagram_type") or "flowchart") for doc in docs]
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(*(
+            loop.run_in_executor(self.pool, validate_chunk, chunk) for chunk in _split(items, self.workers)
+        ))
+        return [result for chunk in chunks for result in chunk]
+
+    async def run(self, restart: bool = False):
+        db = get_database()
+        collection = db[self.collection]
+        last_id = await self.load_checkpoint(restart)
+
+        query = {
+            "validator_version": {"$ne": VALIDATOR_VERSION},
+            self.fields["code"]: {"$nin": [None, ""]}  # Неудачные генерации без кода не трогаем
+        }
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+
+        projection = {self.fields["code"]: 1, "diagram_type": 1, "is_valid": 1}
+        cursor = collection.find(query, projection).sort("_id", 1).batch_size(self.batch_size)
+
+        started = time.perf_counter()
+        processed_at_start = self.processed
+        batch = await self._read_batch(cursor)
+
+        while batch:
+            # Следующая пачка читается из Mongo, пока текущая валидируется в процессах
+            next_batch = asyncio.create_task(self._read_batch(cursor))
+            results = await self._validate(batch)
+
+            previous = {doc["_id"]: doc.get("is_valid") for doc in batch}
+            now = datetime.utcnow()
+            operations = []
+            for doc_id, is_valid, error in results:
+                if previous[doc_id] != is_valid:
+                    self.changed += 1
+                operations.append(UpdateOne({"_id": doc_id}, {"$set": {
+                    "is_valid": is_valid,
+                    self.fields["error"]: error,
+                    "validator_version": VALIDATOR_VERSION,
+                    "validated_at": now
+                }}))
+            await collection.bulk_write(operations, ordered=False)
+
+            self.processed += len(batch)
+            last_id = batch[-1]["_id"]
+            await self.save_checkpoint(last_id)
+
+            elapsed = time.perf_counter() - started
+            rate = (self.processed - processed_at_start) / elapsed if elapsed else 0
+            print(f"📦 {self.collection}: {self.processed} docs, {self.changed} changed is_valid, {rate:.0f} docs/s")
+
+            batch = await next_batch
+
+        if last_id is not None:
+            await self.save_checkpoint(last_id, finished=True)
+        elapsed = time.perf_counter() - started
+        done = self.processed - processed_at_start
+        print(f"✅ {self.collection}: {done} docs in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.0f} docs/s), "
+              f"{self.changed} changed is_valid in total")
+
+
+async def main(collections: List[str], batch_size: int, workers: int, restart: bool):
+    await connect_to_mongo()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for collection in collections:
+                job = RevalidationJob(collection, pool, workers, batch_size)
+                await job.run(restart)
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collections", nargs="+", choices=list(COLLECTIONS), default=list(COLLECTIONS))
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--restart", action="store_true", help="ignore saved checkpoints")
+    args = parser.parse_args()
+    asyncio.run(main(args.collections, args.batch_size, args.workers, args.restart))
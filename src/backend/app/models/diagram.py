@@ -9,7 +9,7 @@ class DiagramBase(BaseModel):
     mermaid_code: str
 
 class DiagramCreate(DiagramBase):
-    pass
+    allow_duplicate: bool = False  # Сохранить, даже если такая же по структуре диаграмма уже есть
 
 class DiagramUpdate(BaseModel):
     title: Optional[str] = None
@@ -20,6 +20,8 @@ class DiagramInDB(DiagramBase):
     id: str
     user_id: str
     original_prompt: Optional[str] = None
+    structural_hash: Optional[str] = None
+    thumbnail_key: Optional[str] = None
     created_at: datetime
     updated_at: datetime
 
@@ -33,5 +35,6 @@ class DiagramListItem(BaseModel):
     id: str
     title: str
     diagram_type: str
+    thumbnail_url: Optional[str] = None
     created_at: datetime
     updated_at: datetime
@@ -12,9 +12,25 @@ class GenerationLog(BaseModel):
     diagram_type: str
     model: Optional[str] = None  # ← ДОБАВИТЬ ЭТО ПОЛЕ
     generated_code: str
+    code_hash: Optional[str] = None
     is_valid: bool
+    validator_version: Optional[str] = None
     error_message: Optional[str] = None
     generation_time: float
+    time_to_first_byte: Optional[float] = None
+    cache_hit: bool = False
+    coalesced: bool = False
+    max_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    attempts: Optional[int] = None
+    truncated: bool = False
+    input_tokens: Optional[int] = None
+    retry_strategy: Optional[str] = None
+    repairs: int = 0
+    request_kind: str = "generate"
+    few_shot_examples: int = 0
+    context_mode: Optional[str] = None  # full | compressed | elided (модификации)
+    modification_mode: Optional[str] = None  # patch | full | fallback (полная после неудачного патча)
     created_at: datetime
 
 
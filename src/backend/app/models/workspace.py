@@ -22,6 +22,7 @@ class WorkspaceGeneration(BaseModel):
     prompt: str
     diagram_type: str = "flowchart"
     model: Optional[str] = None  # Добавляем поле выбора модели
+    use_cache: bool = True
 
 
 class WorkspaceModification(BaseModel):
@@ -32,3 +33,4 @@ class WorkspaceModification(BaseModel):
 class WorkspaceSave(BaseModel):
     title: str
     description: Optional[str] = None
+    allow_duplicate: bool = False
@@ -1,8 +1,11 @@
+import os
 from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.responses import FileResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import List
 from app.models.diagram import DiagramCreate, DiagramUpdate, DiagramResponse, DiagramListItem
-from app.services.diagram_service import diagram_service
+from app.services.diagram_service import diagram_service, DuplicateDiagramError
+from app.services.thumbnail_service import thumbnail_service
 from app.core.security import verify_token
 from app.core.database import get_redis, get_database
 
@@ -53,10 +56,24 @@ async def create_diagram(
     diagram_data: DiagramCreate,
     user_id: str = Depends(get_current_user_id)
 ):
-    """Create new diagram"""
+    """Create new diagram.
+    
+    If the user already has a diagram of this type with the same structure
+    (same nodes, labels and links, regardless of ids, whitespace and order),
+    nothing is saved and 409 is returned with the existing diagram's id;
+    send allow_duplicate=true to save it anyway.
+    """
     print(f"Creating diagram: {diagram_data.title} for user {user_id}")
     
-    diagram = await diagram_service.create_diagram(user_id, diagram_data)
+    try:
+        diagram = await diagram_service.create_diagram(
+            user_id, diagram_data, allow_duplicate=diagram_data.allow_duplicate
+        )
+    except DuplicateDiagramError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": str(e), "existing_id": e.existing_id, "existing_title": e.existing_title}
+        )
     
     return DiagramResponse(
         id=diagram.id,
@@ -139,6 +156,24 @@ async def delete_diagram(
     
     return {"message": "Diagram deleted successfully"}
 
+@router.get("/thumbnails/{key}.svg")
+async def get_thumbnail(key: str):
+    """Diagram preview by content key.
+    
+    No auth: the key is a hash of the diagram content and is only handed out
+    in the owner's diagram list; <img> tags cannot send the bearer token.
+    """
+    try:
+        path = thumbnail_service.store.path(key)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Thumbnail not found")
+    
+    if not os.path.exists(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Thumbnail not found")
+    
+    # Содержимое по ключу не меняется - кэшируем навсегда
+    return FileResponse(path, media_type="image/svg+xml", headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
 @router.get("/stats/summary")
 async def get_diagram_stats(
     user_id: str = Depends(get_current_user_id)
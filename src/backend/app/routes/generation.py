@@ -1,10 +1,17 @@
 # src/backend/app/routes/generation.py
-from typing import Optional
+import json
+from typing import List, Optional
 from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from app.services.generation_service import generation_service
 from app.utils.prompt_templates import get_available_diagram_types
+from app.utils.sse import format_sse
+from app.services.llm_service import llm_service
+from app.services.fewshot_service import fewshot_service
+from app.services.job_service import job_service, public_job, FINISHED
+from app.services.warmup_service import warmup_service
 from app.core.security import verify_token
 from app.core.database import get_redis, get_database
 from app.core.config import settings
@@ -18,6 +25,7 @@ class GenerationRequest(BaseModel):
     prompt: str
     diagram_type: str = "flowchart"
     model: Optional[str] = None  # Добавляем поле выбора модели
+    use_cache: bool = True
 
 
 class GenerationResponse(BaseModel):
@@ -28,6 +36,10 @@ class GenerationResponse(BaseModel):
     validation_error: Optional[str] = None
 
 
+class BatchGenerationRequest(BaseModel):
+    items: List[GenerationRequest]
+
+
 class ModificationRequest(BaseModel):
     diagram_id: str
     modification_prompt: str
@@ -72,8 +84,11 @@ async def test_llm_connection():
     
     return {
         "llm_connected": is_connected,
-        "llm_url": llm_service.base_url
+        "llm_url": llm_service.base_url,
         # Убрали поле "model" так как теперь модель выбирается для каждого запроса
+        "backends": llm_service.router.get_status(),
+        "circuit_breakers": llm_service.get_circuit_states(),
+        "warmup": warmup_service.get_status()
     }
 
 
@@ -121,7 +136,8 @@ async def generate_diagram(
         user_id=user_id,
         prompt=request.prompt,
         diagram_type=request.diagram_type,
-        model=request.model
+        model=request.model,
+        use_cache=request.use_cache
     )
     
     if not result:
@@ -139,6 +155,171 @@ async def generate_diagram(
     )
 
 
+@router.post("/stream")
+async def generate_diagram_stream(
+    request: GenerationRequest,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Generate diagram and stream code tokens as Server-Sent Events"""
+    print(f"Streaming generation request from user {user_id}: {request.diagram_type}, model: {request.model}")
+    
+    # Validate diagram type
+    if request.diagram_type not in get_available_diagram_types():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid diagram type. Available: {get_available_diagram_types()}"
+        )
+    
+    # Validate model if provided
+    if request.model and request.model not in settings.available_models:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid model. Available: {settings.available_models}"
+        )
+    
+    # Переполненную очередь отклоняем до начала потока, чтобы вернуть 429
+    llm_service.scheduler.ensure_capacity(request.model or settings.default_model)
+    
+    async def event_stream():
+        async for event in generation_service.generate_stream(
+            user_id=user_id,
+            prompt=request.prompt,
+            diagram_type=request.diagram_type,
+            model=request.model
+        ):
+            yield format_sse(event["event"], event["data"])
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/batch")
+async def generate_diagram_batch(
+    request: BatchGenerationRequest,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Generate several diagrams in one request; results stream back as NDJSON lines in completion order"""
+    print(f"Batch generation request from user {user_id}: {len(request.items)} items")
+    
+    if not request.items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Batch is empty"
+        )
+    if len(request.items) > settings.generation_batch_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many items in batch. Maximum: {settings.generation_batch_max_items}"
+        )
+    
+    # Ошибочный элемент не отменяет пакет - по нему сразу строка с ошибкой
+    rejected = []
+    items = []
+    positions = []
+    for index, item in enumerate(request.items):
+        if item.diagram_type not in get_available_diagram_types():
+            rejected.append({"index": index, "mermaid_code": None, "is_valid": False,
+                             "error": f"Invalid diagram type. Available: {get_available_diagram_types()}"})
+        elif item.model and item.model not in settings.available_models:
+            rejected.append({"index": index, "mermaid_code": None, "is_valid": False,
+                             "error": f"Invalid model. Available: {settings.available_models}"})
+        else:
+            items.append(item.model_dump())
+            positions.append(index)
+    
+    async def ndjson_stream():
+        for result in rejected:
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+        if not items:
+            return
+        async for result in generation_service.generate_batch(user_id, items):
+            result["index"] = positions[result["index"]]
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(
+        ndjson_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_generation_job(
+    request: GenerationRequest,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Queue a generation for a worker; poll the job or subscribe to its events for the result"""
+    print(f"Generation job request from user {user_id}: {request.diagram_type}, model: {request.model}")
+    
+    # Validate diagram type
+    if request.diagram_type not in get_available_diagram_types():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid diagram type. Available: {get_available_diagram_types()}"
+        )
+    
+    # Validate model if provided
+    if request.model and request.model not in settings.available_models:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid model. Available: {settings.available_models}"
+        )
+    
+    job_id = await job_service.submit("generate", user_id, request.model_dump())
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/generate/jobs/{job_id}",
+        "events_url": f"/generate/jobs/{job_id}/events"
+    }
+
+
+@router.get("/jobs/{job_id}")
+async def get_generation_job(
+    job_id: str,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Job status; the result stays available for jobs_result_ttl seconds after it finishes"""
+    job = await job_service.get(job_id, user_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return public_job(job)
+
+
+@router.get("/jobs/{job_id}/events")
+async def generation_job_events(
+    job_id: str,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Job status as Server-Sent Events: current state, then the final one when the job finishes"""
+    job = await job_service.get(job_id, user_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    async def event_stream():
+        async for state in job_service.wait(job_id, user_id, settings.jobs_events_timeout):
+            if state is None:
+                yield format_sse("error", {"detail": "Job expired"})
+                return
+            event = state["status"] if state["status"] in FINISHED else "status"
+            yield format_sse(event, public_job(state))
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.post("/modify", response_model=GenerationResponse)
 async def modify_diagram(
     request: ModificationRequest,
@@ -184,3 +365,33 @@ async def get_generation_history(
     """Get user's generation history"""
     history = await generation_service.get_user_generation_history(user_id, limit)
     return {"history": history, "count": len(history)}
+
+
+@router.get("/stats/retries")
+async def get_retry_stats(
+    days: int = 30,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Compare retry strategies (repair vs resample) per model"""
+    stats = await generation_service.get_retry_strategy_stats(days)
+    return {"models": stats, "days": days}
+
+
+@router.get("/stats/few-shot")
+async def get_few_shot_stats(
+    days: int = 30,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Retries and generation time with vs without few-shot examples per model"""
+    stats = await generation_service.get_few_shot_stats(days)
+    return {"models": stats, "days": days, "index": fewshot_service.get_status()}
+
+
+@router.get("/stats/modifications")
+async def get_modification_stats(
+    days: int = 30,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Output tokens and time per modification: edit operations vs full regeneration per model"""
+    stats = await generation_service.get_modification_stats(days)
+    return {"models": stats, "days": days, "mode": settings.modification_mode}
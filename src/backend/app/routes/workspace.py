@@ -1,6 +1,7 @@
 # src\backend\app\routes\workspace.py
 
 from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional
 from app.models.workspace import (
@@ -8,7 +9,11 @@ from app.models.workspace import (
     WorkspaceModification, WorkspaceSave
 )
 from app.services.workspace_service import workspace_service
+from app.services.diagram_service import DuplicateDiagramError
 from app.utils.prompt_templates import get_available_diagram_types
+from app.utils.sse import format_sse
+from app.services.llm_service import llm_service
+from app.services.job_service import job_service, public_job, FINISHED
 from app.core.security import verify_token
 from app.core.database import get_redis, get_database
 from app.core.config import settings
@@ -118,7 +123,8 @@ async def generate_in_workspace(
             diagram_id=diagram_id if diagram_id != "new" else None,
             prompt=generation_data.prompt,
             diagram_type=generation_data.diagram_type,
-            model=generation_data.model  # Передаем выбранную модель
+            model=generation_data.model,  # Передаем выбранную модель
+            use_cache=generation_data.use_cache
         )
         return WorkspaceResponse(**workspace)
     except ValueError as e:
@@ -127,6 +133,133 @@ async def generate_in_workspace(
             detail=str(e)
         )
 
+@router.post("/{diagram_id}/generate/stream")
+async def generate_in_workspace_stream(
+    diagram_id: str,
+    generation_data: WorkspaceGeneration,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Generate diagram in workspace and stream code tokens as Server-Sent Events"""
+    print(f"Streaming generation in workspace {diagram_id} for user {user_id}, model: {generation_data.model}")
+    
+    # Validate diagram type
+    if generation_data.diagram_type not in get_available_diagram_types():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid diagram type. Available: {get_available_diagram_types()}"
+        )
+    
+    # Validate model if provided
+    if generation_data.model and generation_data.model not in settings.available_models:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid model. Available: {settings.available_models}"
+        )
+    
+    # Переполненную очередь отклоняем до начала потока, чтобы вернуть 429
+    llm_service.scheduler.ensure_capacity(generation_data.model or settings.default_model)
+    
+    async def event_stream():
+        async for event in workspace_service.generate_in_workspace_stream(
+            user_id=user_id,
+            diagram_id=diagram_id if diagram_id != "new" else None,
+            prompt=generation_data.prompt,
+            diagram_type=generation_data.diagram_type,
+            model=generation_data.model
+        ):
+            yield format_sse(event["event"], event["data"])
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/{diagram_id}/generate/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_workspace_generation_job(
+    diagram_id: str,
+    generation_data: WorkspaceGeneration,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Queue a workspace generation; the result is applied to the workspace as soon as the job finishes"""
+    print(f"Workspace generation job in {diagram_id} for user {user_id}, model: {generation_data.model}")
+    
+    # Validate diagram type
+    if generation_data.diagram_type not in get_available_diagram_types():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid diagram type. Available: {get_available_diagram_types()}"
+        )
+    
+    # Validate model if provided
+    if generation_data.model and generation_data.model not in settings.available_models:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid model. Available: {settings.available_models}"
+        )
+    
+    payload = generation_data.model_dump()
+    payload["diagram_id"] = diagram_id if diagram_id != "new" else None
+    payload["workspace"] = True
+    job_id = await job_service.submit("generate", user_id, payload)
+    # Рабочие области в памяти этого процесса - он и переносит результат
+    workspace_service.track_job(job_id, user_id)
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/workspace/jobs/{job_id}",
+        "events_url": f"/workspace/jobs/{job_id}/events"
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_workspace_generation_job(
+    job_id: str,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Workspace generation job status; once done, includes the updated workspace"""
+    job = await job_service.get(job_id, user_id)
+    if not job or not job["payload"].get("workspace"):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    response = public_job(job)
+    workspace = await workspace_service.apply_job_result(job)
+    if workspace:
+        response["workspace"] = workspace
+    return response
+
+@router.get("/jobs/{job_id}/events")
+async def workspace_generation_job_events(
+    job_id: str,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Workspace job status as Server-Sent Events; the final event includes the updated workspace"""
+    job = await job_service.get(job_id, user_id)
+    if not job or not job["payload"].get("workspace"):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    async def event_stream():
+        async for state in job_service.wait(job_id, user_id, settings.jobs_events_timeout):
+            if state is None:
+                yield format_sse("error", {"detail": "Job expired"})
+                return
+            data = public_job(state)
+            workspace = await workspace_service.apply_job_result(state)
+            if workspace:
+                data["workspace"] = workspace
+            yield format_sse(state["status"] if state["status"] in FINISHED else "status", data)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/generate", response_model=WorkspaceResponse)
 async def generate_in_new_workspace(
     generation_data: WorkspaceGeneration,
@@ -155,7 +288,8 @@ async def generate_in_new_workspace(
             diagram_id=None,
             prompt=generation_data.prompt,
             diagram_type=generation_data.diagram_type,
-            model=generation_data.model  # Передаем выбранную модель
+            model=generation_data.model,  # Передаем выбранную модель
+            use_cache=generation_data.use_cache
         )
         return WorkspaceResponse(**workspace)
     except ValueError as e:
@@ -208,9 +342,16 @@ async def save_workspace(
             user_id=user_id,
             diagram_id=diagram_id if diagram_id != "new" else None,
             title=save_data.title,
-            description=save_data.description
+            description=save_data.description,
+            allow_duplicate=save_data.allow_duplicate
         )
         return {"message": "Workspace saved", "diagram_id": saved_id}
+    except DuplicateDiagramError as e:
+        # Такая же по структуре диаграмма уже есть - решает клиент (allow_duplicate=true сохранит копию)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": str(e), "existing_id": e.existing_id, "existing_title": e.existing_title}
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -230,9 +371,16 @@ async def save_new_workspace(
             user_id=user_id,
             diagram_id=None,
             title=save_data.title,
-            description=save_data.description
+            description=save_data.description,
+            allow_duplicate=save_data.allow_duplicate
         )
         return {"message": "Workspace saved", "diagram_id": saved_id}
+    except DuplicateDiagramError as e:
+        # Такая же по структуре диаграмма уже есть - решает клиент (allow_duplicate=true сохранит копию)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": str(e), "existing_id": e.existing_id, "existing_title": e.existing_title}
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
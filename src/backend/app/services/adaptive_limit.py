@@ -0,0 +1,65 @@
+# src/backend/app/services/adaptive_limit.py
+import time
+from app.core.config import settings
+
+
+class AdaptiveLimit:
+    """AIMD concurrency limit for one (backend, model) pair.
+    
+    Every successful call whose latency stays within latency_tolerance of
+    the observed no-load latency grows the limit by 1/limit (about +1 per
+    round of calls). An error, or latency above the tolerance, multiplies
+    the limit by decrease_factor - at most once per no-load latency, so a
+    burst of slow calls already in flight counts as one congestion signal.
+    """
+    
+    def __init__(self, initial: float, floor: int, ceiling: int):
+        self.floor = floor
+        self.ceiling = max(ceiling, floor)
+        self.limit = float(min(max(initial, self.floor), self.ceiling))
+        self.decrease_factor = settings.llm_adaptive_decrease_factor
+        self.latency_tolerance = settings.llm_adaptive_latency_tolerance
+        self.no_load_latency = None
+        self.last_decrease = 0.0
+        self.samples = 0
+        self.errors = 0
+    
+    @property
+    def current(self) -> int:
+        return int(self.limit)
+    
+    def on_sample(self, latency: float, error: bool = False):
+        """Feed the outcome of one completed call"""
+        self.samples += 1
+        
+        if not error:
+            if self.no_load_latency is None or latency < self.no_load_latency:
+                self.no_load_latency = latency
+            else:
+                # Медленно подтягиваем базу вверх: модель могла смениться или прогреться хуже
+                self.no_load_latency += (latency - self.no_load_latency) * 0.01
+        else:
+            self.errors += 1
+        
+        congested = error or (
+            self.no_load_latency is not None
+            and latency > self.no_load_latency * self.latency_tolerance
+        )
+        
+        now = time.monotonic()
+        if congested:
+            cooldown = self.no_load_latency or latency
+            if now - self.last_decrease >= cooldown:
+                self.limit = max(float(self.floor), self.limit * self.decrease_factor)
+                self.last_decrease = now
+        else:
+            self.limit = min(float(self.ceiling), self.limit + 1.0 / self.limit)
+    
+    def get_status(self) -> dict:
+        return {
+            "limit": self.current,
+            "raw_limit": round(self.limit, 2),
+            "no_load_latency": round(self.no_load_latency, 3) if self.no_load_latency is not None else None,
+            "samples": self.samples,
+            "errors": self.errors
+        }
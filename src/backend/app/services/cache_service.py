@@ -0,0 +1,97 @@
+# src/backend/app/services/cache_service.py
+import hashlib
+import time
+from typing import Optional
+from app.core.config import settings
+from app.core.database import get_redis
+from app.utils.prompt_templates import PROMPT_TEMPLATE_VERSION
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace and case so trivially different prompts share a key"""
+    return " ".join(prompt.lower().split())
+
+
+def make_generation_key(model: str, diagram_type: str, prompt: str) -> str:
+    """Hash of model, diagram type, template version and normalized prompt"""
+    raw = "\x1f".join([model, diagram_type, PROMPT_TEMPLATE_VERSION, normalize_prompt(prompt)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def make_modification_key(model: str, diagram_type: str, source_hash: str, modification_prompt: str) -> str:
+    """Key of a modification: structural hash of the source diagram instead of its raw code.
+
+    Diagrams differing only in formatting, node ids or statement order share
+    the cached modification result.
+    """
+    raw = "\x1f".join([
+        "modify", model, diagram_type, PROMPT_TEMPLATE_VERSION, source_hash, normalize_prompt(modification_prompt)
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """Redis cache of validated generation results.
+    
+    Entries live under gencache:<hash> with a TTL; the sorted set
+    gencache:index keeps last access time per entry and is used to evict
+    the least recently used entries once the size cap is exceeded.
+    """
+    
+    KEY_PREFIX = "gencache:"
+    INDEX_KEY = "gencache:index"
+    
+    def __init__(self):
+        self.enabled = settings.generation_cache_enabled
+        self.ttl = settings.generation_cache_ttl
+        self.max_entries = settings.generation_cache_max_entries
+    
+    async def get(self, key: str) -> Optional[str]:
+        """Get cached code and refresh its position in the LRU index"""
+        if not self.enabled:
+            return None
+        
+        try:
+            redis = get_redis()
+            cached = await redis.get(self.KEY_PREFIX + key)
+            if cached is None:
+                return None
+            
+            await redis.zadd(self.INDEX_KEY, {key: time.time()})
+            print(f"Generation cache hit: {key[:12]}")
+            return cached.decode() if isinstance(cached, bytes) else cached
+        except Exception as e:
+            print(f"Generation cache read failed: {e}")
+            return None
+    
+    async def set(self, key: str, code: str):
+        """Store validated code and evict old entries above the size cap"""
+        if not self.enabled:
+            return
+        
+        try:
+            redis = get_redis()
+            now = time.time()
+            
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.set(self.KEY_PREFIX + key, code, ex=self.ttl)
+                pipe.zadd(self.INDEX_KEY, {key: now})
+                # Записи с истекшим TTL убираем из индекса
+                pipe.zremrangebyscore(self.INDEX_KEY, 0, now - self.ttl)
+                pipe.zcard(self.INDEX_KEY)
+                results = await pipe.execute()
+            
+            overflow = results[-1] - self.max_entries
+            if overflow > 0:
+                evicted = await redis.zpopmin(self.INDEX_KEY, overflow)
+                if evicted:
+                    await redis.delete(*[
+                        self.KEY_PREFIX + (member.decode() if isinstance(member, bytes) else member)
+                        for member, _ in evicted
+                    ])
+                    print(f"Generation cache evicted {len(evicted)} entries")
+        except Exception as e:
+            print(f"Generation cache write failed: {e}")
+
+
+generation_cache = GenerationCache()
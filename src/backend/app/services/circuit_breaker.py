@@ -0,0 +1,121 @@
+# src/backend/app/services/circuit_breaker.py
+import time
+from collections import deque
+from typing import Deque, Tuple
+from app.core.config import settings
+
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """All backends for a model have an open circuit; retry_after is in seconds"""
+    
+    def __init__(self, model: str, retry_after: int):
+        super().__init__(f"LLM backend unavailable for {model}: circuit open, retry in {retry_after}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker for one (backend, model) pair.
+    
+    Closed: calls pass, outcomes within the last window_seconds are kept.
+    Once at least min_requests were seen and the failure rate reaches the
+    threshold the breaker opens and rejects calls for cooldown seconds.
+    After that it is half-open: a few trial calls go through, one failure
+    opens it again, all trials succeeding close it.
+    """
+    
+    def __init__(self):
+        self.failure_rate_threshold = settings.llm_breaker_failure_rate
+        self.min_requests = settings.llm_breaker_min_requests
+        self.window_seconds = settings.llm_breaker_window
+        self.cooldown = settings.llm_breaker_cooldown
+        self.half_open_max_calls = settings.llm_breaker_half_open_calls
+        
+        self._state = STATE_CLOSED
+        self.opened_at = 0.0
+        self.outcomes: Deque[Tuple[float, bool]] = deque()
+        self.trial_calls = 0
+        self.trial_successes = 0
+        self.times_opened = 0
+    
+    @property
+    def state(self) -> str:
+        if self._state == STATE_OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self._state = STATE_HALF_OPEN
+            self.trial_calls = 0
+            self.trial_successes = 0
+        return self._state
+    
+    def retry_after(self) -> int:
+        if self.state != STATE_OPEN:
+            return 0
+        return max(int(self.cooldown - (time.monotonic() - self.opened_at)) + 1, 1)
+    
+    def is_available(self) -> bool:
+        """Would a call be let through right now (does not reserve a trial)"""
+        state = self.state
+        if state == STATE_CLOSED:
+            return True
+        if state == STATE_HALF_OPEN:
+            return self.trial_calls < self.half_open_max_calls
+        return False
+    
+    def on_call_start(self):
+        """Reserve a trial slot when half-open"""
+        if self.state == STATE_HALF_OPEN:
+            self.trial_calls += 1
+    
+    def on_call_cancelled(self):
+        """Give back the trial slot of a call that never produced an outcome"""
+        if self._state == STATE_HALF_OPEN and self.trial_calls > 0:
+            self.trial_calls -= 1
+    
+    def _trim(self, now: float):
+        while self.outcomes and now - self.outcomes[0][0] > self.window_seconds:
+            self.outcomes.popleft()
+    
+    def _open(self, now: float):
+        self._state = STATE_OPEN
+        self.opened_at = now
+        self.outcomes.clear()
+        self.times_opened += 1
+    
+    def record(self, success: bool):
+        now = time.monotonic()
+        state = self.state
+        
+        if state == STATE_HALF_OPEN:
+            if not success:
+                self._open(now)
+                return
+            self.trial_successes += 1
+            if self.trial_successes >= self.half_open_max_calls:
+                self._state = STATE_CLOSED
+                self.outcomes.clear()
+            return
+        
+        if state == STATE_OPEN:
+            return  # Запоздавший ответ запроса, начатого до открытия
+        
+        self.outcomes.append((now, success))
+        self._trim(now)
+        
+        failures = sum(1 for _, ok in self.outcomes if not ok)
+        if len(self.outcomes) >= self.min_requests and failures / len(self.outcomes) >= self.failure_rate_threshold:
+            self._open(now)
+    
+    def get_status(self) -> dict:
+        self._trim(time.monotonic())
+        failures = sum(1 for _, ok in self.outcomes if not ok)
+        return {
+            "state": self.state,
+            "failure_rate": round(failures / len(self.outcomes), 2) if self.outcomes else 0.0,
+            "window_requests": len(self.outcomes),
+            "retry_after": self.retry_after(),
+            "times_opened": self.times_opened
+        }
@@ -0,0 +1,169 @@
+# src/backend/app/services/context_budget.py
+import math
+from typing import Callable, Dict, List, NamedTuple, Optional
+from app.core.config import settings
+from app.services.token_budget_service import token_budget_service
+from app.utils.prompt_templates import SYSTEM_MESSAGE
+from app.utils.mermaid_context import minify_mermaid, elide_styling
+
+# Служебные токены chat-шаблона на сообщение (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 8
+
+
+class ContextBudgetError(Exception):
+    """Request does not fit into the model's context window"""
+
+    def __init__(self, model: str, needed: int, available: int):
+        super().__init__(
+            f"Diagram is too large for {model}: about {needed} tokens needed "
+            f"(prompt and output), context window allows {available}. "
+            f"Use a model with a larger context or split the diagram."
+        )
+        self.model = model
+        self.needed = needed
+        self.available = available
+
+
+class TokenEstimator:
+    """Token count per model without running the tokenizer.
+
+    Uses configured characters per token for ASCII and for other text
+    (Cyrillic costs noticeably more tokens), corrected by the ratio of
+    prompt_tokens reported by the backend to the estimate.
+    """
+
+    # Сглаживание поправки и ее допустимые пределы
+    ALPHA = 0.1
+    MIN_CORRECTION = 0.5
+    MAX_CORRECTION = 2.0
+
+    def __init__(self):
+        self.corrections: Dict[str, float] = {}
+        self.samples: Dict[str, int] = {}
+
+    def _raw(self, text: str, model: str) -> float:
+        if not text:
+            return 0.0
+        ascii_ratio, other_ratio = settings.llm_chars_per_token_by_model.get(
+            model, (settings.llm_chars_per_token, settings.llm_non_ascii_chars_per_token)
+        )
+        ascii_chars = len(text.encode("ascii", "ignore"))
+        return ascii_chars / ascii_ratio + (len(text) - ascii_chars) / other_ratio
+
+    def estimate(self, text: str, model: str) -> int:
+        if not text:
+            return 0
+        return max(math.ceil(self._raw(text, model) * self.corrections.get(model, 1.0)), 1)
+
+    def observe(self, model: str, text: str, actual_tokens: Optional[int]):
+        """Calibrate with the prompt size reported by the backend"""
+        raw = self._raw(text, model)
+        if not actual_tokens or raw < 20:
+            return
+        ratio = min(max(actual_tokens / raw, self.MIN_CORRECTION), self.MAX_CORRECTION)
+        current = self.corrections.get(model)
+        self.corrections[model] = ratio if current is None else current + self.ALPHA * (ratio - current)
+        self.samples[model] = self.samples.get(model, 0) + 1
+
+    def get_status(self) -> dict:
+        return {
+            model: {"correction": round(correction, 3), "samples": self.samples.get(model, 0)}
+            for model, correction in sorted(self.corrections.items())
+        }
+
+
+class ContextPlan(NamedTuple):
+    code: str  # Код диаграммы для промпта
+    mode: str  # full | compressed | elided
+    elided: List[str]  # Убранные из промпта операторы оформления - вернуть после генерации
+    input_tokens: int
+    max_tokens: int
+    context_window: int
+
+
+class ContextBudgetManager:
+    """Splits a model's context window between prompt, diagram and output.
+
+    A modification returns the whole diagram, so the code has to fit twice:
+    in the prompt and in the output. Variants are tried from the most
+    faithful to the smallest (as is, minified, minified without styling);
+    the first that leaves enough output room wins, otherwise the request is
+    rejected before it is queued.
+    """
+
+    def __init__(self, estimator: TokenEstimator):
+        self.estimator = estimator
+        self.plans: Dict[str, int] = {"full": 0, "compressed": 0, "elided": 0, "rejected": 0}
+
+    def context_window(self, model: str) -> int:
+        return settings.llm_context_windows.get(model, settings.llm_default_context_window)
+
+    def usable_tokens(self, model: str) -> int:
+        return int(self.context_window(model) * (1 - settings.llm_context_safety_margin))
+
+    def prompt_tokens(self, prompt: str, model: str, system: str = SYSTEM_MESSAGE) -> int:
+        """Tokens of a chat request: system message, prompt and chat markup"""
+        return (self.estimator.estimate(system, model) + self.estimator.estimate(prompt, model)
+                + 2 * MESSAGE_OVERHEAD_TOKENS)
+
+    def _variants(self, code: str, diagram_type: str):
+        yield "full", code, []
+        minified = minify_mermaid(code)
+        if minified != code:
+            yield "compressed", minified, []
+        elided_code, elided = elide_styling(minified, diagram_type)
+        if elided:
+            yield "elided", elided_code, elided
+
+    def plan_modification(
+        self,
+        model: str,
+        diagram_type: str,
+        code: str,
+        build_prompt: Callable[[str], str],
+        output_tokens: Optional[int] = None,
+        system: str = SYSTEM_MESSAGE
+    ) -> ContextPlan:
+        """Pick the diagram form and max_tokens for a modification; raises ContextBudgetError.
+
+        output_tokens fixes the answer size (edit operations); by default
+        the answer is the whole modified diagram.
+        """
+        usable = self.usable_tokens(model)
+        needed = 0
+
+        for mode, candidate, elided in self._variants(code, diagram_type):
+            input_tokens = self.prompt_tokens(build_prompt(candidate), model, system)
+            if output_tokens is not None:
+                output_needed = output_tokens
+            else:
+                # Ответ - вся диаграмма целиком плюс запас на добавленное
+                output_needed = math.ceil(
+                    self.estimator.estimate(candidate, model) * settings.modification_output_growth
+                ) + settings.modification_output_extra
+            needed = input_tokens + output_needed
+            if needed > usable or output_needed > settings.llm_max_tokens_ceiling:
+                continue
+
+            budget = output_needed if output_tokens is not None else max(
+                output_needed, token_budget_service.get_budget(model, diagram_type)
+            )
+            max_tokens = min(budget, usable - input_tokens, settings.llm_max_tokens_ceiling)
+            self.plans[mode] += 1
+            if mode != "full":
+                print(f"📐 Modification context for {model}: {mode}, {input_tokens} prompt tokens, max_tokens={max_tokens}")
+            return ContextPlan(candidate, mode, elided, input_tokens, max_tokens, self.context_window(model))
+
+        self.plans["rejected"] += 1
+        raise ContextBudgetError(model, needed, usable)
+
+    def get_status(self) -> dict:
+        return {
+            "context_windows": {model: self.context_window(model) for model in settings.available_models},
+            "plans": dict(self.plans),
+            "estimator": self.estimator.get_status()
+        }
+
+
+token_estimator = TokenEstimator()
+context_budget_manager = ContextBudgetManager(token_estimator)
@@ -2,13 +2,55 @@ from datetime import datetime
 from typing import List, Optional
 from bson import ObjectId
 from app.core.database import get_database
+from app.core.config import settings
 from app.models.diagram import DiagramCreate, DiagramUpdate, DiagramInDB, DiagramListItem
+from app.services.thumbnail_service import thumbnail_service, thumbnail_url
+from app.utils.mermaid_canonical import structural_hash
+from app.utils.mermaid_validator import validate_mermaid_syntax, VALIDATOR_VERSION
+
+class DuplicateDiagramError(Exception):
+    """The user already has a diagram with the same structure"""
+    
+    def __init__(self, existing_id: str, existing_title: str):
+        super().__init__(f"Diagram with the same structure already exists: {existing_title}")
+        self.existing_id = existing_id
+        self.existing_title = existing_title
+
+
+def _validation_fields(mermaid_code: str, diagram_type: str) -> dict:
+    """Validity stamp written with every code change; jobs/revalidate skips stamped diagrams"""
+    is_valid, error = validate_mermaid_syntax(mermaid_code, diagram_type)
+    return {"is_valid": is_valid, "validation_error": error, "validator_version": VALIDATOR_VERSION}
+
 
 class DiagramService:
     
-    async def create_diagram(self, user_id: str, diagram_data: DiagramCreate, original_prompt: Optional[str] = None) -> DiagramInDB:
-        """Create new diagram"""
+    async def create_diagram(
+        self,
+        user_id: str,
+        diagram_data: DiagramCreate,
+        original_prompt: Optional[str] = None,
+        allow_duplicate: bool = False
+    ) -> DiagramInDB:
+        """Create new diagram.
+        
+        Raises DuplicateDiagramError if the same user already has a diagram
+        of this type with the same structural hash, unless allow_duplicate
+        is set; the caller decides whether to open the existing one or save
+        anyway.
+        """
         db = get_database()
+        code_hash = structural_hash(diagram_data.mermaid_code)
+        
+        if settings.diagram_dedupe_enabled and not allow_duplicate:
+            existing = await db.diagrams.find_one({
+                "user_id": user_id,
+                "diagram_type": diagram_data.diagram_type,
+                "structural_hash": code_hash
+            }, {"title": 1})
+            if existing:
+                print(f"Duplicate diagram for user {user_id}: {existing['_id']}")
+                raise DuplicateDiagramError(str(existing["_id"]), existing["title"])
         
         diagram_dict = {
             "user_id": user_id,
@@ -16,6 +58,8 @@ class DiagramService:
             "description": diagram_data.description,
             "diagram_type": diagram_data.diagram_type,
             "mermaid_code": diagram_data.mermaid_code,
+            "structural_hash": code_hash,
+            **_validation_fields(diagram_data.mermaid_code, diagram_data.diagram_type),
             "original_prompt": original_prompt,
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
@@ -23,6 +67,7 @@ class DiagramService:
         
         result = await db.diagrams.insert_one(diagram_dict)
         diagram_dict["id"] = str(result.inserted_id)
+        thumbnail_service.enqueue(diagram_dict["id"], diagram_data.mermaid_code, diagram_data.diagram_type)
         
         print(f"Diagram created: {diagram_data.title} for user {user_id}")
         return DiagramInDB(**diagram_dict)
@@ -31,7 +76,9 @@ class DiagramService:
         """Get user's diagrams list"""
         db = get_database()
         
-        cursor = db.diagrams.find({"user_id": user_id}) \
+        # Список не тянет код диаграмм - вместо него превью
+        projection = {"title": 1, "diagram_type": 1, "thumbnail_key": 1, "created_at": 1, "updated_at": 1}
+        cursor = db.diagrams.find({"user_id": user_id}, projection) \
                     .sort("updated_at", -1) \
                     .limit(limit)
         
@@ -41,6 +88,7 @@ class DiagramService:
                 id=str(diagram["_id"]),
                 title=diagram["title"],
                 diagram_type=diagram["diagram_type"],
+                thumbnail_url=thumbnail_url(diagram.get("thumbnail_key")),
                 created_at=diagram["created_at"],
                 updated_at=diagram["updated_at"]
             )
@@ -84,7 +132,14 @@ class DiagramService:
         if update_data.description is not None:
             update_dict["description"] = update_data.description
         if update_data.mermaid_code is not None:
+            # Тип нужен для проверки кода - берем его из сохраненной диаграммы
+            current = await db.diagrams.find_one({"_id": object_id, "user_id": user_id}, {"diagram_type": 1})
+            if not current:
+                print(f"Diagram not found for update: {diagram_id}")
+                return None
             update_dict["mermaid_code"] = update_data.mermaid_code
+            update_dict["structural_hash"] = structural_hash(update_data.mermaid_code)
+            update_dict.update(_validation_fields(update_data.mermaid_code, current["diagram_type"]))
         
         result = await db.diagrams.update_one(
             {"_id": object_id, "user_id": user_id},
@@ -98,6 +153,8 @@ class DiagramService:
         # Return updated diagram
         updated_diagram = await db.diagrams.find_one({"_id": object_id})
         updated_diagram["id"] = str(updated_diagram["_id"])
+        if update_data.mermaid_code is not None:
+            thumbnail_service.enqueue(updated_diagram["id"], update_data.mermaid_code, updated_diagram["diagram_type"])
         
         print(f"Diagram updated: {diagram_id}")
         return DiagramInDB(**updated_diagram)
@@ -0,0 +1,285 @@
+# src/backend/app/services/fewshot_service.py
+import asyncio
+import heapq
+import math
+import re
+import time
+from collections import Counter, defaultdict, deque
+from itertools import islice
+from operator import itemgetter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from app.core.config import settings
+from app.core.database import get_database
+from app.services.llm_service import estimate_tokens
+from app.utils.mermaid_canonical import structural_hash
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# Грубый стемминг: первые 5 символов слова (срезает большинство русских окончаний)
+STEM_LENGTH = 5
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "for", "to", "in", "on", "with", "by", "from", "is", "are",
+    "create", "make", "show", "draw", "diagram", "chart", "please",
+    "и", "или", "в", "во", "на", "с", "со", "по", "для", "из", "от", "до", "как", "что",
+    "создай", "создать", "построй", "нарисуй", "покажи", "диаграмма", "диаграмму", "схему", "схема"
+}
+
+# Запросы на модификацию в старых логах без request_kind
+MODIFICATION_PROMPT = r'^\s*Current diagram code:'
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        token[:STEM_LENGTH] for token in TOKEN_PATTERN.findall(text.lower())
+        if len(token) > 1 and token not in STOPWORDS and not token.isdigit()
+    ]
+
+
+class FewShotExample(NamedTuple):
+    prompt: str
+    code: str
+    tokens: int
+
+
+class BM25Index:
+    """Okapi BM25 over example prompts of one diagram type.
+
+    Documents are added one by one; above max_docs the oldest is dropped,
+    so the index follows recent generations. Postings store the
+    precomputed BM25 term weight. Lookups scan postings of rare query terms
+    first, newest documents first, and stop after SCAN_BUDGET entries even
+    inside one long posting; common terms then only rescore the best
+    CANDIDATES documents so far. The work per lookup is bounded no matter
+    how many documents the index holds, which keeps it under a millisecond.
+    """
+
+    SCAN_BUDGET = 800
+    CANDIDATES = 30
+    # Веса пересчитываются, когда средняя длина документа уходит дальше чем на 25%
+    AVG_DRIFT = 0.25
+
+    def __init__(self, max_docs: int, k1: float = 1.2, b: float = 0.75):
+        self.max_docs = max_docs
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self.docs: Dict[int, Tuple[FewShotExample, Counter, str]] = {}
+        self.total_length = 0
+        self.order: deque = deque()
+        self.next_id = 0
+        self._weight_avg = None
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def _weight(self, tf: int, length: int) -> float:
+        return tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / self._weight_avg))
+
+    def _reweight(self):
+        self._weight_avg = self.total_length / len(self.docs) if self.docs else 1.0
+        self._weight_avg = self._weight_avg or 1.0
+        for doc_id, (_, counts, _) in self.docs.items():
+            length = sum(counts.values())
+            for term, tf in counts.items():
+                self.postings[term][doc_id] = self._weight(tf, length)
+
+    def add(self, example: FewShotExample, terms: List[str], code_hash: str) -> Optional[str]:
+        """Add a document; returns code_hash of the evicted one, if any"""
+        counts = Counter(terms)
+        doc_id = self.next_id
+        self.next_id += 1
+        self.docs[doc_id] = (example, counts, code_hash)
+        self.total_length += len(terms)
+        self.order.append(doc_id)
+
+        evicted = self._remove(self.order.popleft()) if len(self.docs) > self.max_docs else None
+
+        avg = self.total_length / len(self.docs)
+        if self._weight_avg is None or abs(avg - self._weight_avg) > self.AVG_DRIFT * self._weight_avg:
+            self._reweight()  # Включает и новый документ
+        else:
+            for term, tf in counts.items():
+                self.postings[term][doc_id] = self._weight(tf, len(terms))
+        return evicted
+
+    def _remove(self, doc_id: int) -> str:
+        _, counts, code_hash = self.docs.pop(doc_id)
+        for term in counts:
+            posting = self.postings[term]
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[term]
+        self.total_length -= sum(counts.values())
+        return code_hash
+
+    def search(self, terms: List[str], limit: int) -> List[Tuple[float, FewShotExample]]:
+        if not self.docs or not terms:
+            return []
+        count = len(self.docs)
+        postings = [self.postings[term] for term in set(terms) if term in self.postings]
+        postings.sort(key=len)  # Редкие термины (высокий idf) первыми
+
+        scores: Dict[int, float] = {}
+        scanned = 0
+        pruned = False
+        for posting in postings:
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            if scanned < self.SCAN_BUDGET:
+                # Кандидаты - из редких терминов; в длинном списке сначала новые документы
+                entries = islice(reversed(posting.items()), self.SCAN_BUDGET - scanned)
+                if not scores:
+                    scores = {doc_id: idf * weight for doc_id, weight in entries}
+                else:
+                    get = scores.get
+                    for doc_id, weight in entries:
+                        scores[doc_id] = get(doc_id, 0.0) + idf * weight
+                scanned += min(len(posting), self.SCAN_BUDGET - scanned)
+            else:
+                if not pruned:
+                    if len(scores) > self.CANDIDATES:
+                        scores = dict(heapq.nlargest(self.CANDIDATES, scores.items(), key=itemgetter(1)))
+                    pruned = True
+                for doc_id in scores:
+                    weight = posting.get(doc_id)
+                    if weight:
+                        scores[doc_id] += idf * weight
+
+        best = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+        return [(score, self.docs[doc_id][0]) for doc_id, score in best]
+
+
+class FewShotService:
+    """Picks similar past valid generations as few-shot examples.
+
+    One BM25 index per diagram type over prompts of valid generation_logs
+    (modifications excluded). New valid generations are added right after
+    they are logged; a periodic refresh picks up logs written by other
+    processes. Identical diagrams (same structural hash) are indexed once.
+    """
+
+    def __init__(self):
+        self.indexes: Dict[str, BM25Index] = {}
+        self.code_hashes: Dict[str, set] = defaultdict(set)
+        self.last_id = None
+        self._task: Optional[asyncio.Task] = None
+        self.lookups = 0
+        self.lookups_with_examples = 0
+        self.lookup_time = 0.0
+
+    def _index(self, diagram_type: str) -> BM25Index:
+        index = self.indexes.get(diagram_type)
+        if index is None:
+            index = self.indexes[diagram_type] = BM25Index(settings.fewshot_max_docs_per_type)
+        return index
+
+    def add(self, prompt: str, code: str, diagram_type: str, code_hash: Optional[str] = None) -> bool:
+        """Index a valid generation; long examples and duplicates are skipped"""
+        if not prompt or not code:
+            return False
+        tokens = estimate_tokens(prompt) + estimate_tokens(code)
+        if tokens > settings.fewshot_max_example_tokens:
+            return False
+        terms = tokenize(prompt)
+        if not terms:
+            return False
+
+        code_hash = code_hash or structural_hash(code, diagram_type)
+        seen = self.code_hashes[diagram_type]
+        if code_hash in seen:
+            return False
+        seen.add(code_hash)
+
+        evicted = self._index(diagram_type).add(FewShotExample(prompt.strip(), code.strip(), tokens), terms, code_hash)
+        if evicted is not None:
+            seen.discard(evicted)
+        return True
+
+    def select(self, prompt: str, diagram_type: str) -> List[FewShotExample]:
+        """Most similar examples that fit into the few-shot token budget"""
+        if not settings.fewshot_enabled:
+            return []
+        started = time.perf_counter()
+        index = self.indexes.get(diagram_type)
+        candidates = index.search(tokenize(prompt), settings.fewshot_max_examples * 4) if index else []
+
+        examples = []
+        budget = settings.fewshot_token_budget
+        for score, example in candidates:
+            if score < settings.fewshot_min_score or len(examples) >= settings.fewshot_max_examples:
+                break
+            if example.tokens <= budget:
+                examples.append(example)
+                budget -= example.tokens
+
+        self.lookups += 1
+        self.lookups_with_examples += bool(examples)
+        self.lookup_time += time.perf_counter() - started
+        return examples
+
+    async def refresh(self, limit: Optional[int] = None):
+        """Index valid logs newer than the last seen one"""
+        db = get_database()
+        query = {
+            "is_valid": True,
+            "generated_code": {"$nin": [None, ""]},
+            "request_kind": {"$ne": "modify"},
+            "prompt": {"$not": re.compile(MODIFICATION_PROMPT)}
+        }
+        projection = {"prompt": 1, "generated_code": 1, "diagram_type": 1, "code_hash": 1}
+
+        if self.last_id is None:
+            # Первая загрузка - последние логи, затем по порядку
+            cursor = db.generation_logs.find(query, projection).sort("_id", -1).limit(limit or settings.fewshot_initial_load)
+            logs = [log async for log in cursor]
+            logs.reverse()
+        else:
+            query["_id"] = {"$gt": self.last_id}
+            logs = [log async for log in db.generation_logs.find(query, projection).sort("_id", 1)]
+
+        added = 0
+        for log in logs:
+            added += self.add(log["prompt"], log["generated_code"], log["diagram_type"], log.get("code_hash"))
+            self.last_id = log["_id"]
+        if logs:
+            print(f"Few-shot index: {added} examples added from {len(logs)} logs")
+
+    async def start(self):
+        if not settings.fewshot_enabled:
+            return
+        try:
+            await self.refresh()
+        except Exception as e:
+            print(f"Few-shot index load failed: {e}")
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(settings.fewshot_refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Few-shot index refresh failed: {e}")
+
+    def get_status(self) -> dict:
+        return {
+            "enabled": settings.fewshot_enabled,
+            "examples": {diagram_type: len(index) for diagram_type, index in sorted(self.indexes.items())},
+            "lookups": self.lookups,
+            "lookups_with_examples": self.lookups_with_examples,
+            "avg_lookup_us": round(self.lookup_time / self.lookups * 1e6, 1) if self.lookups else None
+        }
+
+
+fewshot_service = FewShotService()
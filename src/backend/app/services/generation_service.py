@@ -1,10 +1,24 @@
 # src/backend/app/services/generation_service.py
 
+import asyncio
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import AsyncIterator, Optional, Tuple
 from app.core.database import get_database
 from app.services.llm_service import llm_service
-from app.utils.mermaid_validator import validate_mermaid_syntax, clean_mermaid_code
+from app.services.cache_service import generation_cache, make_generation_key, make_modification_key
+from app.services.single_flight import single_flight
+from app.services.llm_scheduler import QueueFullError, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.token_budget_service import token_budget_service
+from app.services.fewshot_service import fewshot_service
+from app.utils.mermaid_validator import validate_mermaid_syntax, clean_mermaid_code, MermaidStreamExtractor, VALIDATOR_VERSION
+from app.utils.mermaid_fixer import mermaid_fixer
+from app.utils.mermaid_canonical import structural_hash
+from app.utils.mermaid_context import restore_styling, select_relevant_context, merge_excerpt, ContextSelection
+from app.utils.mermaid_parser import MermaidSyntaxError
+from app.utils.mermaid_patch import apply_edit_operations, parse_edit_operations, PatchError, PATCHABLE_TYPES
+from app.utils.prompt_templates import get_prompt_template, get_modification_prompt, get_patch_prompt, PATCH_SYSTEM_MESSAGE
+from app.services.context_budget import context_budget_manager, ContextBudgetError
 from app.models.generation import GenerationLog
 from app.core.config import settings
 import time
@@ -18,9 +32,25 @@ class GenerationService:
         prompt: str, 
         diagram_type: str,
         diagram_id: Optional[str] = None,
-        model: Optional[str] = None
+        model: Optional[str] = None,
+        use_cache: bool = True,
+        priority: str = PRIORITY_INTERACTIVE,
+        cache_key: Optional[str] = None,
+        request_kind: str = "generate",
+        max_tokens: Optional[int] = None,
+        context_mode: Optional[str] = None,
+        modification_mode: Optional[str] = None,
+        log_sink: Optional[list] = None
     ) -> Tuple[Optional[str], Optional[str]]:
-        """Generate diagram and log the result with model information"""
+        """Generate diagram and log the result with model information.
+        
+        request_kind "modify" marks modification prompts: they get no
+        few-shot examples and are not indexed as examples. max_tokens
+        overrides the learned budget; context_mode (how the diagram was fit
+        into the prompt) and modification_mode are only logged. With
+        log_sink the log entry is appended there instead of being inserted
+        (see flush_logs).
+        """
         
         # Используем переданную модель или дефолтную
         selected_model = model or settings.default_model
@@ -30,8 +60,43 @@ class GenerationService:
         
         start_time = time.time()
         
-        # Generate diagram
-        result = await llm_service.generate_diagram(prompt, diagram_type, selected_model)
+        cache_key = cache_key or make_generation_key(selected_model, diagram_type, prompt)
+        cache_hit = False
+        coalesced = False
+        result = None
+        failure_message = "Generation failed"
+        
+        max_tokens = max_tokens or token_budget_service.get_budget(selected_model, diagram_type)
+        llm_stats = {}
+        if request_kind == "modify":
+            llm_stats.update(context_mode=context_mode, modification_mode=modification_mode or "full")
+        examples = fewshot_service.select(prompt, diagram_type) if request_kind == "generate" else []
+        
+        if use_cache:
+            result = await generation_cache.get(cache_key)
+            cache_hit = result is not None
+        
+        # Generate diagram (одинаковые одновременные запросы выполняются один раз)
+        if result is None:
+            try:
+                result, coalesced = await single_flight.do(
+                    cache_key,
+                    lambda: llm_service.generate_diagram(
+                        prompt, diagram_type, selected_model,
+                        user_id=user_id, priority=priority,
+                        max_tokens=max_tokens, stats=llm_stats, examples=examples
+                    )
+                )
+            except QueueFullError:
+                print(f"🚦 LLM queue full for {selected_model}, rejecting request")
+                raise
+            except CircuitOpenError as e:
+                print(f"⛔ {e}")
+                failure_message = str(e)
+                result = None
+            except Exception as e:
+                print(f"❌ Shared generation failed: {e}")
+                result = None
         
         generation_time = time.time() - start_time
         
@@ -39,6 +104,10 @@ class GenerationService:
             # Validate result
             is_valid, error_message = validate_mermaid_syntax(result, diagram_type)
             
+            # В кэш попадают только валидные диаграммы
+            if is_valid and use_cache and not cache_hit and not coalesced:
+                await generation_cache.set(cache_key, result)
+            
             # Log generation with model information
             await self._log_generation(
                 user_id=user_id,
@@ -49,10 +118,15 @@ class GenerationService:
                 generated_code=result,
                 is_valid=is_valid,
                 error_message=error_message,
-                generation_time=generation_time
+                generation_time=generation_time,
+                cache_hit=cache_hit,
+                coalesced=coalesced,
+                llm_stats=llm_stats,
+                request_kind=request_kind,
+                log_sink=log_sink
             )
             
-            print(f"✅ Generation completed with {selected_model} in {generation_time:.2f}s")
+            print(f"✅ Generation completed with {selected_model} in {generation_time:.2f}s (cache_hit={cache_hit})")
             print(f"📊 Result: valid={is_valid}, length={len(result)} chars")
             return result, error_message
         else:
@@ -65,12 +139,126 @@ class GenerationService:
                 model=selected_model,
                 generated_code="",
                 is_valid=False,
-                error_message="Generation failed",
-                generation_time=generation_time
+                error_message=failure_message,
+                generation_time=generation_time,
+                coalesced=coalesced,
+                llm_stats=llm_stats,
+                request_kind=request_kind,
+                log_sink=log_sink
             )
             
             print(f"❌ Generation failed with {selected_model} after {generation_time:.2f}s")
-            return None, "Generation failed"
+            return None, failure_message
+    
+    async def generate_stream(
+        self,
+        user_id: str,
+        prompt: str,
+        diagram_type: str,
+        diagram_id: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> AsyncIterator[dict]:
+        """Stream generation as events: code tokens first, validated code last"""
+        
+        selected_model = model or settings.default_model
+        
+        print(f"🌊 Starting streaming generation with model: {selected_model}")
+        print(f"📝 Prompt length: {len(prompt)} chars, type: {diagram_type}")
+        
+        start_time = time.time()
+        time_to_first_byte = None
+        extractor = MermaidStreamExtractor()
+        raw_content = ""
+        examples = fewshot_service.select(prompt, diagram_type)
+        # Тот же выученный бюджет, что и у обычной генерации; пишется в лог для его пересчета
+        max_tokens = token_budget_service.get_budget(selected_model, diagram_type)
+        llm_stats = {"few_shot_examples": len(examples), "max_tokens": max_tokens}
+        print(f"🎟️ Token budget for {selected_model}/{diagram_type}: max_tokens={max_tokens}")
+        
+        try:
+            async for delta in llm_service.stream_diagram(
+                prompt, diagram_type, selected_model, user_id=user_id,
+                max_tokens=max_tokens, examples=examples
+            ):
+                if time_to_first_byte is None:
+                    time_to_first_byte = time.time() - start_time
+                    print(f"⚡ First token from {selected_model} after {time_to_first_byte:.2f}s")
+                
+                if extractor.state == "done":
+                    # Диаграмма закрыта: остаток дочитываем (stop-последовательность его обрывает),
+                    # чтобы соединение вернулось в пул, но клиенту не отправляем
+                    continue
+                raw_content += delta
+                code_delta = extractor.feed(delta)
+                if code_delta:
+                    yield {"event": "token", "data": {"text": code_delta}}
+            
+            tail = extractor.finish()
+            if tail:
+                yield {"event": "token", "data": {"text": tail}}
+        
+        except QueueFullError as e:
+            print(f"🚦 LLM queue full for {selected_model}, rejecting stream")
+            yield {"event": "error", "data": {"error": str(e), "retry_after": e.retry_after}}
+            return
+        except CircuitOpenError as e:
+            print(f"⛔ {e}")
+            yield {"event": "error", "data": {"error": str(e), "retry_after": e.retry_after}}
+            return
+        except Exception as e:
+            generation_time = time.time() - start_time
+            print(f"❌ Streaming generation failed with {selected_model} after {generation_time:.2f}s: {e}")
+            
+            await self._log_generation(
+                user_id=user_id,
+                diagram_id=diagram_id,
+                prompt=prompt,
+                diagram_type=diagram_type,
+                model=selected_model,
+                generated_code="",
+                is_valid=False,
+                error_message="Generation failed",
+                generation_time=generation_time,
+                time_to_first_byte=time_to_first_byte,
+                llm_stats=llm_stats
+            )
+            yield {"event": "error", "data": {"error": "Generation failed"}}
+            return
+        
+        generation_time = time.time() - start_time
+        
+        # Финальный код проходит ту же очистку, исправление и валидацию, что и обычная генерация
+        result, is_valid, error_message = mermaid_fixer.fix_and_validate(clean_mermaid_code(raw_content), diagram_type)
+        
+        await self._log_generation(
+            user_id=user_id,
+            diagram_id=diagram_id,
+            prompt=prompt,
+            diagram_type=diagram_type,
+            model=selected_model,
+            generated_code=result,
+            is_valid=is_valid,
+            error_message=error_message,
+            generation_time=generation_time,
+            time_to_first_byte=time_to_first_byte,
+            llm_stats=llm_stats
+        )
+        
+        print(f"✅ Streaming generation completed with {selected_model} in {generation_time:.2f}s")
+        print(f"📊 Result: valid={is_valid}, length={len(result)} chars")
+        
+        yield {
+            "event": "done",
+            "data": {
+                "mermaid_code": result,
+                "diagram_type": diagram_type,
+                "model": selected_model,
+                "is_valid": is_valid,
+                "validation_error": error_message,
+                "generation_time": round(generation_time, 2),
+                "time_to_first_byte": round(time_to_first_byte, 2) if time_to_first_byte is not None else None
+            }
+        }
     
     async def modify_diagram(
         self, 
@@ -107,27 +295,107 @@ class GenerationService:
         print(f"📊 Original diagram type: {diagram.get('diagram_type')}")
         print(f"📏 Original code length: {len(diagram.get('mermaid_code', ''))} chars")
         
-        # Create modification prompt
-        full_prompt = f"""
-Current diagram code:
-{diagram['mermaid_code']}
-
-Modification request: {modification_prompt}
-
-Please modify the above {diagram['diagram_type']} diagram according to the request.
-Return only the modified mermaid code.
-"""
+        diagram_type = diagram['diagram_type']
         
-        print(f"📋 Full prompt length: {len(full_prompt)} chars")
+        # Ключ кэша по структуре исходной диаграммы: переформатированная копия дает тот же ключ
+        source_hash = diagram.get("structural_hash") or structural_hash(diagram['mermaid_code'])
+        cache_key = make_modification_key(selected_model, diagram_type, source_hash, modification_prompt)
         
-        try:
-            result = await self.generate_and_log(
-                user_id=user_id,
-                prompt=full_prompt,
-                diagram_type=diagram['diagram_type'],
-                diagram_id=diagram_id,
-                model=selected_model
+        # Большая диаграмма: в промпт идет только окрестность упомянутых в запросе узлов
+        selection = None
+        if settings.modification_context_pruning:
+            selection = select_relevant_context(
+                diagram['mermaid_code'], diagram_type, modification_prompt,
+                hops=settings.modification_context_hops,
+                max_nodes=settings.modification_context_max_nodes,
+                min_nodes=settings.modification_context_min_nodes
             )
+            if selection:
+                print(f"✂️ Modification context: {selection.nodes} of {selection.total_nodes} nodes")
+        
+        try:
+            # Сначала правка операциями: модель выдает десятки токенов вместо всей диаграммы
+            modification_mode = "full"
+            if settings.modification_mode == "patch" and diagram_type in PATCHABLE_TYPES:
+                result = await self._modify_with_patch(
+                    user_id, diagram_id, diagram, modification_prompt, selected_model, cache_key, selection
+                )
+                if result is not None:
+                    return result
+                print("🩹 Patch was not applicable, falling back to full regeneration")
+                modification_mode = "fallback"
+            
+            for excerpt in ([selection.code, None] if selection else [None]):
+                # Распределяем окно контекста: диаграмма целиком, сжатая или без оформления.
+                # Не помещается - ContextBudgetError сразу, а не таймаут после генерации
+                plan = context_budget_manager.plan_modification(
+                    selected_model, diagram_type, excerpt or diagram['mermaid_code'],
+                    lambda code: get_prompt_template(diagram_type, get_modification_prompt(diagram_type, code, modification_prompt))
+                )
+                
+                # Create modification prompt
+                full_prompt = get_modification_prompt(diagram_type, plan.code, modification_prompt)
+                
+                print(f"📋 Full prompt length: {len(full_prompt)} chars, context: {plan.mode}, max_tokens={plan.max_tokens}")
+                
+                # Лог ответа на фрагмент пишем после переноса в полную диаграмму
+                excerpt_logs = [] if excerpt else None
+                result = await self.generate_and_log(
+                    user_id=user_id,
+                    prompt=full_prompt,
+                    diagram_type=diagram_type,
+                    diagram_id=diagram_id,
+                    model=selected_model,
+                    # Ответ на фрагмент или без оформления - не итоговая диаграмма, кэшируем отдельно
+                    cache_key=f"{cache_key}:excerpt" if excerpt else f"{cache_key}:elided" if plan.elided else cache_key,
+                    request_kind="modify",
+                    max_tokens=plan.max_tokens,
+                    context_mode="pruned" if excerpt else plan.mode,
+                    modification_mode=modification_mode,
+                    log_sink=excerpt_logs
+                )
+                
+                if not excerpt:
+                    break
+                
+                # Правка фрагмента переносится в полную диаграмму операциями
+                merged = None
+                merge_error = None
+                if result[0]:
+                    try:
+                        merged = merge_excerpt(diagram['mermaid_code'], excerpt, result[0], diagram_type)
+                        is_valid, error = validate_mermaid_syntax(merged, diagram_type)
+                        if not is_valid:
+                            merge_error = f"Merged diagram is invalid: {error}"
+                            merged = None
+                    except (PatchError, MermaidSyntaxError) as e:
+                        merge_error = f"Excerpt edit could not be merged: {e}"
+                
+                for log_data in excerpt_logs:
+                    # В логе итоговая диаграмма (по ней code_hash и перепроверка), ответ модели - отдельно
+                    log_data.update({
+                        "excerpt_code": log_data["generated_code"],
+                        "generated_code": merged or "",
+                        "code_hash": structural_hash(merged) if merged else None,
+                        "is_valid": merged is not None,
+                        "error_message": merge_error or log_data["error_message"]
+                    })
+                await self.flush_logs(excerpt_logs)
+                
+                if merged:
+                    result = (merged, None)
+                    break
+                if not result[0]:
+                    break  # Генерация не удалась вовсе - полная диаграмма не поможет
+                print(f"✂️ {merge_error}")
+                print("✂️ Retrying with the whole diagram")
+            
+            if result[0] and plan.elided:
+                # Оформление, убранное из промпта, возвращаем к узлам, которые остались
+                result = (restore_styling(result[0], plan.elided, diagram_type), result[1])
+                if not excerpt and result[1] is None:
+                    # Под основным ключом только итоговый код с оформлением
+                    await generation_cache.set(cache_key, result[0])
             
             print(f"🎯 Modification result: success={result[0] is not None}")
             if result[0]:
@@ -135,9 +403,99 @@ Return only the modified mermaid code.
             
             return result
             
+        except (QueueFullError, ContextBudgetError):
+            raise
         except Exception as e:
             print(f"❌ Modification generation failed: {e}")
             return None, f"Modification failed: {str(e)}"
+    
+    async def _modify_with_patch(
+        self,
+        user_id: str,
+        diagram_id: str,
+        diagram: dict,
+        modification_prompt: str,
+        model: str,
+        cache_key: str,
+        selection: Optional[ContextSelection] = None
+    ) -> Optional[Tuple[str, Optional[str]]]:
+        """Ask for edit operations and apply them to the stored code.
+        
+        With a selection the model sees only the relevant excerpt; the
+        operations still apply to the whole diagram. Returns (code, None)
+        for a valid result, None when the caller should regenerate the whole
+        diagram (no answer, bad JSON, unknown ids, invalid result). Every
+        attempt is logged with modification_mode "patch".
+        """
+        code = diagram['mermaid_code']
+        diagram_type = diagram['diagram_type']
+        
+        try:
+            # Ответ короткий и фиксированный - в окно помещаются диаграммы, которым не хватило бы места на полный ответ
+            plan = context_budget_manager.plan_modification(
+                model, diagram_type, selection.code if selection else code,
+                lambda candidate: get_patch_prompt(diagram_type, candidate, modification_prompt),
+                output_tokens=settings.modification_patch_max_tokens,
+                system=PATCH_SYSTEM_MESSAGE
+            )
+        except ContextBudgetError:
+            return None
+        
+        start_time = time.time()
+        # Свой ключ: под основным лежат полные диаграммы, а не результаты операций
+        cache_key = f"{cache_key}:patch"
+        cached = await generation_cache.get(cache_key)
+        prompt = get_patch_prompt(diagram_type, plan.code, modification_prompt)
+        llm_stats = {"context_mode": "pruned" if selection else plan.mode, "modification_mode": "patch"}
+        result = None
+        error_message = None
+        
+        if cached is None:
+            try:
+                answer = await llm_service.complete_text(
+                    prompt, model, PATCH_SYSTEM_MESSAGE, user_id=user_id,
+                    max_tokens=plan.max_tokens, stats=llm_stats
+                )
+            except CircuitOpenError as e:
+                answer, error_message = None, str(e)
+            
+            if answer is None:
+                error_message = error_message or "No answer from LLM"
+            else:
+                try:
+                    # Операции применяются к исходному коду - оформление и комментарии директив на месте
+                    result = apply_edit_operations(code, parse_edit_operations(answer), diagram_type)
+                    is_valid, error_message = validate_mermaid_syntax(result, diagram_type)
+                    if not is_valid:
+                        result = None
+                except PatchError as e:
+                    error_message = str(e)
+            
+            if result is not None:
+                await generation_cache.set(cache_key, result)
+        
+        generation_time = time.time() - start_time
+        await self._log_generation(
+            user_id=user_id,
+            diagram_id=diagram_id,
+            prompt=prompt,
+            diagram_type=diagram_type,
+            model=model,
+            generated_code=cached or result or "",
+            is_valid=bool(cached or result),
+            error_message=error_message,
+            generation_time=generation_time,
+            cache_hit=cached is not None,
+            llm_stats=llm_stats,
+            request_kind="modify"
+        )
+        
+        if cached or result:
+            print(f"🩹 Patch modification with {model} in {generation_time:.2f}s, "
+                  f"output tokens: {llm_stats.get('output_tokens', 0)}")
+            return cached or result, None
+        print(f"🩹 Patch modification failed: {error_message}")
+        return None
  
     async def _log_generation(
         self,
@@ -149,34 +507,140 @@ Return only the modified mermaid code.
         generated_code: str,
         is_valid: bool,
         error_message: Optional[str],
-        generation_time: float
+        generation_time: float,
+        time_to_first_byte: Optional[float] = None,
+        cache_hit: bool = False,
+        coalesced: bool = False,
+        llm_stats: Optional[dict] = None,
+        request_kind: str = "generate",
+        log_sink: Optional[list] = None
     ):
-        """Log generation to database with model information"""
+        """Log generation to database with model information (or append to log_sink)"""
         
         db = get_database()
         
         log_data = {
+            "request_kind": request_kind,
             "user_id": user_id,
             "diagram_id": diagram_id,
             "prompt": prompt,
             "diagram_type": diagram_type,
             "model": model,
             "generated_code": generated_code,
+            # Одинаковые по структуре диаграммы - один code_hash (дедупликация и статистика)
+            "code_hash": structural_hash(generated_code) if generated_code else None,
             "is_valid": is_valid,
             "error_message": error_message,
+            "validator_version": VALIDATOR_VERSION,
             "generation_time": generation_time,
+            "time_to_first_byte": time_to_first_byte,
+            "cache_hit": cache_hit,
+            "coalesced": coalesced,
             "created_at": datetime.utcnow()
         }
         
+        # Бюджет токенов и фактический расход - для оценки влияния на повторы и время
+        if llm_stats:
+            log_data.update({
+                "max_tokens": llm_stats.get("max_tokens"),
+                "output_tokens": llm_stats.get("output_tokens"),
+                "attempts": llm_stats.get("attempts"),
+                "truncated": llm_stats.get("truncated", False),
+                "input_tokens": llm_stats.get("input_tokens"),
+                "retry_strategy": llm_stats.get("retry_strategy"),
+                "repairs": llm_stats.get("repairs", 0),
+                "few_shot_examples": llm_stats.get("few_shot_examples", 0),
+                "context_mode": llm_stats.get("context_mode"),
+                "modification_mode": llm_stats.get("modification_mode")
+            })
+        
+        if log_sink is not None:
+            log_sink.append(log_data)  # Запишется одним insert_many в flush_logs
+            return
+        
         try:
             result = await db.generation_logs.insert_one(log_data)
             log_id = str(result.inserted_id)
             print(f"💾 Generation logged: ID={log_id}, user={user_id}, model={model}")
             print(f"📊 Log details: type={diagram_type}, valid={is_valid}, time={generation_time:.2f}s")
             
+            # Новый валидный результат сразу становится кандидатом в few-shot примеры
+            if is_valid and request_kind == "generate":
+                fewshot_service.add(prompt, generated_code, diagram_type, log_data["code_hash"])
+            
         except Exception as e:
             print(f"❌ Failed to log generation: {e}")
     
+    async def flush_logs(self, logs: list):
+        """Insert collected log entries with one insert_many"""
+        if not logs:
+            return
+        
+        db = get_database()
+        try:
+            result = await db.generation_logs.insert_many(logs, ordered=False)
+            print(f"💾 {len(result.inserted_ids)} generations logged in one batch")
+        except Exception as e:
+            print(f"❌ Failed to log generation batch: {e}")
+            return
+        
+        for log_data in logs:
+            if log_data["is_valid"] and log_data["request_kind"] == "generate":
+                fewshot_service.add(log_data["prompt"], log_data["generated_code"], log_data["diagram_type"], log_data["code_hash"])
+    
+    async def generate_batch(self, user_id: str, items: list) -> AsyncIterator[dict]:
+        """Generate a list of diagrams concurrently, yielding each result as soon as it is ready.
+        
+        items are dicts with prompt, diagram_type, model and use_cache. The
+        requests go through the LLM scheduler with batch priority (interactive
+        requests overtake them); at most generation_batch_concurrency of them
+        wait in the scheduler queue at once, so a large batch does not fill
+        it up for everyone. A failed item yields an error result and the rest
+        continue. Logs are written with one insert_many at the end.
+        """
+        
+        print(f"📦 Starting batch of {len(items)} generations for user {user_id}")
+        start_time = time.time()
+        logs: list = []
+        limit = asyncio.Semaphore(settings.generation_batch_concurrency)
+        
+        async def run(index: int, item: dict) -> dict:
+            async with limit:
+                try:
+                    code, error = await self.generate_and_log(
+                        user_id=user_id,
+                        prompt=item["prompt"],
+                        diagram_type=item["diagram_type"],
+                        model=item.get("model"),
+                        use_cache=item.get("use_cache", True),
+                        priority=PRIORITY_BATCH,
+                        log_sink=logs
+                    )
+                except Exception as e:
+                    print(f"❌ Batch item {index} failed: {e}")
+                    return {"index": index, "mermaid_code": None, "is_valid": False, "error": str(e)}
+            
+            if not code:
+                return {"index": index, "mermaid_code": None, "is_valid": False, "error": error or "Failed to generate diagram"}
+            return {
+                "index": index,
+                "mermaid_code": code,
+                "diagram_type": item["diagram_type"],
+                "is_valid": error is None,
+                "validation_error": error
+            }
+        
+        tasks = [asyncio.create_task(run(index, item)) for index, item in enumerate(items)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Клиент отключился - оставшиеся генерации не нужны
+            for task in tasks:
+                task.cancel()
+            await self.flush_logs(logs)
+            print(f"📦 Batch of {len(items)} finished in {time.time() - start_time:.2f}s")
+    
     async def get_user_generation_history(self, user_id: str, limit: int = 10):
         """Get user's generation history with model information"""
         
@@ -202,6 +666,12 @@ Return only the modified mermaid code.
                     "is_valid": log["is_valid"],
                     "error_message": log.get("error_message"),
                     "generation_time": round(log["generation_time"], 2),
+                    "time_to_first_byte": log.get("time_to_first_byte"),
+                    "cache_hit": log.get("cache_hit", False),
+                    "max_tokens": log.get("max_tokens"),
+                    "output_tokens": log.get("output_tokens"),
+                    "attempts": log.get("attempts"),
+                    "retry_strategy": log.get("retry_strategy"),
                     "created_at": log["created_at"].isoformat(),
                     "code_length": len(log.get("generated_code", ""))
                 }
@@ -254,7 +724,8 @@ Return only the modified mermaid code.
                         },
                         "avg_generation_time": {"$avg": "$generation_time"},
                         "total_code_length": {"$sum": {"$strLenCP": "$generated_code"}},
-                        "diagram_types": {"$addToSet": "$diagram_type"}
+                        "diagram_types": {"$addToSet": "$diagram_type"},
+                        "code_hashes": {"$addToSet": "$code_hash"}
                     }
                 },
                 {
@@ -275,7 +746,9 @@ Return only the modified mermaid code.
                     "avg_code_length": round(
                         stat["total_code_length"] / stat["total_generations"], 0
                     ) if stat["total_generations"] > 0 else 0,
-                    "diagram_types_used": stat["diagram_types"]
+                    "diagram_types_used": stat["diagram_types"],
+                    # Структурно разные диаграммы (логи без code_hash не учитываются)
+                    "unique_diagrams": len([h for h in stat["code_hashes"] if h])
                 }
                 stats.append(model_stat)
             
@@ -347,6 +820,285 @@ Return only the modified mermaid code.
         except Exception as e:
             print(f"❌ Error getting model performance comparison: {e}")
             return []
+    
+    async def get_retry_strategy_stats(self, days: int = 30):
+        """Compare retry strategies per model: attempts to valid, tokens and time"""
+        
+        print(f"🔁 Getting retry strategy stats, last {days} days")
+        
+        db = get_database()
+        
+        try:
+            from datetime import timedelta
+            start_date = datetime.utcnow() - timedelta(days=days)
+            
+            pipeline = [
+                {
+                    "$match": {
+                        "created_at": {"$gte": start_date},
+                        "retry_strategy": {"$ne": None},
+                        "cache_hit": {"$ne": True},
+                        "coalesced": {"$ne": True}
+                    }
+                },
+                {
+                    "$group": {
+                        "_id": {"model": "$model", "strategy": "$retry_strategy"},
+                        "total_generations": {"$sum": 1},
+                        "successful_generations": {
+                            "$sum": {"$cond": [{"$eq": ["$is_valid", True]}, 1, 0]}
+                        },
+                        "retried_generations": {
+                            "$sum": {"$cond": [{"$gt": ["$attempts", 1]}, 1, 0]}
+                        },
+                        "avg_attempts": {"$avg": "$attempts"},
+                        # Попыток до валидного результата - только по успешным генерациям
+                        "avg_attempts_to_valid": {
+                            "$avg": {"$cond": [{"$eq": ["$is_valid", True]}, "$attempts", None]}
+                        },
+                        "avg_input_tokens": {"$avg": "$input_tokens"},
+                        "avg_output_tokens": {"$avg": "$output_tokens"},
+                        "avg_generation_time": {"$avg": "$generation_time"},
+                        # Те же метрики по генерациям с повтором - там стратегии и различаются
+                        "retried_tokens": {
+                            "$avg": {"$cond": [
+                                {"$gt": ["$attempts", 1]},
+                                {"$add": [{"$ifNull": ["$input_tokens", 0]}, {"$ifNull": ["$output_tokens", 0]}]},
+                                None
+                            ]}
+                        },
+                        "retried_time": {
+                            "$avg": {"$cond": [{"$gt": ["$attempts", 1]}, "$generation_time", None]}
+                        }
+                    }
+                },
+                {
+                    "$sort": {"_id.model": 1, "_id.strategy": 1}
+                }
+            ]
+            
+            by_model = {}
+            async for stat in db.generation_logs.aggregate(pipeline):
+                model = stat["_id"].get("model") or "unknown"
+                by_model.setdefault(model, {})[stat["_id"]["strategy"]] = {
+                    "total_generations": stat["total_generations"],
+                    "success_rate": round(
+                        (stat["successful_generations"] / stat["total_generations"]) * 100, 2
+                    ) if stat["total_generations"] > 0 else 0,
+                    "retried_generations": stat["retried_generations"],
+                    "avg_attempts": round(stat["avg_attempts"] or 0, 2),
+                    "avg_attempts_to_valid": round(stat["avg_attempts_to_valid"] or 0, 2),
+                    "avg_input_tokens": round(stat["avg_input_tokens"] or 0, 0),
+                    "avg_output_tokens": round(stat["avg_output_tokens"] or 0, 0),
+                    "avg_generation_time": round(stat["avg_generation_time"] or 0, 2),
+                    "avg_retried_tokens": round(stat["retried_tokens"] or 0, 0),
+                    "avg_retried_time": round(stat["retried_time"] or 0, 2)
+                }
+            
+            stats = []
+            for model, strategies in by_model.items():
+                model_stat = {"model": model, "strategies": strategies}
+                
+                # Выигрыш repair относительно resample на генерациях с повтором
+                repair, resample = strategies.get("repair"), strategies.get("resample")
+                if repair and resample and resample["avg_retried_tokens"] and resample["avg_retried_time"]:
+                    model_stat["repair_vs_resample"] = {
+                        "token_reduction_percent": round(
+                            (1 - repair["avg_retried_tokens"] / resample["avg_retried_tokens"]) * 100, 2
+                        ),
+                        "time_reduction_percent": round(
+                            (1 - repair["avg_retried_time"] / resample["avg_retried_time"]) * 100, 2
+                        )
+                    }
+                stats.append(model_stat)
+            
+            print(f"🔁 Retry stats for {len(stats)} models")
+            return stats
+            
+        except Exception as e:
+            print(f"❌ Error getting retry strategy stats: {e}")
+            return []
+    
+    async def get_few_shot_stats(self, days: int = 30):
+        """Compare generations with and without few-shot examples per model"""
+        
+        print(f"🧩 Getting few-shot stats, last {days} days")
+        
+        db = get_database()
+        
+        try:
+            from datetime import timedelta
+            start_date = datetime.utcnow() - timedelta(days=days)
+            
+            pipeline = [
+                {
+                    "$match": {
+                        "created_at": {"$gte": start_date},
+                        "request_kind": "generate",
+                        "attempts": {"$ne": None},
+                        "cache_hit": {"$ne": True},
+                        "coalesced": {"$ne": True}
+                    }
+                },
+                {
+                    "$group": {
+                        "_id": {
+                            "model": "$model",
+                            "few_shot": {"$gt": [{"$ifNull": ["$few_shot_examples", 0]}, 0]}
+                        },
+                        "total_generations": {"$sum": 1},
+                        "successful_generations": {
+                            "$sum": {"$cond": [{"$eq": ["$is_valid", True]}, 1, 0]}
+                        },
+                        # Валидно с первой попытки - то, что должны улучшать примеры
+                        "first_shot_valid": {
+                            "$sum": {"$cond": [
+                                {"$and": [{"$eq": ["$is_valid", True]}, {"$eq": ["$attempts", 1]}]}, 1, 0
+                            ]}
+                        },
+                        "avg_attempts": {"$avg": "$attempts"},
+                        "avg_input_tokens": {"$avg": "$input_tokens"},
+                        "avg_generation_time": {"$avg": "$generation_time"}
+                    }
+                },
+                {
+                    "$sort": {"_id.model": 1}
+                }
+            ]
+            
+            by_model = {}
+            async for stat in db.generation_logs.aggregate(pipeline):
+                model = stat["_id"].get("model") or "unknown"
+                group = "with_examples" if stat["_id"]["few_shot"] else "without_examples"
+                total = stat["total_generations"]
+                by_model.setdefault(model, {})[group] = {
+                    "total_generations": total,
+                    "success_rate": round(stat["successful_generations"] / total * 100, 2) if total else 0,
+                    "first_shot_valid_rate": round(stat["first_shot_valid"] / total * 100, 2) if total else 0,
+                    "avg_attempts": round(stat["avg_attempts"] or 0, 2),
+                    "avg_input_tokens": round(stat["avg_input_tokens"] or 0, 0),
+                    "avg_generation_time": round(stat["avg_generation_time"] or 0, 2)
+                }
+            
+            stats = []
+            for model, groups in by_model.items():
+                model_stat = {"model": model, **groups}
+                
+                with_examples, without = groups.get("with_examples"), groups.get("without_examples")
+                if with_examples and without and without["avg_attempts"] and without["avg_generation_time"]:
+                    model_stat["few_shot_effect"] = {
+                        "retry_reduction_percent": round(
+                            (1 - (with_examples["avg_attempts"] - 1) / (without["avg_attempts"] - 1)) * 100, 2
+                        ) if without["avg_attempts"] > 1 else None,
+                        "time_reduction_percent": round(
+                            (1 - with_examples["avg_generation_time"] / without["avg_generation_time"]) * 100, 2
+                        ),
+                        "first_shot_valid_gain": round(
+                            with_examples["first_shot_valid_rate"] - without["first_shot_valid_rate"], 2
+                        )
+                    }
+                stats.append(model_stat)
+            
+            print(f"🧩 Few-shot stats for {len(stats)} models")
+            return stats
+            
+        except Exception as e:
+            print(f"❌ Error getting few-shot stats: {e}")
+            return []
+
+    
+    async def get_modification_stats(self, days: int = 30):
+        """Output tokens and time per modification: patch vs full regeneration per model"""
+        
+        print(f"🩹 Getting modification stats, last {days} days")
+        
+        db = get_database()
+        
+        try:
+            from datetime import timedelta
+            start_date = datetime.utcnow() - timedelta(days=days)
+            
+            pipeline = [
+                {
+                    "$match": {
+                        "created_at": {"$gte": start_date},
+                        "request_kind": "modify",
+                        "cache_hit": {"$ne": True},
+                        "coalesced": {"$ne": True}
+                    }
+                },
+                {
+                    "$group": {
+                        "_id": {
+                            "model": "$model",
+                            "mode": {"$ifNull": ["$modification_mode", "full"]}
+                        },
+                        "total": {"$sum": 1},
+                        "successful": {"$sum": {"$cond": [{"$eq": ["$is_valid", True]}, 1, 0]}},
+                        "input_tokens": {"$sum": {"$ifNull": ["$input_tokens", 0]}},
+                        "output_tokens": {"$sum": {"$ifNull": ["$output_tokens", 0]}},
+                        "pruned": {"$sum": {"$cond": [{"$eq": ["$context_mode", "pruned"]}, 1, 0]}},
+                        "generation_time": {"$sum": "$generation_time"}
+                    }
+                },
+                {
+                    "$sort": {"_id.model": 1}
+                }
+            ]
+            
+            by_model = {}
+            async for stat in db.generation_logs.aggregate(pipeline):
+                model = stat["_id"].get("model") or "unknown"
+                by_model.setdefault(model, {})[stat["_id"]["mode"]] = stat
+            
+            fields = ("total", "successful", "input_tokens", "output_tokens", "pruned", "generation_time")
+            empty = dict.fromkeys(fields, 0)
+            
+            def summary(group: dict, modifications: int) -> dict:
+                return {
+                    "modifications": modifications,
+                    "success_rate": round(group["successful"] / modifications * 100, 2),
+                    "avg_input_tokens": round(group["input_tokens"] / modifications, 0),
+                    "avg_output_tokens": round(group["output_tokens"] / modifications, 0),
+                    "avg_time": round(group["generation_time"] / modifications, 2),
+                    "pruned_context_rate": round(group["pruned"] / group["total"] * 100, 2)
+                }
+            
+            stats = []
+            for model, modes in by_model.items():
+                model_stat = {"model": model}
+                full = modes.get("full")
+                if full:
+                    model_stat["full"] = summary(full, full["total"])
+                
+                patch = modes.get("patch")
+                if patch:
+                    fallback = modes.get("fallback") or empty
+                    # Неудачный патч и следующая за ним полная генерация - одна модификация
+                    combined = {key: patch[key] + fallback[key] for key in fields}
+                    model_stat["patch"] = dict(
+                        summary(combined, patch["total"]),
+                        patch_applied_rate=round(patch["successful"] / patch["total"] * 100, 2),
+                        fallbacks=fallback["total"]
+                    )
+                
+                if model_stat.get("full") and model_stat.get("patch") and model_stat["full"]["avg_time"]:
+                    model_stat["patch_effect"] = {
+                        "output_token_reduction_percent": round(
+                            (1 - model_stat["patch"]["avg_output_tokens"] / model_stat["full"]["avg_output_tokens"]) * 100, 2
+                        ) if model_stat["full"]["avg_output_tokens"] else None,
+                        "time_reduction_percent": round(
+                            (1 - model_stat["patch"]["avg_time"] / model_stat["full"]["avg_time"]) * 100, 2
+                        )
+                    }
+                stats.append(model_stat)
+            
+            print(f"🩹 Modification stats for {len(stats)} models")
+            return stats
+            
+        except Exception as e:
+            print(f"❌ Error getting modification stats: {e}")
+            return []
 
 
 generation_service = GenerationService()
@@ -0,0 +1,60 @@
+# src/backend/app/services/hedging.py
+from collections import deque
+from typing import Deque, Dict, Optional
+from app.core.config import settings
+
+
+class LatencyTracker:
+    """Recent successful completion latencies per model"""
+    
+    def __init__(self, window: int = 200):
+        self.window = window
+        self.samples: Dict[str, Deque[float]] = {}
+    
+    def record(self, model: str, latency: float):
+        samples = self.samples.get(model)
+        if samples is None:
+            samples = self.samples[model] = deque(maxlen=self.window)
+        samples.append(latency)
+    
+    def percentile(self, model: str, percentile: float, min_samples: int = 1) -> Optional[float]:
+        samples = self.samples.get(model)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(int(len(ordered) * percentile / 100), len(ordered) - 1)
+        return ordered[index]
+
+
+class HedgeBudget:
+    """Caps hedged requests to a share of recent traffic"""
+    
+    def __init__(self, budget_percent: float, window: int = 1000):
+        self.budget_percent = budget_percent
+        self.recent: Deque[bool] = deque(maxlen=window)
+        self.hedges_sent = 0
+        self.hedges_won = 0
+    
+    def record_request(self):
+        self.recent.append(False)
+    
+    def try_acquire(self) -> bool:
+        """Spend budget on one hedge if it stays under the cap"""
+        if not self.recent:
+            return False
+        hedged = sum(self.recent)
+        if (hedged + 1) > len(self.recent) * self.budget_percent / 100:
+            return False
+        # Помечаем последний учтенный запрос как хеджированный
+        self.recent[-1] = True
+        self.hedges_sent += 1
+        return True
+    
+    def get_status(self) -> dict:
+        return {
+            "enabled": settings.llm_hedging_enabled,
+            "budget_percent": self.budget_percent,
+            "recent_hedge_rate": round(sum(self.recent) / len(self.recent) * 100, 2) if self.recent else 0.0,
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won
+        }
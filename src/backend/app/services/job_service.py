@@ -0,0 +1,190 @@
+# src/backend/app/services/job_service.py
+import json
+import time
+import uuid
+from typing import AsyncIterator, Optional
+from app.core.config import settings
+from app.core.database import get_redis
+from app.services.llm_scheduler import QueueFullError
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+FINISHED = (JOB_DONE, JOB_FAILED)
+
+
+def job_key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+def job_channel(job_id: str) -> str:
+    return f"job:{job_id}:finished"
+
+
+def _decode(raw: dict) -> dict:
+    job = {key.decode(): value.decode() for key, value in raw.items()}
+    for field in ("payload", "result", "workspace"):
+        if job.get(field):
+            job[field] = json.loads(job[field])
+    for field in ("created_at", "started_at", "finished_at"):
+        if job.get(field):
+            job[field] = float(job[field])
+    job["attempts"] = int(job.get("attempts", 0))
+    return job
+
+
+class JobService:
+    """Generation jobs: state in a Redis hash, delivery through a Redis stream.
+
+    submit() stores job:{id} and appends the id to the stream; workers
+    (app.jobs.generation_worker) read it through a consumer group, so
+    any number of worker processes on any host share the queue. Finished
+    jobs keep their result for jobs_result_ttl seconds and announce it on a
+    pub/sub channel for SSE subscribers.
+    """
+
+    async def ensure_group(self):
+        """Create the consumer group (and the stream) if missing"""
+        redis = get_redis()
+        try:
+            await redis.xgroup_create(settings.jobs_stream, settings.jobs_group, id="0", mkstream=True)
+            print(f"Created consumer group {settings.jobs_group} on {settings.jobs_stream}")
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def pending_count(self) -> int:
+        """Jobs waiting for a worker or being processed"""
+        redis = get_redis()
+        try:
+            groups = await redis.xinfo_groups(settings.jobs_stream)
+        except Exception:
+            return 0  # Поток еще не создан
+        for group in groups:
+            if group["name"].decode() == settings.jobs_group:
+                return (group.get("lag") or 0) + group["pending"]
+        return await redis.xlen(settings.jobs_stream)
+
+    async def submit(self, kind: str, user_id: str, payload: dict) -> str:
+        """Queue a job; raises QueueFullError when too many jobs are waiting"""
+        if await self.pending_count() >= settings.jobs_max_pending:
+            raise QueueFullError(settings.jobs_claim_idle, "Generation job queue is full")
+
+        job_id = uuid.uuid4().hex
+        redis = get_redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hset(job_key(job_id), mapping={
+                "kind": kind,
+                "user_id": user_id,
+                "status": JOB_QUEUED,
+                "payload": json.dumps(payload, ensure_ascii=False),
+                "created_at": time.time(),
+                "attempts": 0
+            })
+            # Невзятая задача не должна жить вечно, если воркеров нет
+            pipe.expire(job_key(job_id), settings.jobs_result_ttl + settings.jobs_queued_ttl)
+            pipe.xadd(settings.jobs_stream, {"job_id": job_id}, maxlen=settings.jobs_stream_maxlen, approximate=True)
+            await pipe.execute()
+        print(f"Queued {kind} job {job_id} for user {user_id}")
+        return job_id
+
+    async def get(self, job_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+        """Job state; None if unknown, expired or owned by another user"""
+        raw = await get_redis().hgetall(job_key(job_id))
+        if not raw:
+            return None
+        job = _decode(raw)
+        if user_id is not None and job["user_id"] != user_id:
+            return None
+        job["job_id"] = job_id
+        return job
+
+    async def mark_running(self, job_id: str, consumer: str) -> int:
+        """Mark job taken by a worker; returns the attempt number"""
+        redis = get_redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hincrby(job_key(job_id), "attempts", 1)
+            pipe.hset(job_key(job_id), mapping={"status": JOB_RUNNING, "worker": consumer, "started_at": time.time()})
+            attempts, _ = await pipe.execute()
+        return attempts
+
+    async def finish(self, job_id: str, result: Optional[dict] = None, error: Optional[str] = None):
+        """Store the outcome, start the result TTL and notify subscribers"""
+        status = JOB_FAILED if error else JOB_DONE
+        fields = {"status": status, "finished_at": time.time()}
+        if result is not None:
+            fields["result"] = json.dumps(result, ensure_ascii=False)
+        if error:
+            fields["error"] = error
+
+        redis = get_redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hset(job_key(job_id), mapping=fields)
+            pipe.expire(job_key(job_id), settings.jobs_result_ttl)
+            pipe.publish(job_channel(job_id), status)
+            await pipe.execute()
+
+    async def claim_once(self, job_id: str, marker: str) -> bool:
+        """True for exactly one caller per (job, marker) - e.g. applying a result to a workspace"""
+        return bool(await get_redis().hsetnx(job_key(job_id), marker, time.time()))
+
+    async def release_claim(self, job_id: str, marker: str):
+        """Undo claim_once when the claimed action failed, so it can be retried"""
+        await get_redis().hdel(job_key(job_id), marker)
+
+    async def annotate(self, job_id: str, fields: dict):
+        """Store extra fields on an existing job (dicts as JSON); the TTL is kept"""
+        mapping = {
+            key: json.dumps(value, ensure_ascii=False) if isinstance(value, dict) else value
+            for key, value in fields.items()
+        }
+        await get_redis().hset(job_key(job_id), mapping=mapping)
+
+    async def wait(self, job_id: str, user_id: str, timeout: float) -> AsyncIterator[dict]:
+        """Yield the job state now and again once it finishes (or timeout passes)"""
+        redis = get_redis()
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(job_channel(job_id))
+        try:
+            # Подписка раньше чтения состояния - завершение между ними не теряется
+            job = await self.get(job_id, user_id)
+            yield job
+            if job is None or job["status"] in FINISHED:
+                return
+
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=min(5.0, deadline - time.monotonic()))
+                if message is None:
+                    continue
+                job = await self.get(job_id, user_id)
+                yield job
+                return
+        finally:
+            await pubsub.unsubscribe(job_channel(job_id))
+            await pubsub.aclose()
+
+    async def get_status(self) -> dict:
+        try:
+            return {"stream": settings.jobs_stream, "pending": await self.pending_count()}
+        except Exception as e:
+            return {"stream": settings.jobs_stream, "error": str(e)}
+
+
+def public_job(job: dict) -> dict:
+    """Job fields returned to clients"""
+    return {
+        "job_id": job["job_id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at")
+    }
+
+
+job_service = JobService()
@@ -0,0 +1,244 @@
+# src/backend/app/services/llm_router.py
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Iterable, List, Optional, Set, Union
+import httpx
+from app.core.config import settings
+from app.services.adaptive_limit import AdaptiveLimit
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+class NoBackendAvailableError(Exception):
+    """No healthy backend serves the requested model"""
+
+
+class LLMBackend:
+    """One OpenAI-compatible server (LM Studio instance)"""
+    
+    def __init__(self, url: str, models: Optional[Iterable[str]] = None):
+        self.url = url.rstrip("/")
+        self.configured_models: Optional[Set[str]] = set(models) if models else None
+        self.discovered_models: Optional[Set[str]] = None
+        self.client: Optional[httpx.AsyncClient] = None
+        self.healthy = True
+        self.in_flight = 0
+        self.model_in_flight: dict = {}
+        self.limits: dict = {}
+        self.breakers: dict = {}
+        self.total_requests = 0
+        self.failed_checks = 0
+        self.last_error: Optional[str] = None
+    
+    @property
+    def models(self) -> Optional[Set[str]]:
+        """Configured models win; otherwise whatever /v1/models reported"""
+        return self.configured_models or self.discovered_models
+    
+    def serves(self, model: str) -> bool:
+        return self.models is None or model in self.models
+    
+    def limit(self, model: str) -> AdaptiveLimit:
+        """Concurrency limit for model on this backend"""
+        limit = self.limits.get(model)
+        if limit is None:
+            initial = settings.llm_model_concurrency.get(model, settings.llm_default_concurrency)
+            if settings.llm_adaptive_concurrency:
+                limit = AdaptiveLimit(initial, settings.llm_adaptive_min_concurrency, settings.llm_adaptive_max_concurrency)
+            else:
+                limit = AdaptiveLimit(initial, initial, initial)  # floor == ceiling: фиксированный лимит
+            self.limits[model] = limit
+        return limit
+    
+    def breaker(self, model: str) -> CircuitBreaker:
+        """Circuit breaker for model on this backend"""
+        breaker = self.breakers.get(model)
+        if breaker is None:
+            breaker = self.breakers[model] = CircuitBreaker()
+        return breaker
+    
+    def has_capacity(self, model: str) -> bool:
+        return self.model_in_flight.get(model, 0) < self.limit(model).current
+    
+    def get_status(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "total_requests": self.total_requests,
+            "models": sorted(self.models) if self.models else None,
+            "concurrency": {model: limit.get_status() for model, limit in self.limits.items()},
+            "circuit_breakers": {model: breaker.get_status() for model, breaker in self.breakers.items()},
+            "last_error": self.last_error
+        }
+
+
+class BackendCall:
+    """Outcome of one tracked request; mark failed for non-200 answers"""
+    
+    def __init__(self, backend: LLMBackend, model: str):
+        self.backend = backend
+        self.model = model
+        self.failed = False
+        self.cancelled = False
+
+
+def parse_backends(value: Union[str, list]) -> List[LLMBackend]:
+    """Build backends from llm_api_url: a URL, comma-separated URLs, or a list of URLs / {"url", "models"} dicts"""
+    if isinstance(value, str):
+        value = [url.strip() for url in value.split(",") if url.strip()]
+    
+    backends = []
+    for entry in value:
+        if isinstance(entry, str):
+            backends.append(LLMBackend(entry))
+        else:
+            backends.append(LLMBackend(entry["url"], entry.get("models")))
+    
+    if not backends:
+        raise ValueError("llm_api_url must contain at least one backend")
+    return backends
+
+
+class LLMRouter:
+    """Least-outstanding-requests balancing over healthy backends.
+    
+    A background task pings /v1/models on every backend; a backend that
+    fails llm_health_failure_threshold checks in a row is taken out of
+    rotation until it answers again.
+    """
+    
+    def __init__(self, backends: Optional[List[LLMBackend]] = None):
+        self.backends = backends or parse_backends(settings.llm_api_url)
+        self.health_interval = settings.llm_health_check_interval
+        self.failure_threshold = settings.llm_health_failure_threshold
+        self._health_task: Optional[asyncio.Task] = None
+    
+    def ensure_clients(self, client_factory: Callable[[str], httpx.AsyncClient]):
+        """Create HTTP clients for backends that do not have an open one"""
+        for backend in self.backends:
+            if backend.client is None or backend.client.is_closed:
+                backend.client = client_factory(backend.url)
+    
+    async def start(self, client_factory: Callable[[str], httpx.AsyncClient]):
+        """Open clients, run first health check and start the health loop"""
+        self.ensure_clients(client_factory)
+        await self.check_health()
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+    
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        
+        for backend in self.backends:
+            if backend.client is not None and not backend.client.is_closed:
+                await backend.client.aclose()
+            backend.client = None
+    
+    def candidates(self, model: str, exclude: Iterable[LLMBackend] = ()) -> List[LLMBackend]:
+        excluded = set(id(backend) for backend in exclude)
+        return [
+            backend for backend in self.backends
+            if backend.healthy and backend.serves(model) and id(backend) not in excluded
+            and backend.breaker(model).is_available()
+        ]
+    
+    def ensure_available(self, model: str, exclude: Iterable[LLMBackend] = ()):
+        """Raise right away if no backend can take a request for the model"""
+        if self.candidates(model, exclude):
+            return
+        
+        # Бэкенды живы, но у всех открыт breaker - отказываем быстро
+        excluded = set(id(backend) for backend in exclude)
+        tripped = [
+            backend.breaker(model) for backend in self.backends
+            if backend.healthy and backend.serves(model) and id(backend) not in excluded
+        ]
+        if tripped:
+            raise CircuitOpenError(model, min(breaker.retry_after() for breaker in tripped))
+        raise NoBackendAvailableError(f"No healthy LLM backend serves model {model}")
+    
+    def pick(self, model: str, exclude: Iterable[LLMBackend] = ()) -> LLMBackend:
+        """Healthy backend serving the model with the fewest in-flight requests"""
+        self.ensure_available(model, exclude)
+        candidates = self.candidates(model, exclude)
+        
+        # Предпочитаем бэкенды, не упершиеся в свой адаптивный лимит
+        with_capacity = [backend for backend in candidates if backend.has_capacity(model)]
+        return min(with_capacity or candidates, key=lambda backend: (backend.in_flight, backend.total_requests))
+    
+    def capacity(self, model: str) -> int:
+        """Sum of current limits of healthy backends serving the model"""
+        return sum(backend.limit(model).current for backend in self.candidates(model))
+    
+    @asynccontextmanager
+    async def track(self, backend: LLMBackend, model: str):
+        """Count a request as outstanding and feed its latency to the adaptive limit"""
+        call = BackendCall(backend, model)
+        backend.in_flight += 1
+        backend.model_in_flight[model] = backend.model_in_flight.get(model, 0) + 1
+        backend.total_requests += 1
+        backend.breaker(model).on_call_start()
+        started = time.monotonic()
+        try:
+            yield call
+        except asyncio.CancelledError:
+            # Отмененный запрос (например, проигравший хедж) ничего не говорит о бэкенде
+            call.cancelled = True
+            backend.breaker(model).on_call_cancelled()
+            raise
+        except Exception:
+            call.failed = True
+            raise
+        finally:
+            backend.in_flight -= 1
+            backend.model_in_flight[model] -= 1
+            if not call.cancelled:
+                backend.limit(model).on_sample(time.monotonic() - started, call.failed)
+                backend.breaker(model).record(not call.failed)
+    
+    async def check_backend(self, backend: LLMBackend) -> bool:
+        try:
+            response = await backend.client.get("/v1/models", timeout=settings.llm_connect_timeout)
+            if response.status_code != 200:
+                raise RuntimeError(f"status {response.status_code}")
+            
+            models = {item["id"] for item in response.json().get("data", []) if "id" in item}
+            if models:
+                backend.discovered_models = models
+            
+            if not backend.healthy:
+                print(f"LLM backend back in rotation: {backend.url}")
+            backend.healthy = True
+            backend.failed_checks = 0
+            backend.last_error = None
+            return True
+        except Exception as e:
+            backend.failed_checks += 1
+            backend.last_error = str(e) or e.__class__.__name__
+            if backend.healthy and backend.failed_checks >= self.failure_threshold:
+                backend.healthy = False
+                print(f"LLM backend removed from rotation: {backend.url} ({backend.last_error})")
+            return False
+    
+    async def check_health(self) -> bool:
+        """Ping every backend; True if at least one is healthy"""
+        results = await asyncio.gather(*(self.check_backend(backend) for backend in self.backends))
+        return any(results)
+    
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_health()
+            except Exception as e:
+                print(f"LLM health check failed: {e}")
+    
+    def get_status(self) -> List[dict]:
+        return [backend.get_status() for backend in self.backends]
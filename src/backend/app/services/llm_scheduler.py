@@ -0,0 +1,205 @@
+# src/backend/app/services/llm_scheduler.py
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, List, Optional
+from app.core.config import settings
+
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+
+# Меньше - раньше: интерактивные запросы всегда обгоняют пакетные
+PRIORITY_RANKS = {
+    PRIORITY_INTERACTIVE: 0,
+    PRIORITY_BATCH: 1,
+}
+
+
+class QueueFullError(Exception):
+    """Raised when the LLM queue is full; retry_after is a hint in seconds"""
+    
+    def __init__(self, retry_after: int, message: str = "LLM queue is full"):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    
+    __slots__ = ("user_id", "priority", "start_tag", "finish_tag", "future", "enqueued_at")
+    
+    def __init__(self, user_id: str, priority: str, start_tag: float, finish_tag: float, future: asyncio.Future):
+        self.user_id = user_id
+        self.priority = priority
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class _ModelQueue:
+    """Start-time fair queue with a concurrency limit for one model"""
+    
+    def __init__(self, model: str):
+        self.model = model
+        self.active = 0
+        self.heap: List[tuple] = []
+        self.queued = 0
+        self.virtual_time = 0.0
+        self.user_finish: Dict[str, float] = {}
+        self.wait_samples: Deque[float] = deque(maxlen=500)
+        self.service_samples: Deque[float] = deque(maxlen=100)
+        self.completed = 0
+        self.rejected = 0
+
+
+class LLMScheduler:
+    """Per-model concurrency limits with weighted fair queuing across users.
+    
+    Each model has its own limit and queue. Inside a queue requests are
+    ordered by priority class first, then by virtual finish time: every
+    request of a user advances that user's finish tag by 1/weight, so a
+    user with many queued requests cannot starve the others.
+    """
+    
+    def __init__(self, limit_provider: Optional[Callable[[str], int]] = None):
+        self.queues: Dict[str, _ModelQueue] = {}
+        self.max_queue_size = settings.llm_queue_max_size
+        self.limit_provider = limit_provider or self._configured_limit
+        self._seq = itertools.count()
+    
+    def _configured_limit(self, model: str) -> int:
+        return settings.llm_model_concurrency.get(model, settings.llm_default_concurrency)
+    
+    def _queue(self, model: str) -> _ModelQueue:
+        queue = self.queues.get(model)
+        if queue is None:
+            queue = self.queues[model] = _ModelQueue(model)
+        return queue
+    
+    def _weight(self, user_id: str) -> float:
+        return max(float(settings.llm_user_weights.get(user_id, 1.0)), 0.01)
+    
+    def total_queued(self) -> int:
+        return sum(queue.queued for queue in self.queues.values())
+    
+    def retry_after(self, model: str) -> int:
+        """Estimate seconds until a queue slot frees up"""
+        queue = self._queue(model)
+        avg_service = (
+            sum(queue.service_samples) / len(queue.service_samples)
+            if queue.service_samples else settings.llm_read_timeout / 3
+        )
+        limit = max(self.limit_provider(model), 1)
+        estimate = math.ceil((queue.queued + 1) / limit * avg_service)
+        return min(max(estimate, 1), 120)
+    
+    def ensure_capacity(self, model: str):
+        """Fail fast with QueueFullError if a new request could not be queued"""
+        if self.total_queued() >= self.max_queue_size:
+            self._queue(model).rejected += 1
+            raise QueueFullError(self.retry_after(model))
+    
+    async def acquire(self, model: str, user_id: Optional[str], priority: str = PRIORITY_INTERACTIVE) -> float:
+        """Wait for a slot; returns time spent in queue"""
+        queue = self._queue(model)
+        user_id = user_id or "anonymous"
+        
+        if queue.active < self.limit_provider(model) and queue.queued == 0:
+            queue.active += 1
+            queue.wait_samples.append(0.0)
+            return 0.0
+        
+        self.ensure_capacity(model)
+        
+        start_tag = max(queue.virtual_time, queue.user_finish.get(user_id, 0.0))
+        finish_tag = start_tag + 1.0 / self._weight(user_id)
+        queue.user_finish[user_id] = finish_tag
+        
+        waiter = _Waiter(user_id, priority, start_tag, finish_tag, asyncio.get_running_loop().create_future())
+        rank = PRIORITY_RANKS.get(priority, PRIORITY_RANKS[PRIORITY_BATCH])
+        heapq.heappush(queue.heap, (rank, finish_tag, next(self._seq), waiter))
+        queue.queued += 1
+        
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Слот уже выдан, но ждавший ушел - возвращаем его
+                self.release(model)
+            else:
+                waiter.future.cancel()
+                queue.queued -= 1
+            raise
+        
+        wait_time = time.monotonic() - waiter.enqueued_at
+        queue.wait_samples.append(wait_time)
+        return wait_time
+    
+    def release(self, model: str, service_time: Optional[float] = None):
+        """Return a slot and hand it to the next waiter"""
+        queue = self._queue(model)
+        queue.active -= 1
+        queue.completed += 1
+        if service_time is not None:
+            queue.service_samples.append(service_time)
+        self._dispatch(model)
+    
+    def _dispatch(self, model: str):
+        queue = self._queue(model)
+        limit = self.limit_provider(model)
+        
+        while queue.heap and queue.active < limit:
+            _, _, _, waiter = heapq.heappop(queue.heap)
+            if waiter.future.done():
+                continue  # Отмененный ожидающий
+            
+            queue.queued -= 1
+            queue.active += 1
+            queue.virtual_time = max(queue.virtual_time, waiter.start_tag)
+            waiter.future.set_result(None)
+        
+        if not queue.heap:
+            # Очередь пуста - сбрасываем виртуальное время, чтобы теги не росли бесконечно
+            queue.virtual_time = 0.0
+            queue.user_finish.clear()
+    
+    @asynccontextmanager
+    async def slot(self, model: str, user_id: Optional[str] = None, priority: str = PRIORITY_INTERACTIVE):
+        """Hold a model slot for the duration of the block"""
+        wait_time = await self.acquire(model, user_id, priority)
+        if wait_time > 0.1:
+            print(f"LLM queue wait for {model}: {wait_time:.2f}s (user={user_id}, priority={priority})")
+        
+        started = time.monotonic()
+        try:
+            yield wait_time
+        finally:
+            self.release(model, time.monotonic() - started)
+    
+    def get_metrics(self) -> dict:
+        """Queue depth, limits and queue wait statistics per model"""
+        models = {}
+        for model, queue in self.queues.items():
+            waits = sorted(queue.wait_samples)
+            models[model] = {
+                "limit": self.limit_provider(model),
+                "active": queue.active,
+                "queued": queue.queued,
+                "completed": queue.completed,
+                "rejected": queue.rejected,
+                "queue_wait_avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                "queue_wait_p50": round(waits[len(waits) // 2], 3) if waits else 0.0,
+                "queue_wait_p95": round(waits[min(int(len(waits) * 0.95), len(waits) - 1)], 3) if waits else 0.0,
+                "queue_wait_max": round(waits[-1], 3) if waits else 0.0,
+            }
+        
+        return {
+            "max_queue_size": self.max_queue_size,
+            "total_queued": self.total_queued(),
+            "models": models
+        }
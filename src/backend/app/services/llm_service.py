@@ -1,93 +1,518 @@
 # src/backend/app/services/llm_service.py
 import asyncio
+import json
+import time
 import httpx
-from typing import Optional
+from typing import AsyncIterator, Iterable, Optional
 from app.core.config import settings
-from app.utils.prompt_templates import get_prompt_template
-from app.utils.mermaid_validator import validate_mermaid_syntax, clean_mermaid_code
+from app.utils.prompt_templates import get_prompt_template, get_repair_prompt, SYSTEM_MESSAGE
+from app.utils.mermaid_validator import clean_mermaid_code, MermaidStreamWatchdog
+from app.utils.mermaid_fixer import repair_mermaid_code, mermaid_fixer
+from app.utils.content_cache import get_content_cache_status
+from app.services.context_budget import token_estimator, context_budget_manager
+from app.services.llm_scheduler import LLMScheduler, PRIORITY_INTERACTIVE
+from app.services.llm_router import LLMRouter, LLMBackend, NoBackendAvailableError
+from app.services.hedging import LatencyTracker, HedgeBudget
+from app.services.circuit_breaker import CircuitOpenError
+
+
+class Completion:
+    """Text of one completion plus what the API reported about it"""
+    
+    __slots__ = ("content", "completion_tokens", "finish_reason", "prompt_tokens")
+    
+    def __init__(
+        self,
+        content: str,
+        completion_tokens: Optional[int] = None,
+        finish_reason: Optional[str] = None,
+        prompt_tokens: Optional[int] = None
+    ):
+        self.content = content
+        self.completion_tokens = completion_tokens
+        self.finish_reason = finish_reason
+        self.prompt_tokens = prompt_tokens
+    
+    @property
+    def truncated(self) -> bool:
+        return self.finish_reason == "length"
+    
+    def output_tokens(self) -> int:
+        """Reported completion tokens, or an estimate from text length"""
+        if self.completion_tokens is not None:
+            return self.completion_tokens
+        return estimate_tokens(self.content)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for models that do not report usage"""
+    return max(int(len(text) / settings.llm_chars_per_token), 1) if text else 0
+
+
+class LLMAPIError(Exception):
+    """Non-200 answer from the completions endpoint"""
+    
+    def __init__(self, status_code: int):
+        super().__init__(f"LLM API error: {status_code}")
+        self.status_code = status_code
 
 
 class LLMService:
     
     def __init__(self):
-        self.base_url = settings.llm_api_url
-        self.semaphore = asyncio.Semaphore(2)  # Максимум 2 параллельных запроса к LLM
-        self.request_queue = asyncio.Queue(maxsize=50)
+        self.router = LLMRouter()  # Несколько бэкендов LM Studio с балансировкой
+        self.base_url = self.router.backends[0].url
+        # Лимиты по моделям и честная очередь между пользователями
+        self.scheduler = LLMScheduler(limit_provider=self._model_limit)
+        self.latency = LatencyTracker()
+        self.hedge_budget = HedgeBudget(settings.llm_hedge_budget_percent)
+        self.watchdog_stats = {"completed_at_fence": 0, "aborted_invalid": 0}
+    
+    def _model_limit(self, model: str) -> int:
+        """Sum of adaptive limits of healthy backends serving the model"""
+        return max(self.router.capacity(model), 1)
+    
+    def _create_client(self, base_url: str) -> httpx.AsyncClient:
+        """Create pooled HTTP client configured from settings"""
+        limits = httpx.Limits(
+            max_connections=settings.llm_max_connections,
+            max_keepalive_connections=settings.llm_max_keepalive_connections,
+            keepalive_expiry=settings.llm_keepalive_expiry
+        )
+        timeout = httpx.Timeout(
+            connect=settings.llm_connect_timeout,
+            read=settings.llm_read_timeout,
+            write=settings.llm_write_timeout,
+            pool=settings.llm_pool_timeout
+        )
+        
+        http2 = settings.llm_http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                print("HTTP/2 requested but 'h2' package is not installed, falling back to HTTP/1.1")
+                http2 = False
+        
+        return httpx.AsyncClient(
+            base_url=base_url,
+            limits=limits,
+            timeout=timeout,
+            http2=http2
+        )
+    
+    async def start(self):
+        """Open shared HTTP clients and start backend health checks (called on app startup)"""
+        await self.router.start(self._create_client)
+        print(
+            f"LLM HTTP clients started: {[backend.url for backend in self.router.backends]}, "
+            f"max_connections={settings.llm_max_connections}, "
+            f"keepalive={settings.llm_max_keepalive_connections}, http2={settings.llm_http2}"
+        )
+    
+    async def close(self):
+        """Stop health checks and close HTTP clients (called on app shutdown)"""
+        await self.router.close()
+        print("LLM HTTP clients closed")
+    
+    def _pick_backend(self, model: str, exclude: Iterable[LLMBackend] = ()) -> LLMBackend:
+        """Pick backend for model, creating clients lazily if startup hook was not run"""
+        self.router.ensure_clients(self._create_client)
+        return self.router.pick(model, exclude)
     
     async def test_connection(self) -> bool:
-        """Test connection to LM Studio"""
+        """Test connection to LM Studio backends"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.base_url}/v1/models", timeout=10)
-                print(f"LM Studio connection test: {response.status_code}")
-                return response.status_code == 200
+            self.router.ensure_clients(self._create_client)
+            is_connected = await self.router.check_health()
+            print(f"LM Studio connection test: {sum(b.healthy for b in self.router.backends)}/{len(self.router.backends)} backends healthy")
+            return is_connected
         except Exception as e:
             print(f"LM Studio connection failed: {e}")
             return False
     
+    def _build_payload(
+        self,
+        user_input: str,
+        diagram_type: str,
+        model: str,
+        stream: bool,
+        max_tokens: Optional[int] = None,
+        examples: Optional[list] = None
+    ) -> dict:
+        """Build chat completion payload for diagram generation"""
+        prompt = get_prompt_template(diagram_type, user_input, examples)
+        return self._chat_payload(prompt, model, stream, max_tokens)
+    
+    def _build_repair_payload(
+        self,
+        user_input: str,
+        diagram_type: str,
+        model: str,
+        code: str,
+        error: str,
+        max_tokens: Optional[int] = None
+    ) -> dict:
+        """Build a short follow-up payload asking the model to fix its invalid output"""
+        prompt = get_repair_prompt(diagram_type, user_input, code, error)
+        return self._chat_payload(prompt, model, False, max_tokens)
+    
+    def _chat_payload(
+        self,
+        prompt: str,
+        model: str,
+        stream: bool,
+        max_tokens: Optional[int] = None,
+        system: str = SYSTEM_MESSAGE
+    ) -> dict:
+        payload = {
+            "model": model,  # Используем выбранную модель
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_tokens or settings.llm_default_max_tokens,
+            "temperature": 0.1,  # Понизили для более предсказуемых результатов
+            "stream": stream
+        }
+        
+        if settings.llm_stop_sequences:
+            payload["stop"] = settings.llm_stop_sequences  # Останавливаемся на закрывающем ```
+        
+        return payload
+    
+    async def stream_diagram(
+        self,
+        user_input: str,
+        diagram_type: str,
+        model: Optional[str] = None,
+        user_id: Optional[str] = None,
+        priority: str = PRIORITY_INTERACTIVE,
+        max_tokens: Optional[int] = None,
+        examples: Optional[list] = None
+    ) -> AsyncIterator[str]:
+        """Stream raw completion text deltas from LM Studio (no retries)"""
+        
+        selected_model = model or settings.default_model
+        print(f"Streaming with model: {selected_model}")
+        
+        payload = self._build_payload(
+            user_input, diagram_type, selected_model, stream=True, max_tokens=max_tokens, examples=examples
+        )
+        self.router.ensure_available(selected_model)
+        
+        async with self.scheduler.slot(selected_model, user_id, priority):
+            backend = self._pick_backend(selected_model)
+            async with self.router.track(backend, selected_model) as call, \
+                    backend.client.stream("POST", "/v1/chat/completions", json=payload) as response:
+                if response.status_code != 200:
+                    call.failed = True
+                    await response.aread()
+                    raise LLMAPIError(response.status_code)
+                
+                async for chunk in self._iter_stream_chunks(response):
+                    delta = chunk["choices"][0].get("delta", {}).get("content") if chunk.get("choices") else None
+                    if delta:
+                        yield delta
+    
+    async def _iter_stream_chunks(self, response: httpx.Response) -> AsyncIterator[dict]:
+        """Parse SSE lines of a streaming completion into chunk dicts"""
+        finished = False
+        async for line in response.aiter_lines():
+            # После [DONE] тело дочитываем до конца - иначе httpx закроет соединение вместо возврата в пул
+            if finished or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                finished = True
+                continue
+            
+            try:
+                yield json.loads(data)
+            except ValueError:
+                continue
+    
+    async def _stream_completion(
+        self,
+        backend: LLMBackend,
+        model: str,
+        payload: dict,
+        diagram_type: str,
+        abort_invalid: bool = True
+    ) -> Completion:
+        """Stream a completion through the validity watchdog.
+        
+        Output that cannot pass validation is cut off right away. After the
+        closing fence the rest of the stream is still read (the stop
+        sequence ends it shortly), since leaving the stream early closes
+        the connection instead of returning it to the pool.
+        """
+        payload = dict(payload, stream=True, stream_options={"include_usage": True})
+        watchdog = MermaidStreamWatchdog(diagram_type, settings.llm_watchdog_max_preamble)
+        parts = []
+        completion_tokens = None
+        prompt_tokens = None
+        finish_reason = None
+        verdict = MermaidStreamWatchdog.CONTINUE
+        started = time.monotonic()
+        
+        async with self.router.track(backend, model) as call, \
+                backend.client.stream("POST", "/v1/chat/completions", json=payload) as response:
+            if response.status_code != 200:
+                call.failed = True
+                await response.aread()
+                raise LLMAPIError(response.status_code)
+            
+            async for chunk in self._iter_stream_chunks(response):
+                if chunk.get("usage"):
+                    completion_tokens = chunk["usage"].get("completion_tokens", completion_tokens)
+                    prompt_tokens = chunk["usage"].get("prompt_tokens", prompt_tokens)
+                if not chunk.get("choices"):
+                    continue
+                
+                choice = chunk["choices"][0]
+                finish_reason = choice.get("finish_reason") or finish_reason
+                delta = (choice.get("delta") or {}).get("content")
+                if not delta or verdict == MermaidStreamWatchdog.COMPLETE:
+                    continue  # После закрывающего ``` текст не нужен, но поток дочитываем
+                
+                parts.append(delta)
+                verdict = watchdog.feed(delta)
+                if verdict == MermaidStreamWatchdog.INVALID and not abort_invalid:
+                    verdict = MermaidStreamWatchdog.CONTINUE  # Последняя попытка - дочитываем ответ целиком
+                if verdict == MermaidStreamWatchdog.INVALID:
+                    # Выход из контекста закрывает соединение - сервер прекращает генерацию
+                    break
+        
+        content = "".join(parts)
+        if verdict == MermaidStreamWatchdog.COMPLETE:
+            self.watchdog_stats["completed_at_fence"] += 1
+            finish_reason = "stop"
+        elif verdict == MermaidStreamWatchdog.INVALID:
+            self.watchdog_stats["aborted_invalid"] += 1
+            finish_reason = "watchdog_invalid"
+            print(f"Watchdog stopped {model} after {len(content)} chars: {watchdog.reason}")
+        
+        if verdict != MermaidStreamWatchdog.INVALID:
+            # Оборванные watchdog ответы короче настоящих и занизили бы задержку хеджирования
+            self.latency.record(model, time.monotonic() - started)
+        if completion_tokens is None or verdict == MermaidStreamWatchdog.INVALID:
+            completion_tokens = estimate_tokens(content)
+        return Completion(content, completion_tokens, finish_reason, prompt_tokens)
+    
+    async def _post_completion(
+        self,
+        backend: LLMBackend,
+        model: str,
+        payload: dict,
+        diagram_type: Optional[str] = None,
+        abort_invalid: bool = True
+    ) -> Completion:
+        """Send one completion to a backend (streamed through the watchdog when enabled)"""
+        if diagram_type and settings.llm_stream_watchdog:
+            return await self._stream_completion(backend, model, payload, diagram_type, abort_invalid)
+        
+        started = time.monotonic()
+        async with self.router.track(backend, model) as call:
+            response = await backend.client.post("/v1/chat/completions", json=payload)
+            call.failed = response.status_code != 200
+        
+        if response.status_code != 200:
+            raise LLMAPIError(response.status_code)
+        
+        self.latency.record(model, time.monotonic() - started)
+        data = response.json()
+        choice = data["choices"][0]
+        usage = data.get("usage") or {}
+        return Completion(
+            choice["message"]["content"],
+            usage.get("completion_tokens"),
+            choice.get("finish_reason"),
+            usage.get("prompt_tokens")
+        )
+    
+    async def _complete(
+        self,
+        model: str,
+        payload: dict,
+        diagram_type: str,
+        hedge: bool,
+        abort_invalid: bool = True
+    ) -> Completion:
+        """Run completion, hedging to a second backend if the first one is slow"""
+        self.hedge_budget.record_request()
+        primary_backend = self._pick_backend(model)
+        primary = asyncio.ensure_future(self._post_completion(primary_backend, model, payload, diagram_type, abort_invalid))
+        pending = {primary}
+        
+        # Все ожидание внутри try: при отмене вызывающего (клиент отключился, отмена пакета)
+        # запросы к бэкендам не должны продолжаться после освобождения слота планировщика
+        try:
+            hedge_delay = None
+            if hedge:
+                hedge_delay = self.latency.percentile(
+                    model, settings.llm_hedge_percentile, settings.llm_hedge_min_samples
+                )
+            if hedge_delay is None:
+                return await primary
+            
+            done, pending = await asyncio.wait(pending, timeout=hedge_delay)
+            if done:
+                return primary.result()
+            
+            try:
+                hedge_backend = self._pick_backend(model, exclude=[primary_backend])
+            except (NoBackendAvailableError, CircuitOpenError):
+                return await primary
+            if not self.hedge_budget.try_acquire():
+                return await primary
+            
+            print(f"Hedging {model}: no answer from {primary_backend.url} after {hedge_delay:.2f}s, duplicating to {hedge_backend.url}")
+            secondary = asyncio.ensure_future(self._post_completion(hedge_backend, model, payload, diagram_type, abort_invalid))
+            pending = {primary, secondary}
+            fallback = None
+            first_error = None
+            
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        first_error = first_error or task.exception()
+                        continue
+                    
+                    completion = task.result()
+                    _, is_valid, _, _ = repair_mermaid_code(clean_mermaid_code(completion.content), diagram_type)
+                    if is_valid:
+                        if task is secondary:
+                            self.hedge_budget.hedges_won += 1
+                        return completion
+                    fallback = fallback if fallback is not None else completion
+            
+            if fallback is not None:
+                return fallback
+            raise first_error
+        finally:
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+    
     async def generate_diagram(
         self, 
         user_input: str, 
         diagram_type: str, 
         model: Optional[str] = None,  # Добавляем параметр модели
-        max_retries: int = 2
+        max_retries: int = 2,
+        user_id: Optional[str] = None,
+        priority: str = PRIORITY_INTERACTIVE,
+        hedge: Optional[bool] = None,
+        max_tokens: Optional[int] = None,
+        stats: Optional[dict] = None,
+        retry_strategy: Optional[str] = None,
+        examples: Optional[list] = None
     ) -> Optional[str]:
-        """Generate diagram with queue and retry logic"""
+        """Generate diagram with queue and retry logic.
+        
+        Invalid results are retried per retry_strategy ("repair" sends the
+        previous output and validator error back, "resample" repeats the
+        original prompt). examples are (prompt, code) few-shot pairs put
+        before the task. If stats is given it is filled with attempts,
+        input/output tokens, max_tokens, truncated and repairs for logging.
+        """
         
         # Используем переданную модель или дефолтную
         selected_model = model or settings.default_model
         print(f"Using model: {selected_model}")
         
-        async with self.semaphore:  # Ограничиваем параллельность
+        if hedge is None:
+            hedge = settings.llm_hedging_enabled
+        
+        max_tokens = max_tokens or settings.llm_default_max_tokens
+        retry_strategy = retry_strategy or settings.llm_retry_strategy
+        if stats is None:
+            stats = {}
+        stats.update({
+            "attempts": 0, "output_tokens": 0, "input_tokens": 0, "max_tokens": max_tokens,
+            "truncated": False, "retry_strategy": retry_strategy, "repairs": 0,
+            "few_shot_examples": len(examples or [])
+        })
+        repair = None  # (код, ошибка) предыдущей невалидной попытки
+        
+        # При открытом breaker отказываем сразу, не занимая место в очереди
+        self.router.ensure_available(selected_model)
+        
+        async with self.scheduler.slot(selected_model, user_id, priority):  # Ограничиваем параллельность
             for attempt in range(max_retries + 1):
                 try:
                     print(f"LLM request attempt {attempt + 1}/{max_retries + 1}")
                     
-                    prompt = get_prompt_template(diagram_type, user_input)
+                    if repair:
+                        payload = self._build_repair_payload(
+                            user_input, diagram_type, selected_model, *repair, max_tokens=max_tokens
+                        )
+                        stats["repairs"] += 1
+                    else:
+                        payload = self._build_payload(
+                            user_input, diagram_type, selected_model, stream=False,
+                            max_tokens=max_tokens, examples=examples
+                        )
+                    stats["attempts"] = attempt + 1
+                    stats["max_tokens"] = max_tokens
+                    prompt_text = "".join(m["content"] for m in payload["messages"])
+                    prompt_estimate = token_estimator.estimate(prompt_text, selected_model)
+                    stats["input_tokens"] += prompt_estimate
                     
-                    payload = {
-                        "model": selected_model,  # Используем выбранную модель
-                        "messages": [
-                            {"role": "system", "content": "You are an expert at creating Mermaid diagrams. Always follow the exact format requirements and return only the mermaid code."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        "max_tokens": 500,  # Уменьшили для ускорения
-                        "temperature": 0.1,  # Понизили для более предсказуемых результатов
-                        "stream": False
-                    }
+                    completion = await self._complete(
+                        selected_model, payload, diagram_type, hedge,
+                        abort_invalid=attempt < max_retries
+                    )
+                    repair = None
+                    # Калибруем оценку токенов по фактическому размеру промпта
+                    token_estimator.observe(selected_model, prompt_text, completion.prompt_tokens)
+                    stats["output_tokens"] += completion.output_tokens()
+                    stats["truncated"] = completion.truncated
                     
-                    timeout = httpx.Timeout(45.0)  # Увеличили timeout
+                    # Clean, fix locally and validate - к LLM возвращаемся, только если правила не помогли
+                    cleaned_code = clean_mermaid_code(completion.content)
+                    cleaned_code, is_valid, error = mermaid_fixer.fix_and_validate(
+                        cleaned_code, diagram_type, retry_pending=attempt < max_retries
+                    )
                     
-                    async with httpx.AsyncClient(timeout=timeout) as client:
-                        response = await client.post(
-                            f"{self.base_url}/v1/chat/completions",
-                            json=payload
-                        )
-                        
-                        if response.status_code == 200:
-                            data = response.json()
-                            raw_content = data["choices"][0]["message"]["content"]
-                            
-                            # Clean and validate the generated code
-                            cleaned_code = clean_mermaid_code(raw_content)
-                            is_valid, error = validate_mermaid_syntax(cleaned_code, diagram_type)
-                            
-                            if is_valid or attempt == max_retries:  # Возвращаем результат на последней попытке
-                                print(f"Generated {diagram_type} diagram with {selected_model}: valid={is_valid}, length={len(cleaned_code)}")
-                                return cleaned_code
-                            else:
-                                print(f"Invalid result on attempt {attempt + 1}, retrying...")
-                                await asyncio.sleep(1)  # Пауза перед повтором
-                                continue
-                        else:
-                            print(f"LLM API error on attempt {attempt + 1}: {response.status_code}")
-                            if attempt < max_retries:
-                                await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                                continue
-                            else:
-                                return None
-                                
-                except asyncio.TimeoutError:
+                    if is_valid or attempt == max_retries:  # Возвращаем результат на последней попытке
+                        print(f"Generated {diagram_type} diagram with {selected_model}: valid={is_valid}, length={len(cleaned_code)}")
+                        return cleaned_code
+                    elif retry_strategy == "repair" and cleaned_code.strip() \
+                            and completion.finish_reason not in ("length", "watchdog_invalid"):
+                        # Отдаём модели её же ответ и точную ошибку - короткий запрос вместо полного шаблона.
+                        # Обрезанный или оборванный ответ чинить нечего - для него обычный повтор
+                        print(f"Invalid result on attempt {attempt + 1} ({error}), asking model to repair...")
+                        repair = (cleaned_code, error)
+                        continue
+                    elif completion.finish_reason == "watchdog_invalid":
+                        # Генерация уже оборвана - повторяем сразу, без паузы
+                        print(f"Invalid output stopped early on attempt {attempt + 1}, retrying immediately...")
+                        continue
+                    else:
+                        print(f"Invalid result on attempt {attempt + 1}, retrying...")
+                        if completion.truncated:
+                            # Ответ обрезан по max_tokens - повторять с тем же бюджетом бессмысленно
+                            # ...но не больше, чем остается в окне контекста после промпта
+                            room = context_budget_manager.usable_tokens(selected_model) - prompt_estimate
+                            max_tokens = max(min(int(max_tokens * 1.5), settings.llm_max_tokens_ceiling, room), max_tokens)
+                            print(f"Output truncated, raising max_tokens to {max_tokens}")
+                        await asyncio.sleep(1)  # Пауза перед повтором
+                        continue
+                
+                except CircuitOpenError as e:
+                    print(f"Circuit open for {selected_model} on attempt {attempt + 1}: {e}")
+                    raise
+                except LLMAPIError as e:
+                    print(f"LLM API error on attempt {attempt + 1}: {e.status_code}")
+                    if attempt < max_retries:
+                        await asyncio.sleep(2 ** attempt)  # Exponential backoff
+                        continue
+                    else:
+                        return None
+                except (asyncio.TimeoutError, httpx.TimeoutException):
                     print(f"Timeout on attempt {attempt + 1}")
                     if attempt < max_retries:
                         await asyncio.sleep(5)  # Пауза при таймауте
@@ -103,6 +528,73 @@ class LLMService:
                         return None
             
             return None
+    
+    async def complete_text(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        system: str = SYSTEM_MESSAGE,
+        user_id: Optional[str] = None,
+        priority: str = PRIORITY_INTERACTIVE,
+        max_tokens: Optional[int] = None,
+        stats: Optional[dict] = None
+    ) -> Optional[str]:
+        """Single completion whose answer is not a diagram (e.g. edit operations).
+        
+        Goes through the same breaker and scheduler as diagram generation but
+        without the watchdog, validation or retries - the caller checks the
+        answer and decides on a fallback. Returns None on API errors and
+        timeouts; stats gets input/output tokens and truncated.
+        """
+        selected_model = model or settings.default_model
+        payload = self._chat_payload(prompt, selected_model, False, max_tokens, system=system)
+        prompt_text = system + prompt
+        if stats is None:
+            stats = {}
+        stats.update({
+            "attempts": 1, "input_tokens": token_estimator.estimate(prompt_text, selected_model),
+            "output_tokens": 0, "max_tokens": payload["max_tokens"], "truncated": False
+        })
+        
+        self.router.ensure_available(selected_model)
+        
+        async with self.scheduler.slot(selected_model, user_id, priority):
+            try:
+                completion = await self._complete(selected_model, payload, None, hedge=False)
+            except CircuitOpenError:
+                raise
+            except LLMAPIError as e:
+                print(f"LLM API error: {e.status_code}")
+                return None
+            except (asyncio.TimeoutError, httpx.TimeoutException):
+                print(f"Timeout waiting for {selected_model}")
+                return None
+            except Exception as e:
+                print(f"LLM request failed: {e}")
+                return None
+        
+        token_estimator.observe(selected_model, prompt_text, completion.prompt_tokens)
+        stats["output_tokens"] = completion.output_tokens()
+        stats["truncated"] = completion.truncated
+        return completion.content
+    
+    def get_circuit_states(self) -> dict:
+        """Breaker state per backend and model"""
+        return {
+            backend.url: {model: breaker.get_status() for model, breaker in backend.breakers.items()}
+            for backend in self.router.backends
+        }
+    
+    def get_metrics(self) -> dict:
+        """Scheduler state for the health/metrics endpoint"""
+        return {
+            "scheduler": self.scheduler.get_metrics(),
+            "backends": self.router.get_status(),
+            "hedging": self.hedge_budget.get_status(),
+            "watchdog": dict(self.watchdog_stats, enabled=settings.llm_stream_watchdog),
+            "fixer": mermaid_fixer.get_status(),
+            "content_caches": get_content_cache_status()
+        }
 
 
 llm_service = LLMService()
@@ -0,0 +1,141 @@
+# src/backend/app/services/single_flight.py
+import asyncio
+import json
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from app.core.config import settings
+from app.core.database import get_redis
+
+
+# Удаляем lock только если он все еще наш
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """Coalesce concurrent identical generations into one LLM call.
+    
+    Within a process, callers with the same key await one shared task.
+    The task is shielded, so a cancelled caller (leader or follower) never
+    cancels the work the others are waiting on. With redis_lock enabled a
+    Redis lock extends this across workers: only the lock holder calls the
+    LLM and publishes the outcome under its lock token, other nodes wait
+    for it. A node that cannot get the outcome (leader failed, timeout,
+    Redis error) runs the generation itself.
+    """
+    
+    LOCK_PREFIX = "singleflight:lock:"
+    RESULT_PREFIX = "singleflight:result:"
+    MAX_ROUNDS = 5  # Попыток стать лидером или дождаться его, потом генерируем сами
+    
+    def __init__(self):
+        self.calls: Dict[str, asyncio.Task] = {}
+        self.redis_lock = settings.single_flight_redis_lock
+        self.lock_ttl = settings.single_flight_lock_ttl
+        self.poll_interval = settings.single_flight_poll_interval
+    
+    async def do(self, key: str, fn: Callable[[], Awaitable[Optional[str]]]) -> Tuple[Optional[str], bool]:
+        """Run fn once per key; returns (result, shared) where shared means we followed another call"""
+        task = self.calls.get(key)
+        shared = task is not None
+        
+        if task is None:
+            task = asyncio.ensure_future(self._run(key, fn))
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            print(f"Single-flight: joining in-flight generation {key[:12]}")
+        
+        result = await asyncio.shield(task)
+        return result, shared
+    
+    def _forget(self, key: str, task: asyncio.Task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        # Забираем исключение, чтобы не было "Task exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+    
+    async def _run(self, key: str, fn: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        if not self.redis_lock:
+            return await fn()
+        
+        try:
+            redis = get_redis()
+        except Exception:
+            redis = None
+        if redis is None:
+            return await fn()
+        
+        lock_key = self.LOCK_PREFIX + key
+        token = uuid.uuid4().hex
+        
+        for _ in range(self.MAX_ROUNDS):
+            try:
+                acquired = await redis.set(lock_key, token, nx=True, ex=self.lock_ttl)
+                leader_token = None if acquired else await redis.get(lock_key)
+            except Exception as e:
+                print(f"Single-flight lock unavailable, running locally: {e}")
+                return await fn()
+            
+            if acquired:
+                return await self._lead(redis, lock_key, token, fn)
+            if leader_token is None:
+                continue  # Lock освободился между SET и GET - пробуем еще раз
+            
+            try:
+                outcome = await asyncio.wait_for(
+                    self._follow(redis, lock_key, leader_token.decode()), timeout=self.lock_ttl
+                )
+            except Exception as e:
+                outcome = {"error": str(e) or e.__class__.__name__}
+            
+            if outcome is None:
+                continue  # Lock пропал без результата (лидер упал) - пробуем стать лидером сами
+            if outcome.get("error"):
+                # Не дождались результата другого узла - генерируем сами, а не отдаем чужую ошибку
+                print(f"Single-flight: no result from another worker ({outcome['error']}), running locally")
+                return await fn()
+            return outcome.get("result")
+        
+        print(f"Single-flight: lock for {key[:12]} keeps changing hands, running locally")
+        return await fn()
+    
+    async def _lead(self, redis, lock_key: str, token: str, fn) -> Optional[str]:
+        outcome = {}
+        try:
+            result = await fn()
+            outcome = {"result": result}
+            return result
+        except Exception as e:
+            outcome = {"error": str(e) or e.__class__.__name__}
+            raise
+        finally:
+            try:
+                if outcome:
+                    # Результат по токену лидера: последователи следующего лидера его не увидят
+                    await redis.set(self.RESULT_PREFIX + token, json.dumps(outcome), ex=max(int(self.poll_interval * 20), 5))
+                await redis.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+            except Exception as e:
+                print(f"Single-flight failed to publish result: {e}")
+    
+    async def _follow(self, redis, lock_key: str, leader_token: str) -> Optional[dict]:
+        """Wait for the outcome of the leader holding leader_token; None if it vanished without one"""
+        print(f"Single-flight: waiting for generation on another worker {lock_key[len(self.LOCK_PREFIX):][:12]}")
+        result_key = self.RESULT_PREFIX + leader_token
+        while True:
+            raw = await redis.get(result_key)
+            if raw is not None:
+                return json.loads(raw)
+            current = await redis.get(lock_key)
+            if current is None or current.decode() != leader_token:
+                raw = await redis.get(result_key)
+                return json.loads(raw) if raw is not None else None
+            await asyncio.sleep(self.poll_interval)
+
+
+single_flight = SingleFlight()
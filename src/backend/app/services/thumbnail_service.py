@@ -0,0 +1,173 @@
+# src/backend/app/services/thumbnail_service.py
+import asyncio
+import hashlib
+import os
+import re
+from typing import Optional
+from bson import ObjectId
+from app.core.config import settings
+from app.core.database import get_database
+from app.utils.mermaid_canonical import canonicalize_mermaid
+from app.utils.svg_renderer import render_svg, RENDERER_VERSION
+
+THUMBNAIL_KEY_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+
+def thumbnail_url(key: Optional[str]) -> Optional[str]:
+    return f"/diagrams/thumbnails/{key}.svg" if key else None
+
+
+class ThumbnailStore:
+    """Content-addressed SVG files: <root>/<key[:2]>/<key>.svg.
+
+    The key is a hash of the renderer version and the diagram's structural
+    hash, so a file never changes once written and identical diagrams
+    share one file.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @staticmethod
+    def make_key(structural_hash: str) -> str:
+        return hashlib.sha256(f"{RENDERER_VERSION}:{structural_hash}".encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        if not THUMBNAIL_KEY_PATTERN.fullmatch(key):
+            raise ValueError(f"Invalid thumbnail key: {key!r}")
+        return os.path.join(self.root, key[:2], f"{key}.svg")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def write(self, key: str, svg: str):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Запись через временный файл: читатель не увидит недописанный SVG
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(svg)
+        os.replace(tmp_path, path)
+
+
+class ThumbnailService:
+    """Renders dashboard previews in the background.
+
+    DiagramService enqueues a diagram after create/update; workers render
+    the canonical form of its code (identical diagrams -> one file), store
+    it and set thumbnail_key on the diagram. Rendering runs in a thread so
+    large diagrams do not block the event loop.
+    """
+
+    def __init__(self):
+        self.enabled = settings.thumbnail_enabled
+        self.store = ThumbnailStore(settings.thumbnail_dir)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self.rendered = 0
+        self.reused = 0
+        self.unsupported = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def enqueue(self, diagram_id: str, mermaid_code: str, diagram_type: str):
+        """Schedule preview rendering; never blocks the request"""
+        if not self.enabled or self._queue is None:
+            return
+        try:
+            self._queue.put_nowait((diagram_id, mermaid_code, diagram_type))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"Thumbnail queue full, skipping diagram {diagram_id}")
+
+    def _render(self, mermaid_code: str, diagram_type: str) -> Optional[tuple]:
+        """(key, svg or None if already stored), or None if the diagram cannot be rendered"""
+        canonical = canonicalize_mermaid(mermaid_code, diagram_type)
+        key = self.store.make_key(canonical.structural_hash)
+        if self.store.exists(key):
+            return key, None
+        svg = render_svg(canonical.code, diagram_type)
+        if svg is None:
+            return None
+        self.store.write(key, svg)
+        return key, svg
+
+    async def process(self, diagram_id: str, mermaid_code: str, diagram_type: str) -> Optional[str]:
+        """Render (or reuse) the preview of one diagram and link it; returns the key"""
+        result = await asyncio.to_thread(self._render, mermaid_code, diagram_type)
+        if result is None:
+            self.unsupported += 1
+            key = None
+        else:
+            key, svg = result
+            if svg is None:
+                self.reused += 1
+            else:
+                self.rendered += 1
+
+        # Код мог измениться, пока рисовали - тогда ссылку ставит следующая задача
+        await get_database().diagrams.update_one(
+            {"_id": ObjectId(diagram_id), "mermaid_code": mermaid_code},
+            {"$set": {"thumbnail_key": key}}
+        )
+        return key
+
+    async def _worker(self):
+        while True:
+            diagram_id, mermaid_code, diagram_type = await self._queue.get()
+            try:
+                await self.process(diagram_id, mermaid_code, diagram_type)
+            except Exception as e:
+                self.failed += 1
+                print(f"Thumbnail rendering failed for diagram {diagram_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def backfill(self, limit: int):
+        """Enqueue diagrams saved before previews existed"""
+        cursor = get_database().diagrams.find(
+            {"thumbnail_key": {"$exists": False}},
+            {"mermaid_code": 1, "diagram_type": 1}
+        ).limit(limit)
+        count = 0
+        async for diagram in cursor:
+            self.enqueue(str(diagram["_id"]), diagram.get("mermaid_code") or "", diagram.get("diagram_type"))
+            count += 1
+        if count:
+            print(f"Thumbnail backfill: {count} diagrams queued")
+
+    async def start(self):
+        if not self.enabled:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=settings.thumbnail_queue_size)
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(settings.thumbnail_workers)]
+        try:
+            await self.backfill(settings.thumbnail_backfill_limit)
+        except Exception as e:
+            print(f"Thumbnail backfill failed: {e}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def get_status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "rendered": self.rendered,
+            "reused": self.reused,
+            "unsupported": self.unsupported,
+            "failed": self.failed,
+            "dropped": self.dropped
+        }
+
+
+thumbnail_service = ThumbnailService()
@@ -0,0 +1,126 @@
+# src/backend/app/services/token_budget_service.py
+import asyncio
+import math
+from typing import Dict, Optional, Tuple
+from app.core.config import settings
+from app.core.database import get_database
+
+
+class TokenBudgetService:
+    """Picks max_tokens per (model, diagram_type) from past valid generations.
+    
+    Periodically reads recent valid entries of generation_logs, takes the
+    configured percentile of their output size (reported output_tokens,
+    or generated_code length converted to tokens for older logs) and adds
+    headroom. Pairs without enough samples use configured defaults.
+    """
+    
+    def __init__(self):
+        self.budgets: Dict[Tuple[str, str], int] = {}
+        self.sample_counts: Dict[Tuple[str, str], int] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    def default_budget(self, diagram_type: str) -> int:
+        return settings.llm_max_tokens_by_type.get(diagram_type, settings.llm_default_max_tokens)
+    
+    def get_budget(self, model: str, diagram_type: str) -> int:
+        """max_tokens for the next generation"""
+        return self.budgets.get((model, diagram_type), self.default_budget(diagram_type))
+    
+    def _budget_from_samples(self, samples: list) -> int:
+        ordered = sorted(samples)
+        index = min(int(math.ceil(len(ordered) * settings.token_budget_percentile / 100)) - 1, len(ordered) - 1)
+        budget = int(ordered[max(index, 0)] * settings.token_budget_headroom)
+        return min(max(budget, settings.llm_min_max_tokens), settings.llm_max_tokens_ceiling)
+    
+    async def refresh(self):
+        """Recompute budgets from generation_logs"""
+        db = get_database()
+        
+        pipeline = [
+            # Только генерации: у модификаций (операции правки, фрагменты диаграмм) другой размер ответа;
+            # null - логи, записанные до появления request_kind
+            {"$match": {
+                "is_valid": True,
+                "cache_hit": {"$ne": True},
+                "coalesced": {"$ne": True},
+                "request_kind": {"$in": ["generate", None]}
+            }},
+            {"$sort": {"created_at": -1}},
+            {"$limit": settings.token_budget_sample_size},
+            {"$project": {
+                "model": 1,
+                "diagram_type": 1,
+                "output_tokens": 1,
+                "attempts": 1,
+                "code_length": {"$strLenCP": {"$ifNull": ["$generated_code", ""]}}
+            }},
+            {"$group": {
+                "_id": {"model": "$model", "diagram_type": "$diagram_type"},
+                "samples": {"$push": {
+                    "output_tokens": "$output_tokens",
+                    "attempts": "$attempts",
+                    "code_length": "$code_length"
+                }}
+            }}
+        ]
+        
+        budgets = {}
+        counts = {}
+        async for group in db.generation_logs.aggregate(pipeline):
+            model = group["_id"].get("model") or settings.default_model
+            diagram_type = group["_id"].get("diagram_type")
+            
+            samples = []
+            for sample in group["samples"]:
+                if sample.get("output_tokens") and (sample.get("attempts") or 1) == 1:
+                    samples.append(sample["output_tokens"])
+                elif sample.get("code_length"):
+                    samples.append(sample["code_length"] / settings.llm_chars_per_token)
+            
+            counts[(model, diagram_type)] = len(samples)
+            if len(samples) >= settings.token_budget_min_samples:
+                budgets[(model, diagram_type)] = self._budget_from_samples(samples)
+        
+        self.budgets = budgets
+        self.sample_counts = counts
+        print(f"Token budgets refreshed: {len(budgets)} model/type pairs learned, {len(counts)} seen")
+    
+    async def start(self):
+        """Initial refresh and periodic background refresh"""
+        try:
+            await self.refresh()
+        except Exception as e:
+            print(f"Token budget refresh failed, using defaults: {e}")
+        
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(settings.token_budget_refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Token budget refresh failed: {e}")
+    
+    def get_status(self) -> dict:
+        return {
+            f"{model}:{diagram_type}": {
+                "max_tokens": budget,
+                "samples": self.sample_counts.get((model, diagram_type), 0)
+            }
+            for (model, diagram_type), budget in sorted(self.budgets.items())
+        }
+
+
+token_budget_service = TokenBudgetService()
@@ -0,0 +1,145 @@
+# src/backend/app/services/warmup_service.py
+import asyncio
+import time
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.services.llm_service import llm_service
+from app.services.llm_router import LLMBackend
+
+WARMUP_PROMPT = "ping"
+
+
+class WarmupService:
+    """Loads models in LM Studio before the first user request and keeps them loaded.
+
+    LM Studio loads a model on the first request, which can take longer
+    than llm_read_timeout and then fails the request. On startup a one-token
+    completion is sent to every warm-up model on every backend that serves
+    it, with its own long timeout; models of one backend are loaded one by
+    one (default model first), backends in parallel. Afterwards the
+    keep-alive models are pinged every llm_keepalive_interval seconds so
+    the server does not unload them when idle.
+
+    Pings go to the backend client directly, past the scheduler and
+    router.track, so load time does not count as latency for the adaptive
+    limits and breakers.
+    """
+
+    def __init__(self):
+        self.state: Dict[str, Dict[str, dict]] = {}  # url бэкенда -> модель -> состояние
+        self.keepalive_pings = 0
+        self.keepalive_failures = 0
+        self._warmup_task: Optional[asyncio.Task] = None
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    def warmup_models(self) -> List[str]:
+        models = settings.llm_warmup_models or settings.available_models
+        # Модель по умолчанию первой: она нужна раньше остальных
+        return sorted(models, key=lambda model: model != settings.default_model)
+
+    def keepalive_models(self) -> List[str]:
+        return settings.llm_keepalive_models or [settings.default_model]
+
+    def _entry(self, backend: LLMBackend, model: str) -> dict:
+        return self.state.setdefault(backend.url, {}).setdefault(model, {
+            "status": "pending", "load_seconds": None, "last_ping": None, "error": None
+        })
+
+    async def ping(self, backend: LLMBackend, model: str) -> bool:
+        """One-token completion; the first one makes LM Studio load the model"""
+        entry = self._entry(backend, model)
+        if entry["status"] != "ready":
+            entry["status"] = "loading"
+        started = time.monotonic()
+        try:
+            response = await backend.client.post("/v1/chat/completions", json={
+                "model": model,
+                "messages": [{"role": "user", "content": WARMUP_PROMPT}],
+                "max_tokens": 1,
+                "temperature": 0,
+                "stream": False
+            }, timeout=settings.llm_warmup_timeout)
+            if response.status_code != 200:
+                raise RuntimeError(f"status {response.status_code}")
+        except Exception as e:
+            entry["status"] = "failed"
+            entry["error"] = str(e) or e.__class__.__name__
+            print(f"🔥 Warm-up of {model} on {backend.url} failed: {entry['error']}")
+            return False
+
+        elapsed = time.monotonic() - started
+        if entry["status"] != "ready":
+            entry["load_seconds"] = round(elapsed, 2)
+            print(f"🔥 {model} ready on {backend.url} in {elapsed:.1f}s")
+        entry["status"] = "ready"
+        entry["error"] = None
+        entry["last_ping"] = time.time()
+        return True
+
+    def _targets(self, models: List[str]) -> Dict[LLMBackend, List[str]]:
+        llm_service.router.ensure_clients(llm_service._create_client)
+        return {
+            backend: [model for model in models if backend.serves(model)]
+            for backend in llm_service.router.backends if backend.healthy
+        }
+
+    async def warm_up(self):
+        async def warm_backend(backend: LLMBackend, models: List[str]):
+            for model in models:
+                await self.ping(backend, model)
+
+        targets = self._targets(self.warmup_models())
+        for backend, models in targets.items():
+            for model in models:
+                self._entry(backend, model)
+        started = time.monotonic()
+        await asyncio.gather(*(warm_backend(backend, models) for backend, models in targets.items()))
+        print(f"🔥 Warm-up finished in {time.monotonic() - started:.1f}s")
+
+    async def _keepalive_loop(self):
+        while True:
+            await asyncio.sleep(settings.llm_keepalive_interval)
+            for backend, models in self._targets(self.keepalive_models()).items():
+                for model in models:
+                    # Модель под нагрузкой и так не выгрузится
+                    if backend.model_in_flight.get(model):
+                        continue
+                    self.keepalive_pings += 1
+                    if not await self.ping(backend, model):
+                        self.keepalive_failures += 1
+
+    async def start(self):
+        """Start warm-up in the background (does not delay startup) and the keep-alive loop"""
+        if not settings.llm_warmup_enabled:
+            return
+        if self._warmup_task is None or self._warmup_task.done():
+            self._warmup_task = asyncio.create_task(self.warm_up())
+        if settings.llm_keepalive_interval > 0 and (self._keepalive_task is None or self._keepalive_task.done()):
+            self._keepalive_task = asyncio.create_task(self._keepalive_loop())
+
+    async def stop(self):
+        for task in (self._warmup_task, self._keepalive_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._warmup_task = None
+        self._keepalive_task = None
+
+    def get_status(self) -> dict:
+        return {
+            "enabled": settings.llm_warmup_enabled,
+            "running": self._warmup_task is not None and not self._warmup_task.done(),
+            "models": self.state,
+            "keepalive": {
+                "models": self.keepalive_models(),
+                "interval": settings.llm_keepalive_interval,
+                "pings": self.keepalive_pings,
+                "failures": self.keepalive_failures
+            }
+        }
+
+
+warmup_service = WarmupService()
@@ -1,10 +1,16 @@
 # src/backend/app/services/workspace_service.py
+import asyncio
+import time
 from datetime import datetime
-from typing import Optional, Dict, List
+from typing import AsyncIterator, Optional, Dict, List
 from app.core.database import get_database
 from app.services.diagram_service import diagram_service
 from app.services.generation_service import generation_service
+from app.services.job_service import job_service, JOB_DONE, FINISHED
+from app.services.llm_scheduler import QueueFullError
+from app.services.context_budget import ContextBudgetError
 from app.models.diagram import DiagramCreate
+from app.models.workspace import WorkspaceResponse
 from app.core.config import settings
 from bson import ObjectId
 
@@ -13,6 +19,8 @@ class WorkspaceService:
     
     def __init__(self):
         self.active_workspaces: Dict[str, dict] = {}  # In-memory workspace state
+        self.tracked_jobs: Dict[str, str] = {}  # id задачи -> пользователь, результат еще не перенесен
+        self._jobs_task: Optional[asyncio.Task] = None
     
     async def create_workspace(self, user_id: str, diagram_id: Optional[str] = None) -> dict:
         """Create or load workspace"""
@@ -94,7 +102,8 @@ class WorkspaceService:
         diagram_id: Optional[str], 
         prompt: str, 
         diagram_type: str,
-        model: Optional[str] = None  # Добавляем параметр модели
+        model: Optional[str] = None,  # Добавляем параметр модели
+        use_cache: bool = True
     ) -> dict:
         """Generate diagram in workspace context"""
         
@@ -107,37 +116,149 @@ class WorkspaceService:
             prompt=prompt,
             diagram_type=diagram_type,
             diagram_id=diagram_id,
-            model=selected_model  # Передаем выбранную модель
+            model=selected_model,  # Передаем выбранную модель
+            use_cache=use_cache
         )
         
         if not result:
             raise ValueError(error or "Generation failed")
         
-        # Update workspace
+        workspace = await self.apply_generation(
+            user_id, diagram_id, prompt, diagram_type, selected_model, result, error is None
+        )
+        
+        print(f"Generated diagram in workspace for user {user_id} with {selected_model}")
+        return workspace
+    
+    async def apply_generation(
+        self,
+        user_id: str,
+        diagram_id: Optional[str],
+        prompt: str,
+        diagram_type: str,
+        model: str,
+        code: str,
+        is_valid: bool
+    ) -> dict:
+        """Put generated code into the workspace and its history"""
+        
         updates = {
             "current_prompt": prompt,
             "diagram_type": diagram_type,
-            "mermaid_code": result,
+            "mermaid_code": code,
             "has_unsaved_changes": True
         }
         
         workspace = await self.update_workspace(user_id, diagram_id, updates)
         
-        # Add to generation history
-        generation_entry = {
+        workspace["generation_history"].append({
             "prompt": prompt,
             "diagram_type": diagram_type,
-            "model": selected_model,  # Добавляем модель в историю
-            "code": result,
+            "model": model,  # Добавляем модель в историю
+            "code": code,
             "timestamp": datetime.utcnow().isoformat(),
-            "is_valid": error is None
-        }
+            "is_valid": is_valid
+        })
         
-        workspace["generation_history"].append(generation_entry)
-        
-        print(f"Generated diagram in workspace for user {user_id} with {selected_model}")
         return workspace
     
+    async def apply_job_result(self, job: dict) -> Optional[dict]:
+        """Apply a finished workspace job to the workspace once; returns the workspace state.
+        
+        Workspaces live in memory of the API process, so the worker cannot
+        do it. The job is marked applied only after apply_generation
+        succeeds; a failed apply releases the claim and is retried.
+        """
+        if job["status"] != JOB_DONE:
+            return None
+        if job.get("applied_at"):
+            return job.get("workspace")
+        # Один перенос на задачу, даже если его одновременно запросили опрос, SSE и фоновая проверка
+        if not await job_service.claim_once(job["job_id"], "applying_at"):
+            return None
+        
+        payload = job["payload"]
+        result = job["result"]
+        try:
+            workspace = await self.apply_generation(
+                job["user_id"], payload["diagram_id"], payload["prompt"], payload["diagram_type"],
+                result["model"], result["mermaid_code"], result["is_valid"]
+            )
+        except Exception:
+            await job_service.release_claim(job["job_id"], "applying_at")
+            raise
+        
+        # Снимок состояния: новая рабочая область не имеет id, по которому ее можно найти позже
+        snapshot = WorkspaceResponse(**workspace).model_dump(mode="json")
+        await job_service.annotate(job["job_id"], {
+            "applied_at": time.time(),
+            "workspace_id": workspace["diagram_id"] or "new",
+            "workspace": snapshot
+        })
+        print(f"Applied job {job['job_id']} to workspace {workspace['diagram_id'] or 'new'} for user {job['user_id']}")
+        return snapshot
+    
+    def track_job(self, job_id: str, user_id: str):
+        """Apply the job result when it finishes, whether or not the client asks for it"""
+        self.tracked_jobs[job_id] = user_id
+        if self._jobs_task is None or self._jobs_task.done():
+            self._jobs_task = asyncio.create_task(self._apply_jobs_loop())
+    
+    async def _apply_jobs_loop(self):
+        while self.tracked_jobs:
+            await asyncio.sleep(settings.jobs_apply_interval)
+            for job_id, user_id in list(self.tracked_jobs.items()):
+                try:
+                    job = await job_service.get(job_id, user_id)
+                    if job is None:
+                        self.tracked_jobs.pop(job_id, None)  # Истекла
+                    elif job["status"] in FINISHED:
+                        # Неудачная задача переносить нечего; None для выполненной - переносит другой запрос
+                        if job["status"] != JOB_DONE or await self.apply_job_result(job) is not None:
+                            self.tracked_jobs.pop(job_id, None)
+                except Exception as e:
+                    # Задача остается в списке - попробуем на следующем проходе
+                    print(f"Failed to apply job {job_id} to workspace: {e}")
+    
+    async def stop(self):
+        if self._jobs_task is not None:
+            self._jobs_task.cancel()
+            try:
+                await self._jobs_task
+            except asyncio.CancelledError:
+                pass
+            self._jobs_task = None
+    
+    async def generate_in_workspace_stream(
+        self,
+        user_id: str,
+        diagram_id: Optional[str],
+        prompt: str,
+        diagram_type: str,
+        model: Optional[str] = None
+    ) -> AsyncIterator[dict]:
+        """Stream generation events and apply the final code to the workspace"""
+        
+        selected_model = model or settings.default_model
+        print(f"Streaming in workspace with model: {selected_model}")
+        
+        async for event in generation_service.generate_stream(
+            user_id=user_id,
+            prompt=prompt,
+            diagram_type=diagram_type,
+            diagram_id=diagram_id,
+            model=selected_model
+        ):
+            if event["event"] == "done" and event["data"]["mermaid_code"]:
+                await self.apply_generation(
+                    user_id, diagram_id, prompt, diagram_type, selected_model,
+                    event["data"]["mermaid_code"], event["data"]["is_valid"]
+                )
+                
+                print(f"Streamed diagram into workspace for user {user_id} with {selected_model}")
+            
+            yield event
+    
     async def modify_in_workspace(
         self, 
         user_id: str, 
@@ -189,11 +310,20 @@ class WorkspaceService:
             print(f"Modified diagram in workspace for user {user_id} with {selected_model}")
             return workspace
             
+        except (QueueFullError, ContextBudgetError):
+            raise
         except Exception as e:
             print(f"Workspace modification error: {e}")
             raise ValueError(f"Modification failed: {str(e)}")
 
-    async def save_workspace(self, user_id: str, diagram_id: Optional[str], title: str, description: Optional[str] = None) -> str:
+    async def save_workspace(
+        self,
+        user_id: str,
+        diagram_id: Optional[str],
+        title: str,
+        description: Optional[str] = None,
+        allow_duplicate: bool = False
+    ) -> str:
         """Save workspace to database"""
         
         workspace = await self.get_workspace(user_id, diagram_id)
@@ -231,7 +361,8 @@ class WorkspaceService:
             new_diagram = await diagram_service.create_diagram(
                 user_id=user_id,
                 diagram_data=diagram_data,
-                original_prompt=workspace["current_prompt"]
+                original_prompt=workspace["current_prompt"],
+                allow_duplicate=allow_duplicate
             )
             
             saved_id = new_diagram.id
@@ -1,2 +1,5 @@
 from .prompt_templates import get_prompt_template, get_available_diagram_types
 from .mermaid_validator import validate_mermaid_syntax, clean_mermaid_code
+from .mermaid_fixer import fix_mermaid_code, repair_mermaid_code
+from .mermaid_parser import parse_mermaid, MermaidSyntaxError
+from .mermaid_canonical import canonicalize_mermaid, structural_hash
@@ -0,0 +1,97 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+# Размер по умолчанию: диаграммы короткие, 4096 записей - единицы мегабайт
+DEFAULT_MAXSIZE = 4096
+
+# Все кэши по имени - для метрик
+CONTENT_CACHES: Dict[str, "ContentCache"] = {}
+
+
+def content_key(code: str, *extra: Hashable) -> Tuple:
+    """Fast fixed-size key for a code string plus extra arguments (e.g. diagram type)"""
+    digest = hashlib.blake2b(code.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    return (digest,) + extra
+
+
+class ContentCache:
+    """Bounded thread-safe LRU keyed by content hash"""
+
+    _MISSING = object()
+
+    def __init__(self, name: str, maxsize: int = DEFAULT_MAXSIZE):
+        self.name = name
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple) -> Any:
+        """Cached value or ContentCache._MISSING"""
+        with self._lock:
+            value = self._data.get(key, self._MISSING)
+            if value is self._MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Tuple, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_status(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else None
+        }
+
+
+def memoize_by_content(name: str, maxsize: int = DEFAULT_MAXSIZE) -> Callable:
+    """Memoize fn(code, *args) by content hash of code plus args.
+
+    Only for pure functions returning immutable values: the cached object
+    is shared between callers.
+    """
+    def decorator(fn: Callable) -> Callable:
+        cache = CONTENT_CACHES[name] = ContentCache(name, maxsize)
+
+        @wraps(fn)
+        def wrapper(code: str, *args: Hashable, **kwargs: Hashable):
+            if not isinstance(code, str):
+                return fn(code, *args, **kwargs)
+            key = content_key(code, *args, *sorted(kwargs.items()))
+            value = cache.get(key)
+            if value is ContentCache._MISSING:
+                value = fn(code, *args, **kwargs)
+                cache.set(key, value)
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def get_content_cache_status() -> dict:
+    """Hit/miss counters of all content caches"""
+    return {name: cache.get_status() for name, cache in CONTENT_CACHES.items()}
@@ -0,0 +1,253 @@
+"""Canonical form and structural hash of Mermaid diagrams.
+
+Two diagrams that render the same should hash the same, even if they differ
+in whitespace, comments, node ids (A/B/C vs n1/n2/n3) or statement order.
+
+Flowcharts are rebuilt from the AST: nodes are numbered by a
+Weisfeiler-Lehman style refinement over labels, shapes and links (so the
+numbering does not depend on the original ids or their order), then nodes,
+subgraphs and links are written in sorted order. Other diagram types keep
+their ids (they are visible in the rendered diagram) and are normalized line
+by line; for types where statement order does not change the picture
+(class, er, state) top-level statements are sorted.
+
+Code that does not parse still gets a whitespace-normalized form, so
+duplicates of broken diagrams are detected too.
+"""
+import hashlib
+import re
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .content_cache import memoize_by_content
+from .mermaid_parser import (
+    parse_mermaid, MermaidDiagram, MermaidSyntaxError, SHAPE_DELIMITERS, _logical_lines, _split_outside_quotes
+)
+from .mermaid_validator import clean_mermaid_code
+
+# Версия канонической формы - входит в хэш, повышать при изменении правил
+CANONICAL_VERSION = "1"
+
+# Раундов уточнения раскраски; обычно разбиение стабилизируется за 2-3
+WL_MAX_ROUNDS = 8
+
+# Порядок операторов не влияет на картинку
+ORDER_INSENSITIVE_TYPES = {"class", "er", "state"}
+
+WHITESPACE = re.compile(r'[ \t]+')
+
+
+class CanonicalDiagram(NamedTuple):
+    code: str
+    structural_hash: str
+
+
+def _stable_hash(*parts: object) -> str:
+    """Process-independent hash (built-in hash() of str is salted per process)"""
+    return hashlib.blake2b(repr(parts).encode("utf-8", "surrogatepass"), digest_size=8).hexdigest()
+
+
+def _collapse_whitespace(text: str) -> str:
+    """Collapse runs of spaces outside quoted strings"""
+    parts = text.split('"')
+    for i in range(0, len(parts), 2):
+        parts[i] = WHITESPACE.sub(" ", parts[i])
+    return '"'.join(parts).strip()
+
+
+def _quote(label: str) -> str:
+    return '"' + label.replace('"', "#quot;") + '"'
+
+
+# ---------------------------------------------------------------------------
+# Flowchart
+# ---------------------------------------------------------------------------
+
+def _node_features(diagram: MermaidDiagram, memberships: Dict[str, str]) -> Dict[str, str]:
+    features = {}
+    for node_id, node in diagram.nodes.items():
+        # Узел без метки показывает свой id - тогда id и есть метка
+        label = _collapse_whitespace(node.get("label") or node_id)
+        features[node_id] = _stable_hash(
+            label, node.get("shape") or "rect", sorted(node.get("classes", [])), memberships.get(node_id)
+        )
+    return features
+
+
+def _refine_colors(diagram: MermaidDiagram, colors: Dict[str, str]) -> Dict[str, str]:
+    """Weisfeiler-Lehman refinement: node color absorbs colors of its links until stable"""
+    outgoing = defaultdict(list)
+    incoming = defaultdict(list)
+    for edge in diagram.edges:
+        outgoing[edge["source"]].append(edge)
+        incoming[edge["target"]].append(edge)
+
+    classes = len(set(colors.values()))
+    for _ in range(WL_MAX_ROUNDS):
+        refined = {}
+        for node_id, color in colors.items():
+            out = sorted((e["arrow"], e["label"] or "", colors[e["target"]]) for e in outgoing[node_id])
+            inc = sorted((e["arrow"], e["label"] or "", colors[e["source"]]) for e in incoming[node_id])
+            refined[node_id] = _stable_hash(color, out, inc)
+        colors = refined
+        refined_classes = len(set(colors.values()))
+        if refined_classes == classes:
+            break
+        classes = refined_classes
+    return colors
+
+
+def _remap_ids(ids: str, mapping: Dict[str, str]) -> str:
+    return ",".join(mapping.get(part.strip(), part.strip()) for part in ids.split(","))
+
+
+def _flow_statement(text: str, keyword: str, node_ids: Dict[str, str], link_indexes: Dict[int, int]) -> str:
+    """Rewrite a class/style/click/linkStyle statement with canonical ids"""
+    rest = _collapse_whitespace(text[len(keyword):])
+    target, _, tail = rest.partition(" ")
+    if keyword in ("class", "style", "click"):
+        target = _remap_ids(target, node_ids)
+    elif keyword == "linkStyle" and target != "default":
+        indexes = []
+        for part in target.split(","):
+            indexes.append(str(link_indexes[int(part)]) if part.isdigit() and int(part) in link_indexes else part)
+        target = ",".join(sorted(indexes, key=lambda value: (len(value), value)))
+    return f"{keyword} {target} {tail}".rstrip()
+
+
+def _canonical_flowchart(diagram: MermaidDiagram) -> str:
+    # Узел принадлежит первому подграфу, где он упомянут
+    memberships: Dict[str, str] = {}
+    group_titles = {}
+    for group in diagram.groups:
+        group_titles[group["id"]] = _collapse_whitespace(group["title"] or "")
+        for node_id in group["nodes"]:
+            memberships.setdefault(node_id, group["id"])
+    # В признаки узла идет заголовок подграфа, а не его id
+    title_memberships = {node_id: group_titles[group_id] for node_id, group_id in memberships.items()}
+
+    colors = _refine_colors(diagram, _node_features(diagram, title_memberships))
+    first_seen = {node_id: index for index, node_id in enumerate(diagram.nodes)}
+    ordered = sorted(diagram.nodes, key=lambda node_id: (colors[node_id], first_seen[node_id]))
+    node_ids = {node_id: f"n{index}" for index, node_id in enumerate(ordered, 1)}
+
+    def declaration(node_id: str) -> str:
+        node = diagram.nodes[node_id]
+        opener, closer = SHAPE_DELIMITERS[node.get("shape") or "rect"]
+        label = _collapse_whitespace(node.get("label") or node_id)
+        classes = "".join(f":::{name}" for name in sorted(node.get("classes", [])))
+        return f"{node_ids[node_id]}{opener}{_quote(label)}{closer}{classes}"
+
+    # Подграфы: по заголовку и наименьшему номеру узла внутри
+    def group_key(group: dict) -> Tuple:
+        members = [int(node_ids[n][1:]) for n in group["nodes"] if memberships.get(n) == group["id"]]
+        return group_titles[group["id"]], min(members, default=0)
+
+    children = defaultdict(list)
+    for group in diagram.groups:
+        children[group["parent"]].append(group)
+    group_ids: Dict[str, str] = {}
+    for index, group in enumerate(sorted(diagram.groups, key=group_key), 1):
+        group_ids[group["id"]] = f"s{index}"
+
+    lines = [f"flowchart {diagram.direction or 'TD'}"]
+
+    def emit_nodes(parent: Optional[str], indent: str):
+        members = [n for n in diagram.nodes if memberships.get(n) == parent]
+        for node_id in sorted(members, key=lambda n: int(node_ids[n][1:])):
+            lines.append(indent + declaration(node_id))
+        for group in sorted(children[parent], key=group_key):
+            title = group_titles[group["id"]]
+            lines.append(f"{indent}subgraph {group_ids[group['id']]}" + (f" [{_quote(title)}]" if title else ""))
+            if group.get("direction"):
+                lines.append(f"{indent}    direction {group['direction']}")
+            emit_nodes(group["id"], indent + "    ")
+            lines.append(f"{indent}end")
+
+    emit_nodes(None, "    ")
+
+    edge_keys = []
+    for index, edge in enumerate(diagram.edges):
+        key = (int(node_ids[edge["source"]][1:]), int(node_ids[edge["target"]][1:]), edge["arrow"], edge["label"] or "")
+        edge_keys.append((key, index))
+    edge_keys.sort()
+    # linkStyle ссылается на связи по номеру - номера меняются вместе с порядком
+    link_indexes = {index: position for position, (_, index) in enumerate(edge_keys)}
+    for (source, target, arrow, label), _ in edge_keys:
+        link_label = f"|{_quote(_collapse_whitespace(label))}|" if label else ""
+        lines.append(f"    n{source} {arrow}{link_label} n{target}")
+
+    # classDef/class/style/... - порядок между ними не важен
+    ids = {**node_ids, **group_ids}
+    extra = []
+    for statement in diagram.statements:
+        if statement.kind in ("classDef", "accTitle", "accDescr"):
+            extra.append(_collapse_whitespace(statement.text))
+        elif statement.kind in ("class", "style", "click", "linkStyle"):
+            extra.append(_flow_statement(statement.text, statement.kind, ids, link_indexes))
+    lines.extend("    " + text for text in sorted(extra))
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# Прочие типы и непарсящийся код
+# ---------------------------------------------------------------------------
+
+def _chunks(lines: List[str]) -> List[List[str]]:
+    """Group lines into top-level statements: a '{' ... '}' block is one chunk"""
+    chunks: List[List[str]] = []
+    depth = 0
+    for text in lines:
+        if depth == 0:
+            chunks.append([text])
+        else:
+            chunks[-1].append(text)
+        depth += text.count("{") - text.count("}")
+        depth = max(depth, 0)
+    return chunks
+
+
+def _canonical_lines(code: str, diagram_type: Optional[str]) -> str:
+    lines = []
+    for text, _, _ in _logical_lines(code):
+        if diagram_type == "state" and ";" in text:
+            lines.extend(_collapse_whitespace(part) for part, _ in _split_outside_quotes(text, ";") if part.strip())
+        else:
+            lines.append(_collapse_whitespace(text))
+    if not lines:
+        return ""
+
+    header, body = lines[0], lines[1:]
+    if diagram_type in ORDER_INSENSITIVE_TYPES:
+        chunks = sorted(_chunks(body))
+    else:
+        chunks = [[text] for text in body]
+
+    output = [header]
+    for chunk in chunks:
+        output.append("    " + chunk[0])
+        output.extend("        " + text if text != "}" else "    }" for text in chunk[1:])
+    return "\n".join(output)
+
+
+@memoize_by_content("canonicalize_mermaid")
+def canonicalize_mermaid(code: str, diagram_type: Optional[str] = None) -> CanonicalDiagram:
+    """Canonical code and structural hash of a diagram (raw LLM output is cleaned first)"""
+    cleaned = clean_mermaid_code(code or "")
+    try:
+        diagram = parse_mermaid(cleaned, diagram_type)
+    except MermaidSyntaxError:
+        diagram = None
+
+    if diagram is not None and diagram.diagram_type == "flowchart":
+        canonical = _canonical_flowchart(diagram)
+    else:
+        canonical = _canonical_lines(cleaned, diagram.diagram_type if diagram else diagram_type)
+
+    digest = hashlib.sha256(f"{CANONICAL_VERSION}\n{canonical}".encode("utf-8", "surrogatepass")).hexdigest()
+    return CanonicalDiagram(canonical, digest)
+
+
+def structural_hash(code: str, diagram_type: Optional[str] = None) -> str:
+    """Hash that is equal for diagrams differing only in formatting, ids or statement order"""
+    return canonicalize_mermaid(code, diagram_type).structural_hash
@@ -0,0 +1,305 @@
+"""Shrinking diagram code for LLM prompts.
+
+minify_mermaid drops what the model does not need to see (comments,
+indentation, blank lines, repeated spaces). elide_styling additionally
+takes styling statements out of the prompt; restore_styling puts them back
+into the model's answer, so the saved diagram keeps its look.
+
+For large flowcharts select_relevant_context goes further: only nodes
+matching the modification request and their k-hop neighbourhood are shown,
+the rest is summarized in a few comment lines. merge_excerpt turns the
+model's edited excerpt into edit operations and applies them to the full
+diagram, so the prompt size does not grow with the diagram.
+"""
+import math
+import re
+from collections import Counter, deque
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from .mermaid_parser import parse_mermaid, MermaidSyntaxError
+from .mermaid_patch import FlowchartDocument, PATCHABLE_TYPES, _preamble
+
+WHITESPACE = re.compile(r'[ \t]+')
+
+# Операторы оформления, которые модели не нужны для правки структуры
+STYLING_KEYWORDS = {
+    "flowchart": ("style", "classDef", "class", "linkStyle", "click"),
+    "state": ("style", "classDef", "class")
+}
+
+# Статьи, ссылающиеся на узлы: id идут вторым словом (class A,B name / style A ... / click A ...)
+NODE_REFERENCING = ("style", "class", "click")
+
+
+def _collapse(line: str) -> str:
+    """Collapse spaces outside double-quoted strings"""
+    parts = line.split('"')
+    for i in range(0, len(parts), 2):
+        parts[i] = WHITESPACE.sub(" ", parts[i])
+    return '"'.join(parts).strip()
+
+
+def minify_mermaid(code: str) -> str:
+    """Same diagram in fewer tokens: no comments, indentation or blank lines"""
+    lines = []
+    for raw in code.replace("\r\n", "\n").split("\n"):
+        line = raw.strip()
+        if not line or (line.startswith("%%") and not line.startswith("%%{")):
+            continue  # Директивы %%{init}%% влияют на отрисовку - их оставляем
+        lines.append(_collapse(line))
+    return "\n".join(lines)
+
+
+def _keyword(line: str) -> str:
+    return line.split(None, 1)[0] if line.strip() else ""
+
+
+def elide_styling(code: str, diagram_type: str) -> Tuple[str, List[str]]:
+    """Remove styling statements; returns (code, removed lines)"""
+    keywords = STYLING_KEYWORDS.get(diagram_type)
+    if not keywords:
+        return code, []
+    kept, elided = [], []
+    for line in code.split("\n"):
+        stripped = line.strip()
+        if _keyword(stripped) in keywords and stripped[len(_keyword(stripped)):][:1] in (" ", "\t"):
+            elided.append(stripped)
+        else:
+            kept.append(line)
+    return "\n".join(kept), elided
+
+
+def restore_styling(code: str, elided: List[str], diagram_type: str) -> str:
+    """Append elided styling back where its nodes still exist.
+
+    linkStyle is dropped: it addresses links by position and the model may
+    have added or removed links.
+    """
+    if not elided:
+        return code
+    try:
+        nodes = parse_mermaid(code, diagram_type).nodes
+    except MermaidSyntaxError:
+        return code  # Невалидный ответ пойдет на повтор/ошибку - оформление не добавляем
+
+    present = set(line.strip() for line in code.split("\n"))
+    restored = []
+    for line in elided:
+        keyword = _keyword(line)
+        if keyword == "linkStyle" or line in present:
+            continue
+        if keyword in NODE_REFERENCING:
+            parts = line.split(None, 2)
+            ids = [node_id.strip() for node_id in parts[1].split(",")] if len(parts) > 1 else []
+            if not ids or any(node_id not in nodes for node_id in ids):
+                continue
+        restored.append("    " + line)
+    return code + ("\n" + "\n".join(restored) if restored else "")
+
+
+# ---------------------------------------------------------------------------
+# Выбор релевантной части большой диаграммы
+# ---------------------------------------------------------------------------
+
+TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# Грубый стемминг, как у few-shot индекса: первые 5 символов слова
+STEM_LENGTH = 5
+
+# Сколько узлов на границе выбранной части и подграфов перечислять в сводке
+SUMMARY_BOUNDARY_NODES = 20
+SUMMARY_GROUPS = 10
+
+
+class ContextSelection(NamedTuple):
+    code: str  # Фрагмент диаграммы со сводкой остального в комментариях
+    nodes: int  # Узлов во фрагменте
+    total_nodes: int
+
+
+def _terms(text: str) -> Set[str]:
+    return {
+        word[:STEM_LENGTH] for word in TERM_PATTERN.findall(text.lower())
+        if len(word) > 2 and not word.isdigit()
+    }
+
+
+def _seed_nodes(diagram, prompt: str, limit: int) -> List[str]:
+    """Nodes the request talks about: id named in the request or label terms, rarer terms weigh more"""
+    prompt_words = set(TERM_PATTERN.findall(prompt))
+    prompt_terms = _terms(prompt)
+    node_terms = {
+        node_id: _terms(node.get("label") or "") | _terms(node_id)
+        for node_id, node in diagram.nodes.items()
+    }
+    frequency = Counter(term for terms in node_terms.values() for term in terms & prompt_terms)
+    total = len(diagram.nodes)
+
+    scores = {}
+    for node_id, terms in node_terms.items():
+        score = sum(math.log(1 + total / frequency[term]) for term in terms & prompt_terms)
+        if node_id in prompt_words:
+            score += math.log(1 + total)
+        if score:
+            scores[node_id] = score
+    if not scores:
+        return []
+    best = max(scores.values())
+    # Узлы, заметно уступающие лучшему совпадению (общее слово вроде "шаг"), не берем
+    seeds = [node_id for node_id, score in scores.items() if score >= best / 2]
+    seeds.sort(key=lambda node_id: -scores[node_id])
+    return seeds[:limit]
+
+
+def _neighbourhood(diagram, seeds: List[str], hops: int, limit: int) -> List[str]:
+    """Breadth-first k-hop neighbourhood over links in both directions, closest first"""
+    neighbours: Dict[str, List[str]] = {node_id: [] for node_id in diagram.nodes}
+    for edge in diagram.edges:
+        neighbours[edge["source"]].append(edge["target"])
+        neighbours[edge["target"]].append(edge["source"])
+
+    distance = {node_id: 0 for node_id in seeds}
+    queue = deque(seeds)
+    while queue and len(distance) < limit:
+        node_id = queue.popleft()
+        if distance[node_id] == hops:
+            continue
+        for neighbour in neighbours[node_id]:
+            if neighbour not in distance:
+                distance[neighbour] = distance[node_id] + 1
+                queue.append(neighbour)
+                if len(distance) >= limit:
+                    break
+    order = {node_id: index for index, node_id in enumerate(diagram.nodes)}
+    return sorted(distance, key=lambda node_id: order[node_id])
+
+
+def _summary(diagram, document: FlowchartDocument, selected: Set[str]) -> List[str]:
+    hidden = len(diagram.nodes) - len(selected)
+    lines = [
+        f"%% Only the part of the diagram relevant to the request is shown: {len(selected)} of {len(diagram.nodes)} nodes.",
+        f"%% {hidden} other nodes and their links are kept as they are. Keep existing node ids."
+    ]
+
+    groups = Counter(document.memberships.get(node_id) for node_id in diagram.nodes if node_id not in selected)
+    titles = {group["id"]: group["title"] or group["id"] for group in diagram.groups}
+    named = [f"{titles[group_id]} ({count})" for group_id, count in groups.most_common(SUMMARY_GROUPS) if group_id]
+    if named:
+        lines.append("%% Hidden subgraphs: " + ", ".join(named))
+
+    boundary = []
+    for edge in diagram.edges:
+        for inside, outside in ((edge["source"], edge["target"]), (edge["target"], edge["source"])):
+            if inside in selected and outside not in selected and outside not in boundary:
+                boundary.append(outside)
+    if boundary:
+        described = [
+            f"{node_id}[{diagram.nodes[node_id].get('label') or node_id}]" for node_id in boundary[:SUMMARY_BOUNDARY_NODES]
+        ]
+        more = len(boundary) - SUMMARY_BOUNDARY_NODES
+        lines.append("%% Hidden nodes linked to the shown part (can be used in links): " + ", ".join(described)
+                     + (f" and {more} more" if more > 0 else ""))
+    return lines
+
+
+def select_relevant_context(
+    code: str,
+    diagram_type: str,
+    prompt: str,
+    hops: int = 2,
+    max_nodes: int = 40,
+    min_nodes: int = 60
+) -> Optional[ContextSelection]:
+    """Excerpt of a large flowchart around the nodes named in prompt.
+
+    Returns None when pruning does not apply: other diagram types, small or
+    unparsable diagrams, nothing in the request matches a node, or the
+    neighbourhood is most of the diagram anyway.
+    """
+    if diagram_type not in PATCHABLE_TYPES:
+        return None
+    try:
+        diagram = parse_mermaid(code, diagram_type)
+    except MermaidSyntaxError:
+        return None
+    total = len(diagram.nodes)
+    if total < min_nodes:
+        return None
+
+    seeds = _seed_nodes(diagram, prompt, max(max_nodes // 2, 1))
+    if not seeds:
+        return None
+    selected = set(_neighbourhood(diagram, seeds, hops, max_nodes))
+    if len(selected) > total * 0.8:
+        return None
+
+    # Фрагмент без подграфов и оформления: узлы и связи между ними
+    excerpt = FlowchartDocument(diagram, [])
+    summary = _summary(diagram, excerpt, selected)
+    excerpt.nodes = {node_id: node for node_id, node in excerpt.nodes.items() if node_id in selected}
+    excerpt.edges = [edge for edge in excerpt.edges if edge["source"] in selected and edge["target"] in selected]
+    excerpt.groups, excerpt.memberships, excerpt.statements = [], {}, []
+    for node in excerpt.nodes.values():
+        node["classes"] = []
+
+    lines = excerpt.render().split("\n")
+    lines[1:1] = ["    " + line for line in summary]
+    return ContextSelection("\n".join(lines), len(selected), total)
+
+
+def _edge_key(edge: dict) -> Tuple[str, str]:
+    return edge["source"], edge["target"]
+
+
+def excerpt_operations(excerpt: str, result: str, full_nodes: Set[str]) -> List[dict]:
+    """Edit operations that turn the excerpt into the model's result"""
+    before = parse_mermaid(excerpt, "flowchart")
+    after = parse_mermaid(result, "flowchart")
+    operations = []
+
+    removed = [node_id for node_id in before.nodes if node_id not in after.nodes]
+    operations += [{"op": "remove_node", "id": node_id} for node_id in removed]
+
+    for node_id, node in after.nodes.items():
+        old = before.nodes.get(node_id)
+        if old is None and node_id not in full_nodes:
+            operations.append({"op": "add_node", "id": node_id, "label": node.get("label"), "shape": node.get("shape")})
+            continue
+        # Скрытый узел, упомянутый в ответе, или существующий: меняем только то, что задано явно
+        old = old or {}
+        if node.get("label") is not None and node.get("label") != old.get("label"):
+            operations.append({"op": "set_label", "id": node_id, "label": node["label"]})
+        if node.get("shape") is not None and node.get("shape") != old.get("shape"):
+            operations.append({"op": "set_shape", "id": node_id, "shape": node["shape"]})
+
+    if after.direction and after.direction != before.direction:
+        operations.append({"op": "set_direction", "direction": after.direction})
+
+    before_edges = {}
+    for edge in before.edges:
+        before_edges.setdefault(_edge_key(edge), edge)
+    after_edges = {}
+    for edge in after.edges:
+        after_edges.setdefault(_edge_key(edge), edge)
+
+    gone = set(removed)
+    for key, edge in before_edges.items():
+        if key not in after_edges and not gone & set(key):  # Связи удаленных узлов уходят вместе с ними
+            operations.append({"op": "remove_edge", "from": key[0], "to": key[1]})
+    for key, edge in after_edges.items():
+        old = before_edges.get(key)
+        if old is None:
+            operations.append({"op": "add_edge", "from": key[0], "to": key[1], "label": edge["label"], "arrow": edge["arrow"]})
+        elif edge["label"] != old["label"]:
+            operations.append({"op": "set_edge_label", "from": key[0], "to": key[1], "label": edge["label"]})
+    return operations
+
+
+def merge_excerpt(full_code: str, excerpt: str, result: str, diagram_type: str) -> str:
+    """Apply the model's edit of an excerpt to the full diagram; raises PatchError/MermaidSyntaxError"""
+    document = FlowchartDocument(parse_mermaid(full_code, diagram_type), _preamble(full_code))
+    operations = excerpt_operations(excerpt, result, set(document.nodes))
+    if not operations:
+        return full_code
+    document.apply(operations)
+    return document.render()
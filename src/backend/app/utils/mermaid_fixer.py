@@ -0,0 +1,255 @@
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .mermaid_validator import DIAGRAM_TYPE_KEYWORDS, validate_mermaid_syntax
+
+# Заголовок по умолчанию, если модель его пропустила
+DEFAULT_HEADERS = {
+    "flowchart": "flowchart TD",
+    "sequence": "sequenceDiagram",
+    "class": "classDiagram",
+    "er": "erDiagram",
+    "gantt": "gantt"
+}
+
+# Строка целиком является заголовком диаграммы
+HEADER_PATTERN = re.compile(
+    r'^\s*(?:(?:flowchart|graph)(?:\s+(?:TD|TB|BT|RL|LR))?|sequenceDiagram|classDiagram(?:-v2)?'
+    r'|erDiagram|gantt|stateDiagram(?:-v2)?|journey|gitGraph(?:\s+(?:LR|TB|BT))?:?|pie(?:\s+.*)?)\s*;?\s*$'
+)
+
+# Строки flowchart, в которых скобки не являются формой узла
+FLOWCHART_SKIP_PREFIXES = ("%%", "classDef", "class ", "style", "linkStyle", "click", "subgraph", "end")
+
+# Начало стрелки: -->, ---, -.->, ==>, --x, --o
+ARROW_PATTERN = re.compile(r'\s*(?:--|==|-\.)[-.=]*[>xo]?')
+
+# Подпись узла в [] или {} со скобками внутри и без кавычек
+PAREN_LABEL_PATTERN = re.compile(r'(?P<id>\b[A-Za-z0-9_]+)(?P<open>[\[{])(?P<label>[^\[\]{}"]*[()][^\[\]{}"]*)(?P<close>[\]}])')
+
+BRACKET_PAIRS = {"[": "]", "(": ")", "{": "}", ">": "]"}
+
+
+def _header_index(lines: List[str]) -> Optional[int]:
+    return next((i for i, line in enumerate(lines) if HEADER_PATTERN.match(line)), None)
+
+
+def _fix_crlf(code: str, diagram_type: str) -> str:
+    return code.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _fix_leading_prose(code: str, diagram_type: str) -> str:
+    lines = code.split("\n")
+    header = _header_index(lines)
+    if not header:
+        return code
+    # Директивы %%{init}%% перед заголовком допустимы - оставляем их
+    kept = [line for line in lines[:header] if line.strip().startswith("%%")]
+    return "\n".join(kept + lines[header:])
+
+
+def _fix_graph_keyword(code: str, diagram_type: str) -> str:
+    if diagram_type != "flowchart":
+        return code
+    lines = code.split("\n")
+    header = _header_index(lines)
+    if header is None:
+        return code
+    lines[header] = re.sub(r'^(\s*)graph\b', r'\1flowchart', lines[header])
+    return "\n".join(lines)
+
+
+def _fix_missing_header(code: str, diagram_type: str) -> str:
+    expected = DIAGRAM_TYPE_KEYWORDS.get(diagram_type, [])
+    if not expected or diagram_type not in DEFAULT_HEADERS:
+        return code
+    if any(keyword in code for keyword in expected) or _header_index(code.split("\n")) is not None:
+        return code  # Заголовок есть (возможно, другого типа - это уже не исправить локально)
+    return f"{DEFAULT_HEADERS[diagram_type]}\n{code}"
+
+
+def _balance_line(line: str) -> str:
+    stack = []
+    output = []
+    in_quote = False
+    in_edge_label = False
+    i = 0
+
+    while i < len(line):
+        char = line[i]
+
+        if char == '"' and not in_edge_label:
+            in_quote = not in_quote
+        elif char == "|" and not in_quote and not stack:
+            in_edge_label = not in_edge_label  # Подпись ребра -->|...| - скобки в ней не считаем
+        elif not in_quote and not in_edge_label:
+            arrow = ARROW_PATTERN.match(line, i)
+            if arrow:
+                # Стрелка внутри незакрытой подписи - подпись забыли закрыть
+                output.extend(BRACKET_PAIRS[opener] for opener in reversed(stack))
+                stack.clear()
+                # Стрелку переносим целиком: ее ">" не открывает форму узла
+                output.append(line[i:arrow.end()])
+                i = arrow.end()
+                continue
+            if char in "[({" or (char == ">" and i > 0 and (line[i - 1].isalnum() or line[i - 1] == "_")):
+                stack.append(char)
+            elif char in "])}":
+                if stack and BRACKET_PAIRS[stack[-1]] == char:
+                    stack.pop()
+                elif not stack:
+                    i += 1
+                    continue  # Лишняя закрывающая скобка
+                else:
+                    char = BRACKET_PAIRS[stack.pop()]  # Перепутанная закрывающая скобка
+
+        output.append(char)
+        i += 1
+
+    fixed = "".join(output)
+    if stack:
+        fixed = fixed.rstrip() + "".join(BRACKET_PAIRS[opener] for opener in reversed(stack))
+    return fixed
+
+
+def _fix_unbalanced_brackets(code: str, diagram_type: str) -> str:
+    if diagram_type != "flowchart":
+        return code
+    lines = code.split("\n")
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped or stripped.startswith(FLOWCHART_SKIP_PREFIXES) or HEADER_PATTERN.match(line):
+            continue
+        lines[i] = _balance_line(line)
+    return "\n".join(lines)
+
+
+def _quote_label(match: "re.Match") -> str:
+    label = match.group("label")
+    if match.group("open") == "[" and label.startswith("(") and label.endswith(")"):
+        return match.group()  # [(...)] - форма "цилиндр", а не скобки в тексте
+    return f'{match.group("id")}{match.group("open")}"{label}"{match.group("close")}'
+
+
+def _fix_unquoted_parens(code: str, diagram_type: str) -> str:
+    if diagram_type != "flowchart":
+        return code
+    lines = code.split("\n")
+    for i, line in enumerate(lines):
+        if not line.strip().startswith(FLOWCHART_SKIP_PREFIXES):
+            lines[i] = PAREN_LABEL_PATTERN.sub(_quote_label, line)
+    return "\n".join(lines)
+
+
+# Правила применяются по порядку: скобки балансируются до того, как подписи берутся в кавычки
+FIX_RULES: List[Tuple[str, Callable[[str, str], str]]] = [
+    ("crlf", _fix_crlf),
+    ("leading_prose", _fix_leading_prose),
+    ("graph_keyword", _fix_graph_keyword),
+    ("missing_header", _fix_missing_header),
+    ("unbalanced_brackets", _fix_unbalanced_brackets),
+    ("unquoted_parens", _fix_unquoted_parens)
+]
+
+
+def fix_mermaid_code(code: str, diagram_type: str) -> Tuple[str, List[str]]:
+    """Apply rule-based fixes to cleaned mermaid code.
+
+    Returns the fixed code and names of the rules that changed it.
+    """
+    applied = []
+    if not code or not code.strip():
+        return code, applied
+
+    for name, rule in FIX_RULES:
+        fixed = rule(code, diagram_type)
+        if fixed != code:
+            applied.append(name)
+            code = fixed
+    return code, applied
+
+
+def repair_mermaid_code(code: str, diagram_type: str) -> Tuple[str, bool, Optional[str], List[str]]:
+    """Fix code only if it is invalid and keep the fix only if it validates.
+
+    Returns the code to use, its validity, the validation error and the
+    applied rules (empty when the original code is kept).
+    """
+    is_valid, error = validate_mermaid_syntax(code, diagram_type)
+    if is_valid:
+        return code, True, None, []
+
+    fixed, applied = fix_mermaid_code(code, diagram_type)
+    if applied:
+        fixed_valid, fixed_error = validate_mermaid_syntax(fixed, diagram_type)
+        if fixed_valid:
+            return fixed, True, None, applied
+    # Исправление не помогло - оставляем исходный код, ошибка понятнее модели
+    return code, False, error, applied
+
+
+class MermaidFixer:
+    """Runs fix_mermaid_code with validation and keeps per-rule fix rates"""
+
+    def __init__(self):
+        self.rule_stats: Dict[str, Dict[str, int]] = {
+            name: {"applied": 0, "applied_on_invalid": 0, "repaired": 0} for name, _ in FIX_RULES
+        }
+        self.checked = 0
+        self.invalid_before = 0
+        self.repaired = 0
+        self.round_trips_avoided = 0
+
+    def fix_and_validate(
+        self,
+        code: str,
+        diagram_type: str,
+        retry_pending: bool = False
+    ) -> Tuple[str, bool, Optional[str]]:
+        """Fix invalid code locally; valid code and failed fixes return the original.
+
+        retry_pending tells that invalid code would otherwise be sent back
+        to the LLM, so a local repair counts as an avoided round trip.
+        """
+        result, is_valid, error, applied = repair_mermaid_code(code, diagram_type)
+        # Валидный код не трогаем, так что applied непусто только для невалидного
+        was_valid = is_valid and not applied
+
+        self.checked += 1
+        if not was_valid:
+            self.invalid_before += 1
+            if is_valid:
+                self.repaired += 1
+                if retry_pending:
+                    self.round_trips_avoided += 1
+
+        for name in applied:
+            stats = self.rule_stats[name]
+            stats["applied"] += 1
+            stats["applied_on_invalid"] += 1
+            if is_valid:
+                stats["repaired"] += 1
+
+        if applied:
+            print(f"Mermaid fixer applied {applied}: valid {was_valid} -> {is_valid}")
+        return result, is_valid, error
+
+    def get_status(self) -> dict:
+        return {
+            "checked": self.checked,
+            "invalid_before": self.invalid_before,
+            "repaired": self.repaired,
+            "fix_rate": round(self.repaired / self.invalid_before, 3) if self.invalid_before else None,
+            "llm_round_trips_avoided": self.round_trips_avoided,
+            "rules": {
+                name: dict(
+                    stats,
+                    fix_rate=round(stats["repaired"] / stats["applied_on_invalid"], 3)
+                    if stats["applied_on_invalid"] else None
+                )
+                for name, stats in self.rule_stats.items()
+            }
+        }
+
+
+mermaid_fixer = MermaidFixer()
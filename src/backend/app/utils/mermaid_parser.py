@@ -0,0 +1,1179 @@
+import re
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+class MermaidSyntaxError(ValueError):
+    """Parse error pointing at the 1-based line and column of the offending text"""
+
+    def __init__(self, message: str, line: int, column: int):
+        super().__init__(f"Line {line}, column {column}: {message}")
+        self.message = message
+        self.line = line
+        self.column = column
+
+
+class Token:
+    __slots__ = ("kind", "value", "line", "column")
+
+    def __init__(self, kind: str, value: str, line: int, column: int):
+        self.kind = kind
+        self.value = value
+        self.line = line
+        self.column = column
+
+    def __repr__(self) -> str:
+        return f"Token({self.kind}, {self.value!r}, {self.line}:{self.column})"
+
+
+class Statement:
+    """One parsed statement: its kind, position, source text and parsed fields"""
+
+    __slots__ = ("kind", "line", "column", "text", "data")
+
+    def __init__(self, kind: str, line: int, column: int, text: str, data: Optional[dict] = None):
+        self.kind = kind
+        self.line = line
+        self.column = column
+        self.text = text
+        self.data = data or {}
+
+    def __repr__(self) -> str:
+        return f"Statement({self.kind}, {self.line}:{self.column}, {self.data})"
+
+
+class MermaidDiagram:
+    """AST of a parsed diagram.
+
+    nodes maps ids to their fields (flowchart nodes, participants, classes,
+    entities, states, pie slices, gantt/journey tasks, git commits), edges
+    holds links between them (flowchart links, messages, relations,
+    transitions, merges), groups holds containers (subgraphs, blocks,
+    sections, composite states, namespaces, branches).
+    """
+
+    __slots__ = ("diagram_type", "header", "direction", "nodes", "edges", "groups", "meta", "statements")
+
+    def __init__(self, diagram_type: str, header: str, direction: Optional[str] = None):
+        self.diagram_type = diagram_type
+        self.header = header
+        self.direction = direction
+        self.nodes: Dict[str, dict] = {}
+        self.edges: List[dict] = []
+        self.groups: List[dict] = []
+        self.meta: Dict[str, str] = {}
+        self.statements: List[Statement] = []
+
+    def add_node(self, node_id: str, **fields) -> dict:
+        """Register node on first mention; later mentions only fill missing fields"""
+        node = self.nodes.get(node_id)
+        if node is None:
+            node = self.nodes[node_id] = {"id": node_id}
+        for key, value in fields.items():
+            if value is not None and node.get(key) is None:
+                node[key] = value
+        return node
+
+
+# ---------------------------------------------------------------------------
+# Лексер
+# ---------------------------------------------------------------------------
+
+class _Scanner:
+    """Context-sensitive lexer over one statement.
+
+    The parser asks for the token kind it expects next, so the same text
+    (e.g. "o" or "-") can be an arrow head in one place and part of a name
+    in another - the way Mermaid's own lexer modes work.
+    """
+
+    __slots__ = ("text", "pos", "line", "offset")
+
+    def __init__(self, text: str, line: int, column: int):
+        self.text = text
+        self.pos = 0
+        self.line = line
+        self.offset = column - 1
+
+    def column(self, pos: Optional[int] = None) -> int:
+        return self.offset + (self.pos if pos is None else pos) + 1
+
+    def skip_ws(self):
+        text, pos = self.text, self.pos
+        while pos < len(text) and text[pos] in " \t":
+            pos += 1
+        self.pos = pos
+
+    def at_end(self) -> bool:
+        self.skip_ws()
+        return self.pos >= len(self.text)
+
+    def peek(self, literal: str) -> bool:
+        self.skip_ws()
+        return self.text.startswith(literal, self.pos)
+
+    def token(self, kind: str, pattern: "re.Pattern") -> Optional[Token]:
+        self.skip_ws()
+        match = pattern.match(self.text, self.pos)
+        if not match or match.end() == self.pos:
+            return None
+        token = Token(kind, match.group(), self.line, self.column())
+        self.pos = match.end()
+        return token
+
+    def literal(self, literal: str) -> bool:
+        if self.peek(literal):
+            self.pos += len(literal)
+            return True
+        return False
+
+    def expect(self, kind: str, pattern: "re.Pattern", what: str) -> Token:
+        token = self.token(kind, pattern)
+        if token is None:
+            self.error(f"Expected {what}")
+        return token
+
+    def expect_literal(self, literal: str, what: str):
+        if not self.literal(literal):
+            self.error(f"Expected {what}")
+
+    def rest(self) -> Token:
+        """Everything left on the line as one text token"""
+        self.skip_ws()
+        token = Token("text", self.text[self.pos:].strip(), self.line, self.column())
+        self.pos = len(self.text)
+        return token
+
+    def string(self) -> Optional[Token]:
+        """Double-quoted string (value without quotes)"""
+        if not self.peek('"'):
+            return None
+        start = self.pos
+        end = self.text.find('"', start + 1)
+        if end == -1:
+            self.error("Unterminated string", start)
+        self.pos = end + 1
+        return Token("string", self.text[start + 1:end], self.line, self.column(start))
+
+    def expect_end(self):
+        if not self.at_end():
+            self.error("Unexpected text")
+
+    def error(self, message: str, pos: Optional[int] = None):
+        pos = self.pos if pos is None else pos
+        found = self.text[pos:pos + 20].strip()
+        found = f"'{found}'" if found else "end of line"
+        raise MermaidSyntaxError(f"{message}, found {found}", self.line, self.column(pos))
+
+
+def _split_outside_quotes(text: str, separator: str) -> List[Tuple[str, int]]:
+    """Split on separator outside quotes and brackets, keeping start offsets"""
+    parts = []
+    depth = 0
+    in_quote = False
+    start = 0
+    for i, char in enumerate(text):
+        if char == '"':
+            in_quote = not in_quote
+        elif in_quote:
+            continue
+        elif char in "[({":
+            depth += 1
+        elif char in "])}":
+            depth = max(depth - 1, 0)
+        elif char == separator and depth == 0:
+            parts.append((text[start:i], start))
+            start = i + 1
+    parts.append((text[start:], start))
+    return parts
+
+
+def _logical_lines(code: str) -> Iterator[Tuple[str, int, int]]:
+    """Yield (text, line, column) of meaningful lines: no blanks, comments or front matter"""
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    in_front_matter = False
+    seen_content = False
+
+    for number, raw in enumerate(lines, 1):
+        text = raw.strip()
+        if not text:
+            continue
+        if text == "---" and (in_front_matter or not seen_content):
+            in_front_matter = not in_front_matter  # YAML front matter: --- title: ... ---
+            seen_content = True
+            continue
+        if in_front_matter or text.startswith("%%"):
+            continue
+        seen_content = True
+        yield text, number, len(raw) - len(raw.lstrip()) + 1
+
+
+# ---------------------------------------------------------------------------
+# Заголовки
+# ---------------------------------------------------------------------------
+
+HEADER_PATTERNS: List[Tuple[str, "re.Pattern"]] = [
+    ("flowchart", re.compile(r'(?:flowchart-elk|flowchart|graph)(?:[ \t]+(?P<direction>TD|TB|BT|RL|LR))?(?=[\s;]|$)')),
+    ("sequence", re.compile(r'sequenceDiagram(?=\s|$)')),
+    ("class", re.compile(r'classDiagram(?:-v2)?(?=\s|$)')),
+    ("er", re.compile(r'erDiagram(?=\s|$)')),
+    ("gantt", re.compile(r'gantt(?=\s|$)')),
+    ("state", re.compile(r'stateDiagram(?:-v2)?(?=\s|$)')),
+    ("pie", re.compile(r'pie(?:[ \t]+showData)?(?:[ \t]+title[ \t]+(?P<title>.*))?(?=\s|$)')),
+    ("journey", re.compile(r'journey(?=\s|$)')),
+    ("git", re.compile(r'gitGraph(?:[ \t]+(?P<direction>LR|TB|BT))?[ \t]*:?(?=\s|$)'))
+]
+
+# Пример заголовка для сообщений об ошибке
+HEADER_EXAMPLES = {
+    "flowchart": "flowchart TD",
+    "sequence": "sequenceDiagram",
+    "class": "classDiagram",
+    "er": "erDiagram",
+    "gantt": "gantt",
+    "state": "stateDiagram-v2",
+    "pie": "pie",
+    "journey": "journey",
+    "git": "gitGraph"
+}
+
+def detect_diagram_type(header_line: str) -> Optional[str]:
+    """Diagram type named by a header line ("graph LR" -> "flowchart"), or None"""
+    text = header_line.strip()
+    for kind, pattern in HEADER_PATTERNS:
+        if pattern.match(text):
+            return kind
+    return None
+
+
+DIRECTION_PATTERN = re.compile(r'(?:TD|TB|BT|RL|LR)\b')
+AS_KEYWORD = re.compile(r'as\b')
+
+
+# ---------------------------------------------------------------------------
+# Flowchart
+# ---------------------------------------------------------------------------
+
+FLOW_ID = re.compile(r'[\w$]+(?:[-.][\w$]+)*')
+FLOW_LINK = re.compile(r'[<xo]?(?:-{2,}[->xo]?|={2,}[=>xo]?|-\.+-[>xo]?)|~{3,}')
+FLOW_LINK_TEXT_OPEN = re.compile(r'(?:--|==|-\.)(?=[ \t])')
+FLOW_LINK_TEXT_CLOSE = re.compile(r'[ \t]*(-{2,}[->xo]|={2,}[=>xo]|\.+-[>xo]?)')
+FLOW_CLASS_SUFFIX = re.compile(r':::[\w-]+')
+FLOW_SUBGRAPH_TITLE = re.compile(r'([\w$-]+)\s*\[\s*"?(.*?)"?\s*\]$')
+
+# Открывающая скобка формы -> допустимые закрывающие и имя формы (длинные варианты первыми)
+FLOW_SHAPES: List[Tuple[str, List[Tuple[str, str]]]] = [
+    ("(((", [(")))", "double_circle")]),
+    ("((", [("))", "circle")]),
+    ("([", [("])", "stadium")]),
+    ("[[", [("]]", "subroutine")]),
+    ("[(", [(")]", "cylinder")]),
+    ("{{", [("}}", "hexagon")]),
+    ("[/", [("/]", "parallelogram"), ("\\]", "trapezoid")]),
+    ("[\\", [("\\]", "parallelogram_alt"), ("/]", "trapezoid_alt")]),
+    ("[", [("]", "rect")]),
+    ("(", [(")", "round")]),
+    ("{", [("}", "rhombus")]),
+    (">", [("]", "asymmetric")])
+]
+
+# Форма -> скобки, для обратной сборки кода из AST
+SHAPE_DELIMITERS: Dict[str, Tuple[str, str]] = {
+    shape: (opener, closer) for opener, closers in FLOW_SHAPES for closer, shape in closers
+}
+
+SHAPE_OPENING_CHARS = {"[", "(", "{", ">"}
+
+LABEL_FORBIDDEN = set("[](){}")
+
+FLOW_KEYWORD_STATEMENTS = ("classDef", "class", "style", "linkStyle", "click", "accTitle", "accDescr")
+
+
+def _flow_label(scanner: _Scanner, opener: str, closers: List[Tuple[str, str]]) -> Tuple[str, str]:
+    """Read node label after the opening delimiter, return (label, shape)"""
+    opener_pos = scanner.pos - len(opener)
+    text = scanner.text
+    scanner.skip_ws()
+
+    quoted = scanner.string()
+    if quoted is not None:
+        scanner.skip_ws()
+        for closer, shape in closers:
+            if text.startswith(closer, scanner.pos):
+                scanner.pos += len(closer)
+                return quoted.value, shape
+        scanner.error(f"Expected '{closers[0][0]}' after quoted label")
+
+    # Ближайшая закрывающая скобка формы
+    best = None
+    for closer, shape in closers:
+        end = text.find(closer, scanner.pos)
+        if end != -1 and (best is None or end < best[0]):
+            best = (end, closer, shape)
+    if best is None:
+        scanner.error(f"Unclosed '{opener}' in node label", opener_pos)
+
+    end, closer, shape = best
+    label = text[scanner.pos:end]
+    for offset, char in enumerate(label):
+        if char in LABEL_FORBIDDEN:
+            scanner.error(f"Unexpected '{char}' in node label (wrap the label in quotes)", scanner.pos + offset)
+    scanner.pos = end + len(closer)
+    return label.strip(), shape
+
+
+def _flow_node(scanner: _Scanner, diagram: MermaidDiagram, subgraph: Optional[dict]) -> str:
+    token = scanner.expect("id", FLOW_ID, "node id")
+    label = shape = None
+
+    if scanner.text[scanner.pos:scanner.pos + 1] in SHAPE_OPENING_CHARS:  # Форма пишется вплотную к id
+        for opener, closers in FLOW_SHAPES:
+            if scanner.text.startswith(opener, scanner.pos):
+                scanner.pos += len(opener)
+                label, shape = _flow_label(scanner, opener, closers)
+                break
+
+    css_class = scanner.token("class", FLOW_CLASS_SUFFIX)
+    node = diagram.add_node(token.value, label=label, shape=shape)
+    if css_class:
+        node.setdefault("classes", []).append(css_class.value[3:])
+    if subgraph is not None and token.value not in subgraph["nodes"]:
+        subgraph["nodes"].append(token.value)
+    return token.value
+
+
+def _flow_node_group(scanner: _Scanner, diagram: MermaidDiagram, subgraph: Optional[dict]) -> List[str]:
+    nodes = [_flow_node(scanner, diagram, subgraph)]
+    while scanner.literal("&"):
+        nodes.append(_flow_node(scanner, diagram, subgraph))
+    return nodes
+
+
+def _flow_link(scanner: _Scanner) -> Optional[Tuple[str, Optional[str]]]:
+    """Read a link with optional text (-- text --> or -->|text|), return (arrow, label)"""
+    scanner.skip_ws()
+    start = scanner.pos
+    label = None
+
+    open_match = FLOW_LINK_TEXT_OPEN.match(scanner.text, scanner.pos)
+    full_match = FLOW_LINK.match(scanner.text, scanner.pos)
+    if open_match and (full_match is None or full_match.end() == open_match.end()):
+        # -- text -->: текст до закрывающей части стрелки
+        close = FLOW_LINK_TEXT_CLOSE.search(scanner.text, open_match.end())
+        if close is None:
+            scanner.error("Unterminated link text", start)
+        label = scanner.text[open_match.end():close.start()].strip()
+        # "-- text -->" равносильно "-->|text|", "-. text .->" - "-.->|text|"
+        arrow = "-" + close.group(1) if open_match.group() == "-." else close.group(1)
+        scanner.pos = close.end()
+    elif full_match:
+        arrow = full_match.group()
+        scanner.pos = full_match.end()
+    else:
+        return None
+
+    if scanner.peek("|"):
+        bar = scanner.pos
+        end = scanner.text.find("|", bar + 1)
+        if end == -1:
+            scanner.error("Unclosed '|' in link label", bar)
+        label = scanner.text[bar + 1:end].strip().strip('"')
+        scanner.pos = end + 1
+    return arrow, label
+
+
+def _parse_flowchart(diagram: MermaidDiagram, statements: List[Tuple[str, int, int]]):
+    open_subgraphs: List[dict] = []
+
+    for text, line, column in statements:
+        scanner = _Scanner(text, line, column)
+        keyword = text.split(None, 1)[0].rstrip(":")
+        subgraph = open_subgraphs[-1] if open_subgraphs else None
+
+        if keyword == "subgraph":
+            scanner.pos = len("subgraph")
+            title_token = scanner.rest()
+            match = FLOW_SUBGRAPH_TITLE.match(title_token.value)
+            if match:
+                group_id, title = match.groups()
+            elif title_token.value:
+                group_id = title = title_token.value.strip('"')
+            else:
+                group_id, title = f"subgraph{len(diagram.groups) + 1}", None
+            group = {"kind": "subgraph", "id": group_id, "title": title, "nodes": [], "line": line,
+                     "parent": subgraph["id"] if subgraph else None}
+            diagram.groups.append(group)
+            open_subgraphs.append(group)
+            diagram.statements.append(Statement("subgraph", line, column, text, {"id": group_id, "title": title}))
+        elif text == "end":
+            if not open_subgraphs:
+                raise MermaidSyntaxError("Unexpected 'end' without open subgraph", line, column)
+            open_subgraphs.pop()
+            diagram.statements.append(Statement("end", line, column, text))
+        elif keyword == "direction":
+            scanner.pos = len("direction")
+            direction = scanner.expect("direction", DIRECTION_PATTERN, "direction (TD, LR, ...)")
+            scanner.expect_end()
+            if subgraph is not None:
+                subgraph["direction"] = direction.value
+            diagram.statements.append(Statement("direction", line, column, text, {"direction": direction.value}))
+        elif keyword in FLOW_KEYWORD_STATEMENTS and text[len(keyword):len(keyword) + 1] in (" ", "\t", ":"):
+            if not text[len(keyword):].strip(" \t:"):
+                raise MermaidSyntaxError(f"Expected arguments after '{keyword}'", line, column + len(keyword))
+            diagram.statements.append(Statement(keyword, line, column, text))
+        else:
+            nodes = _flow_node_group(scanner, diagram, subgraph)
+            edges = []
+            while True:
+                link = _flow_link(scanner)
+                if link is None:
+                    break
+                targets = _flow_node_group(scanner, diagram, subgraph)
+                for source in nodes:
+                    for target in targets:
+                        edges.append({"source": source, "target": target, "arrow": link[0], "label": link[1]})
+                nodes = targets
+            scanner.expect_end()
+            diagram.edges.extend(edges)
+            kind = "edges" if edges else "node"
+            diagram.statements.append(Statement(kind, line, column, text, {"edges": edges, "nodes": nodes}))
+
+    if open_subgraphs:
+        group = open_subgraphs[-1]
+        raise MermaidSyntaxError(f"Unclosed subgraph '{group['id']}' (missing 'end')", group["line"], 1)
+
+
+# ---------------------------------------------------------------------------
+# Sequence
+# ---------------------------------------------------------------------------
+
+SEQ_ACTOR = re.compile(r'[^\s:,;+\-<>()"]+(?:-(?![->x)])[^\s:,;+\-<>()"]+)*')
+SEQ_ARROW = re.compile(r'<<-{1,2}>>|-{1,2}>>|-{1,2}>|-{1,2}x|-{1,2}\)')
+SEQ_ACTIVATION = re.compile(r'[+-]')
+SEQ_PARTICIPANT_KIND = re.compile(r'participant\b|actor\b')
+SEQ_NOTE_POSITION = re.compile(r'(?:left of|right of|over)\b', re.IGNORECASE)
+SEQ_BLOCKS = {"loop", "alt", "opt", "par", "par_over", "critical", "break", "rect", "box"}
+SEQ_BLOCK_BRANCHES = {"else": ("alt",), "and": ("par", "par_over"), "option": ("critical",)}
+SEQ_SIMPLE = {"autonumber", "title", "accTitle", "accDescr", "link", "links", "properties", "details"}
+
+
+def _seq_participant(scanner: _Scanner, diagram: MermaidDiagram, kind: str) -> str:
+    name = scanner.expect("actor", SEQ_ACTOR, "participant name")
+    alias = None
+    if scanner.token("keyword", AS_KEYWORD):
+        alias = scanner.rest().value
+        if not alias:
+            scanner.error("Expected participant alias after 'as'")
+    scanner.expect_end()
+    diagram.add_node(name.value, label=alias or name.value, kind=kind)
+    return name.value
+
+
+def _parse_sequence(diagram: MermaidDiagram, statements: List[Tuple[str, int, int]]):
+    blocks: List[dict] = []
+
+    for text, line, column in statements:
+        scanner = _Scanner(text, line, column)
+        keyword = text.split(None, 1)[0]
+        lowered = keyword.lower()
+
+        if keyword in ("participant", "actor"):
+            scanner.pos = len(keyword)
+            name = _seq_participant(scanner, diagram, keyword)
+            diagram.statements.append(Statement("participant", line, column, text, {"id": name}))
+        elif keyword == "create":
+            scanner.pos = len(keyword)
+            kind = scanner.expect("keyword", SEQ_PARTICIPANT_KIND, "'participant' or 'actor'")
+            name = _seq_participant(scanner, diagram, kind.value)
+            diagram.statements.append(Statement("create", line, column, text, {"id": name}))
+        elif keyword in ("destroy", "activate", "deactivate"):
+            scanner.pos = len(keyword)
+            name = scanner.expect("actor", SEQ_ACTOR, "participant name")
+            scanner.expect_end()
+            diagram.statements.append(Statement(keyword, line, column, text, {"id": name.value}))
+        elif lowered == "note":
+            scanner.pos = len(keyword)
+            scanner.expect("position", SEQ_NOTE_POSITION, "note position (left of, right of, over)")
+            actors = [scanner.expect("actor", SEQ_ACTOR, "participant name").value]
+            if scanner.literal(","):
+                actors.append(scanner.expect("actor", SEQ_ACTOR, "participant name").value)
+            scanner.expect_literal(":", "':' before note text")
+            note = scanner.rest().value
+            diagram.statements.append(Statement("note", line, column, text, {"actors": actors, "text": note}))
+        elif keyword in SEQ_BLOCKS:
+            label = text[len(keyword):].strip()
+            block = {"kind": keyword, "label": label, "line": line, "branches": []}
+            diagram.groups.append(block)
+            blocks.append(block)
+            diagram.statements.append(Statement("block", line, column, text, {"kind": keyword, "label": label}))
+        elif keyword in SEQ_BLOCK_BRANCHES:
+            if not blocks or blocks[-1]["kind"] not in SEQ_BLOCK_BRANCHES[keyword]:
+                expected = "' or '".join(SEQ_BLOCK_BRANCHES[keyword])
+                raise MermaidSyntaxError(f"'{keyword}' outside '{expected}' block", line, column)
+            blocks[-1]["branches"].append(text[len(keyword):].strip())
+            diagram.statements.append(Statement("branch", line, column, text, {"kind": keyword}))
+        elif text == "end":
+            if not blocks:
+                raise MermaidSyntaxError("Unexpected 'end' without open block", line, column)
+            blocks.pop()
+            diagram.statements.append(Statement("end", line, column, text))
+        elif keyword.rstrip(":") in SEQ_SIMPLE:
+            diagram.statements.append(Statement(keyword.rstrip(":"), line, column, text))
+        else:
+            source = scanner.expect("actor", SEQ_ACTOR, "participant name or statement")
+            arrow = scanner.token("arrow", SEQ_ARROW)
+            if arrow is None:
+                scanner.error(f"Expected message arrow (->>, -->>, ->, -x, -)) after '{source.value}'")
+            activation = scanner.token("activation", SEQ_ACTIVATION)
+            target = scanner.expect("actor", SEQ_ACTOR, "message target")
+            scanner.expect_literal(":", "':' before message text")
+            message = scanner.rest().value
+
+            diagram.add_node(source.value, label=source.value, kind="participant")
+            diagram.add_node(target.value, label=target.value, kind="participant")
+            edge = {"source": source.value, "target": target.value, "arrow": arrow.value, "label": message,
+                    "activation": activation.value if activation else None}
+            diagram.edges.append(edge)
+            diagram.statements.append(Statement("message", line, column, text, edge))
+
+    if blocks:
+        block = blocks[-1]
+        raise MermaidSyntaxError(f"Unclosed '{block['kind']}' block (missing 'end')", block["line"], 1)
+
+
+# ---------------------------------------------------------------------------
+# Class
+# ---------------------------------------------------------------------------
+
+CLASS_NAME = re.compile(r'`[^`]+`|[\w$]+(?:~[^~]+~)?')
+CLASS_RELATION = re.compile(r'(?:<\||\*|o|<|\(\))?(?:--|\.\.)(?:\|>|\*|o|>|\(\))?')
+CLASS_NOTE_FOR = re.compile(r'for\b')
+CLASS_ANNOTATION = re.compile(r'<<\s*[^<>]+?\s*>>')
+CLASS_SIMPLE = {"direction", "cssClass", "classDef", "style", "click", "callback", "link", "accTitle", "accDescr", "title"}
+
+
+def _parse_class(diagram: MermaidDiagram, statements: List[Tuple[str, int, int]]):
+    body: Optional[dict] = None  # Класс, чье тело { ... } сейчас читаем
+    namespaces: List[dict] = []
+
+    for text, line, column in statements:
+        scanner = _Scanner(text, line, column)
+        keyword = text.split(None, 1)[0]
+
+        if body is not None:
+            if text == "}":
+                body = None
+                continue
+            if "{" in text:
+                raise MermaidSyntaxError(f"Unexpected '{{' inside class '{body['id']}' body", line, column + text.index("{"))
+            if text.startswith("<<"):
+                body.setdefault("annotations", []).append(text.strip("<> "))
+            else:
+                body["members"].append(text)
+            continue
+
+        if keyword == "class":
+            scanner.pos = len(keyword)
+            name = scanner.expect("class", CLASS_NAME, "class name")
+            node = diagram.add_node(name.value, members=[])
+            if scanner.literal("["):
+                label = scanner.string()
+                if label is None:
+                    scanner.error("Expected quoted class label")
+                scanner.expect_literal("]", "']' after class label")
+                node["label"] = label.value
+            scanner.token("class", FLOW_CLASS_SUFFIX)
+            if scanner.literal("{"):
+                if scanner.literal("}"):
+                    pass
+                else:
+                    body = node
+            scanner.expect_end()
+            for namespace in namespaces[-1:]:
+                namespace["nodes"].append(name.value)
+            diagram.statements.append(Statement("class", line, column, text, {"id": name.value}))
+        elif keyword == "namespace":
+            scanner.pos = len(keyword)
+            name = scanner.expect("namespace", CLASS_NAME, "namespace name")
+            scanner.expect_literal("{", "'{' after namespace name")
+            scanner.expect_end()
+            group = {"kind": "namespace", "id": name.value, "nodes": [], "line": line}
+            diagram.groups.append(group)
+            namespaces.append(group)
+            diagram.statements.append(Statement("namespace", line, column, text, {"id": name.value}))
+        elif text == "}":
+            if not namespaces:
+                raise MermaidSyntaxError("Unexpected '}'", line, column)
+            namespaces.pop()
+        elif keyword == "note":
+            scanner.pos = len(keyword)
+            target = None
+            if scanner.token("keyword", CLASS_NOTE_FOR):
+                target = scanner.expect("class", CLASS_NAME, "class name after 'note for'").value
+            note = scanner.string()
+            if note is None:
+                scanner.error("Expected quoted note text")
+            scanner.expect_end()
+            diagram.statements.append(Statement("note", line, column, text, {"target": target, "text": note.value}))
+        elif keyword in CLASS_SIMPLE:
+            diagram.statements.append(Statement(keyword, line, column, text))
+        elif text.startswith("<<"):
+            annotation = scanner.expect("annotation", CLASS_ANNOTATION, "annotation like <<interface>>")
+            name = scanner.expect("class", CLASS_NAME, "class name after annotation")
+            scanner.expect_end()
+            node = diagram.add_node(name.value, members=[])
+            node.setdefault("annotations", []).append(annotation.value.strip("<> "))
+            diagram.statements.append(Statement("annotation", line, column, text, {"id": name.value}))
+        else:
+            source = scanner.expect("class", CLASS_NAME, "class name or statement")
+            if scanner.literal(":"):
+                # Name : +member
+                member = scanner.rest().value
+                if not member:
+                    scanner.error("Expected member after ':'")
+                diagram.add_node(source.value, members=[])["members"].append(member)
+                diagram.statements.append(Statement("member", line, column, text, {"id": source.value, "member": member}))
+                continue
+
+            if scanner.at_end():
+                diagram.add_node(source.value, members=[])
+                diagram.statements.append(Statement("class", line, column, text, {"id": source.value}))
+                continue
+
+            source_cardinality = scanner.string()
+            relation = scanner.token("relation", CLASS_RELATION)
+            if relation is None:
+                scanner.error(f"Expected relation (<|--, *--, o--, -->, ..>, --) after '{source.value}'")
+            target_cardinality = scanner.string()
+            target = scanner.expect("class", CLASS_NAME, "target class name")
+            label = None
+            if scanner.literal(":"):
+                label = scanner.rest().value
+            scanner.expect_end()
+
+            diagram.add_node(source.value, members=[])
+            diagram.add_node(target.value, members=[])
+            edge = {
+                "source": source.value, "target": target.value, "arrow": relation.value, "label": label,
+                "source_cardinality": source_cardinality.value if source_cardinality else None,
+                "target_cardinality": target_cardinality.value if target_cardinality else None
+            }
+            diagram.edges.append(edge)
+            diagram.statements.append(Statement("relation", line, column, text, edge))
+
+    if body is not None:
+        raise MermaidSyntaxError(f"Unclosed body of class '{body['id']}' (missing '}}')", statements[-1][1], 1)
+    if namespaces:
+        raise MermaidSyntaxError(f"Unclosed namespace '{namespaces[-1]['id']}' (missing '}}')", namespaces[-1]["line"], 1)
+
+
+# ---------------------------------------------------------------------------
+# ER
+# ---------------------------------------------------------------------------
+
+ER_ENTITY = re.compile(r'[\w][\w-]*|"[^"]+"')
+ER_RELATION = re.compile(r'(?P<left>\|o|\|\||\}o|\}\|)(?P<line>--|\.\.)(?P<right>o\||\|\||o\{|\|\{)')
+ER_ATTRIBUTE_TYPE = re.compile(r'[A-Za-z_][\w\-\[\]()]*')
+ER_ATTRIBUTE_NAME = re.compile(r'\*?[A-Za-z_][\w\-\[\]()]*')
+ER_KEY = re.compile(r'(?:PK|FK|UK)\b')
+ER_SIMPLE = {"direction", "style", "classDef", "class", "accTitle", "accDescr", "title"}
+
+
+def _parse_er_attribute(scanner: _Scanner) -> dict:
+    attr_type = scanner.expect("type", ER_ATTRIBUTE_TYPE, "attribute type")
+    name = scanner.expect("name", ER_ATTRIBUTE_NAME, f"attribute name after type '{attr_type.value}'")
+    keys = []
+    key = scanner.token("key", ER_KEY)
+    while key:
+        keys.append(key.value)
+        if not scanner.literal(","):
+            break
+        key = scanner.expect("key", ER_KEY, "key (PK, FK, UK) after ','")
+    comment = scanner.string()
+    if not scanner.at_end():
+        scanner.error(f"Unexpected text in attribute '{name.value}' (allowed: PK, FK, UK and a quoted comment)")
+    return {"type": attr_type.value, "name": name.value, "keys": keys, "comment": comment.value if comment else None}
+
+
+def _parse_er(diagram: MermaidDiagram, statements: List[Tuple[str, int, int]]):
+    body: Optional[dict] = None
+
+    for text, line, column in statements:
+        scanner = _Scanner(text, line, column)
+
+        if body is not None:
+            if text == "}":
+                body = None
+                continue
+            body["attributes"].append(_parse_er_attribute(scanner))
+            continue
+
+        keyword = text.split(None, 1)[0]
+        if keyword in ER_SIMPLE:
+            diagram.statements.append(Statement(keyword, line, column, text))
+            continue
+
+        entity = scanner.expect("entity", ER_ENTITY, "entity name")
+        name = entity.value.strip('"')
+        alias = None
+        if scanner.literal("["):
+            alias_token = scanner.string()
+            if alias_token is None:
+                scanner.error("Expected quoted entity alias")
+            scanner.expect_literal("]", "']' after entity alias")
+            alias = alias_token.value
+
+        if scanner.literal("{"):
+            node = diagram.add_node(name, label=alias, attributes=[])
+            if not scanner.literal("}"):
+                body = node
+            scanner.expect_end()
+            diagram.statements.append(Statement("entity", line, column, text, {"id": name}))
+            continue
+
+        if scanner.at_end():
+            diagram.add_node(name, label=alias, attributes=[])
+            diagram.statements.append(Statement("entity", line, column, text, {"id": name}))
+            continue
+
+        relation = scanner.token("relation", ER_RELATION)
+        if relation is None:
+            scanner.error(f"Expected relationship (||--o{{, }}|..|{{, ...) or '{{' after '{name}'")
+        target = scanner.expect("entity", ER_ENTITY, "target entity name")
+        scanner.expect_literal(":", "':' and relationship label")
+        label = scanner.string()
+        label_value = label.value if label else scanner.rest().value
+        if label is not None:
+            scanner.expect_end()
+        if not label_value and label is None:
+            scanner.error("Expected relationship label after ':'")
+
+        diagram.add_node(name, label=alias, attributes=[])
+        diagram.add_node(target.value.strip('"'), attributes=[])
+        edge = {"source": name, "target": target.value.strip('"'), "arrow": relation.value, "label": label_value}
+        diagram.edges.append(edge)
+        diagram.statements.append(Statement("relation", line, column, text, edge))
+
+    if body is not None:
+        raise MermaidSyntaxError(f"Unclosed attributes of entity '{body['id']}' (missing '}}')", statements[-1][1], 1)
+
+
+# ---------------------------------------------------------------------------
+# Gantt
+# ---------------------------------------------------------------------------
+
+GANTT_SETTINGS = {
+    "title", "dateFormat", "axisFormat", "tickInterval", "excludes", "includes", "todayMarker",
+    "weekday", "inclusiveEndDates", "topAxis", "displayMode", "accTitle", "accDescr", "click"
+}
+GANTT_TAGS = {"done", "active", "crit", "milestone"}
+GANTT_DURATION = re.compile(r'\d+(?:\.\d+)?(?:ms|[smhdwMy])$')
+GANTT_DATE = re.compile(r'\d[\d\-/.:T ]*$')
+GANTT_AFTER = re.compile(r'after(?:\s+[\w-]+)+$')
+GANTT_UNTIL = re.compile(r'until(?:\s+[\w-]+)+$')
+GANTT_ID = re.compile(r'[A-Za-z_][\w-]*$')
+
+
+def _parse_gantt(diagram: MermaidDiagram, statements: List[Tuple[str, int, int]]):
+    section = None
+
+    for text, line, column in statements:
+        keyword = text.split(None, 1)[0].rstrip(":")
+
+        if keyword in GANTT_SETTINGS:
+            value = text[len(keyword):].strip(" \t:")
+            diagram.meta[keyword] = value
+            diagram.statements.append(Statement(keyword, line, column, text, {"value": value}))
+            continue
+        if keyword == "section":
+            section = {"kind": "section", "title": text[len(keyword):].strip(), "nodes": [], "line": line}
+            diagram.groups.append(section)
+            diagram.statements.append(Statement("section", line, column, text, {"title": section["title"]}))
+            continue
+
+        colon = text.find(":")
+        if colon == -1:
+            raise MermaidSyntaxError(f"Expected ':' in task '{text[:30]}' (task name : [tags,] [id,] [start,] end)", line, column + len(text))
+        name = text[:colon].strip()
+        if not name:
+            raise MermaidSyntaxError("Expected task name before ':'", line, column)
+
+        parts = []
+        offset = colon + 1
+        for part, start in _split_outside_quotes(text[colon + 1:], ","):
+            parts.append((part.strip(), column + offset + start + len(part) - len(part.lstrip())))
+        if not parts[-1][0]:
+            raise MermaidSyntaxError("Expected task duration or end date", line, parts[-1][1])
+
+        tags = []
+        while parts and parts[0][0] in GANTT_TAGS:
+            tags.append(parts.pop(0)[0])
+        if len(parts) > 3:
+            raise MermaidSyntaxError("Too many task fields (expected [id,] [start,] end)", line, parts[3][1])
+
+        task = {"id": None, "label": name, "tags": tags, "start": None, "end": None, "section": section["title"] if section else None}
+        if not parts:
+            if "milestone" not in tags:
+                raise MermaidSyntaxError("Expected task duration or end date", line, column + len(text))
+        else:
+            end_value, end_column = parts[-1]
+            if not (GANTT_DURATION.match(end_value) or GANTT_DATE.match(end_value) or GANTT_UNTIL.match(end_value)):
+                raise MermaidSyntaxError(f"Invalid task end '{end_value}' (use a duration like 3d or a date)", line, end_column)
+            task["end"] = end_value
+            if len(parts) >= 2:
+                start_value, start_column = parts[-2]
+                if not (GANTT_DATE.match(start_value) or GANTT_AFTER.match(start_value)):
+                    if len(parts) == 2 and GANTT_ID.match(start_value):
+                        task["id"] = start_value  # id, 3d - старт после предыдущей задачи
+                    else:
+                        raise MermaidSyntaxError(f"Invalid task start '{start_value}' (use a date or 'after id')", line, start_column)
+                else:
+                    task["start"] = start_value
+            if len(parts) == 3:
+                id_value, id_column = parts[0]
+                if not GANTT_ID.match(id_value):
+                    raise MermaidSyntaxError(f"Invalid task id '{id_value}'", line, id_column)
+                task["id"] = id_value
+
+        node_id = task["id"] or f"task{len(diagram.nodes) + 1}"
+        diagram.nodes[node_id] = task
+        if section is not None:
+            section["nodes"].append(node_id)
+        diagram.statements.append(Statement("task", line, column, text, task))
+
+    if not diagram.nodes:
+        raise MermaidSyntaxError("Gantt chart has no tasks", statements[-1][1], 1)
+
+
+# ---------------------------------------------------------------------------
+# State
+# ---------------------------------------------------------------------------
+
+STATE_ID = re.compile(r'\[\*\]|[\w$]+(?:[-.][\w$]+)*')
+STATE_TRANSITION = re.compile(r'-->')
+STATE_STEREOTYPE = re.compile(r'<<(?:fork|join|choice)>>')
+STATE_NOTE_POSITION = re.compile(r'(?:left|right) of\b')
+STATE_SIMPLE = {"direction", "classDef", "class", "style", "hide", "accTitle", "accDescr", "title", "scale"}
+
+
+def _parse_state(diagram: MermaidDiagram, statements: List[Tuple[str, int, int]]):
+    composites: List[dict] = []
+    note: Optional[Tuple[int, int]] = None  # Позиция открытой многострочной заметки
+
+    for text, line, column in statements:
+        scanner = _Scanner(text, line, column)
+        keyword = text.split(None, 1)[0]
+        composite = composites[-1] if composites else None
+
+        if note is not None:
+            if text == "end note":
+                note = None
+            continue
+
+        if keyword == "state":
+            scanner.pos = len(keyword)
+            description = scanner.string()
+            if description is not None:
+                scanner.expect("keyword", AS_KEYWORD, "'as' after state description")
+            state = scanner.expect("state", STATE_ID, "state id")
+            node = diagram.add_node(state.value, label=description.value if description else None)
+            stereotype = scanner.token("stereotype", STATE_STEREOTYPE)
+            if stereotype:
+                node["stereotype"] = stereotype.value.strip("<>")
+            if scanner.literal(":"):
+                diagram.add_node(state.value, label=scanner.rest().value)
+            if scanner.literal("{"):
+                group = {"kind": "composite", "id": state.value, "nodes": [], "line": line}
+                diagram.groups.append(group)
+                composites.append(group)
+            scanner.expect_end()
+            if composite is not None:
+                composite["nodes"].append(state.value)
+            diagram.statements.append(Statement("state", line, column, text, {"id": state.value}))
+        elif text == "}":
+            if not composites:
+                raise MermaidSyntaxError("Unexpected '}' without open composite state", line, column)
+            composites.pop()
+        elif text == "--":
+            if composite is None:
+                raise MermaidSyntaxError("Concurrency separator '--' outside composite state", line, column)
+            diagram.statements.append(Statement("concurrency", line, column, text))
+        elif keyword == "note":
+            scanner.pos = len(keyword)
+            scanner.expect("position", STATE_NOTE_POSITION, "note position (left of, right of)")
+            state = scanner.expect("state", STATE_ID, "state id")
+            if scanner.literal(":"):
+                scanner.rest()
+            else:
+                scanner.expect_end()
+                note = (line, column)
+            diagram.statements.append(Statement("note", line, column, text, {"id": state.value}))
+        elif keyword in STATE_SIMPLE:
+            diagram.statements.append(Statement(keyword, line, column, text))
+        else:
+            source = scanner.expect("state", STATE_ID, "state id or statement")
+            scanner.token("class", FLOW_CLASS_SUFFIX)
+            if scanner.literal(":"):
+                diagram.add_node(source.value, label=scanner.rest().value)
+                diagram.statements.append(Statement("description", line, column, text, {"id": source.value}))
+                continue
+            if scanner.at_end():
+                diagram.add_node(source.value)
+                diagram.statements.append(Statement("state", line, column, text, {"id": source.value}))
+                continue
+
+            if scanner.token("arrow", STATE_TRANSITION) is None:
+                scanner.error(f"Expected '-->' after '{source.value}'")
+            target = scanner.expect("state", STATE_ID, "target state id")
+            label = None
+            if scanner.literal(":"):
+                label = scanner.rest().value
+            scanner.expect_end()
+
+            for state in (source.value, target.value):
+                diagram.add_node(state)
+                if composite is not None and state != "[*]" and state not in composite["nodes"]:
+                    composite["nodes"].append(state)
+            edge = {"source": source.value, "target": target.value, "arrow": "-->", "label": label}
+            diagram.edges.append(edge)
+            diagram.statements.append(Statement("transition", line, column, text, edge))
+
+    if note is not None:
+        raise MermaidSyntaxError("Unclosed note (missing 'end note')", note[0], note[1])
+    if composites:
+        raise MermaidSyntaxError(f"Unclosed composite state '{composites[-1]['id']}' (missing '}}')", composites[-1]["line"], 1)
+
+
+# ---------------------------------------------------------------------------
+# Pie, journey, git
+# ---------------------------------------------------------------------------
+
+PIE_VALUE = re.compile(r'\d+(?:\.\d+)?|\.\d+')
+
+
+def _parse_pie(diagram: MermaidDiagram, statements: List[Tuple[str, int, int]]):
+    for text, line, column in statements:
+        scanner = _Scanner(text, line, column)
+        keyword = text.split(None, 1)[0]
+
+        if keyword in ("title", "accTitle", "accDescr", "showData"):
+            diagram.meta[keyword] = text[len(keyword):].strip(" \t:")
+            diagram.statements.append(Statement(keyword, line, column, text))
+            continue
+
+        label = scanner.string()
+        if label is None:
+            scanner.error('Expected quoted slice label like "Label" : 42')
+        scanner.expect_literal(":", "':' after slice label")
+        value = scanner.expect("number", PIE_VALUE, "slice value (number)")
+        scanner.expect_end()
+        diagram.nodes[label.value] = {"id": label.value, "label": label.value, "value": float(value.value)}
+        diagram.statements.append(Statement("slice", line, column, text, {"label": label.value, "value": float(value.value)}))
+
+    if not diagram.nodes:
+        raise MermaidSyntaxError("Pie chart has no slices", statements[-1][1] if statements else 1, 1)
+
+
+def _parse_journey(diagram: MermaidDiagram, statements: List[Tuple[str, int, int]]):
+    section = None
+
+    for text, line, column in statements:
+        keyword = text.split(None, 1)[0]
+
+        if keyword in ("title", "accTitle", "accDescr"):
+            diagram.meta[keyword] = text[len(keyword):].strip(" \t:")
+            diagram.statements.append(Statement(keyword, line, column, text))
+            continue
+        if keyword == "section":
+            section = {"kind": "section", "title": text[len(keyword):].strip(), "nodes": [], "line": line}
+            diagram.groups.append(section)
+            diagram.statements.append(Statement("section", line, column, text, {"title": section["title"]}))
+            continue
+
+        parts = text.split(":")
+        if len(parts) < 2:
+            raise MermaidSyntaxError("Expected task as 'Task name: score: actors'", line, column + len(text))
+        name, score = parts[0].strip(), parts[1].strip()
+        if not name:
+            raise MermaidSyntaxError("Expected task name before ':'", line, column)
+        score_column = column + len(parts[0]) + 1 + len(parts[1]) - len(parts[1].lstrip())
+        if not score.isdigit():
+            raise MermaidSyntaxError(f"Task score must be a number from 1 to 5, found '{score}'", line, score_column)
+        actors = [actor.strip() for actor in ":".join(parts[2:]).split(",") if actor.strip()]
+
+        node_id = f"task{len(diagram.nodes) + 1}"
+        diagram.nodes[node_id] = {"id": node_id, "label": name, "score": int(score), "actors": actors,
+                                  "section": section["title"] if section else None}
+        if section is not None:
+            section["nodes"].append(node_id)
+        diagram.statements.append(Statement("task", line, column, text, diagram.nodes[node_id]))
+
+    if not diagram.nodes:
+        raise MermaidSyntaxError("User journey has no tasks", statements[-1][1], 1)
+
+
+GIT_BRANCH = re.compile(r'"[^"]+"|[\w][\w\-./]*')
+GIT_OPTION = re.compile(r'(?P<key>\w+)\s*:\s*(?P<value>"[^"]*"|[\w-]+)')
+GIT_OPTIONS = {
+    "commit": {"id", "tag", "type", "msg"},
+    "merge": {"id", "tag", "type"},
+    "cherry-pick": {"id", "parent", "tag"},
+    "branch": {"order"}
+}
+GIT_COMMIT_TYPES = {"NORMAL", "REVERSE", "HIGHLIGHT"}
+
+
+def _git_options(scanner: _Scanner, command: str) -> Dict[str, str]:
+    options = {}
+    while not scanner.at_end():
+        option = scanner.token("option", GIT_OPTION)
+        if option is None:
+            scanner.error(f"Expected option like id: \"...\" for '{command}'")
+        match = GIT_OPTION.match(option.value)
+        key, value = match.group("key"), match.group("value").strip('"')
+        if key not in GIT_OPTIONS[command]:
+            raise MermaidSyntaxError(f"Unknown option '{key}' for '{command}'", option.line, option.column)
+        if key == "type" and value not in GIT_COMMIT_TYPES:
+            raise MermaidSyntaxError(f"Invalid commit type '{value}' (NORMAL, REVERSE, HIGHLIGHT)", option.line, option.column)
+        options[key] = value
+    return options
+
+
+def _parse_git(diagram: MermaidDiagram, statements: List[Tuple[str, int, int]]):
+    branches = {"main": {"kind": "branch", "id": "main", "nodes": [], "line": 1}}
+    current = "main"
+    diagram.groups.append(branches["main"])
+
+    for text, line, column in statements:
+        scanner = _Scanner(text, line, column)
+        command = text.split(None, 1)[0]
+        scanner.pos = len(command)
+
+        if command in ("accTitle", "accDescr", "title"):
+            diagram.statements.append(Statement(command, line, column, text))
+        elif command == "commit":
+            options = _git_options(scanner, command)
+            commit_id = options.get("id") or f"commit{len(diagram.nodes) + 1}"
+            diagram.nodes[commit_id] = dict(options, id=commit_id, branch=current)
+            branches[current]["nodes"].append(commit_id)
+            diagram.statements.append(Statement("commit", line, column, text, diagram.nodes[commit_id]))
+        elif command == "branch":
+            name = scanner.expect("branch", GIT_BRANCH, "branch name").value.strip('"')
+            if name in branches:
+                raise MermaidSyntaxError(f"Branch '{name}' already exists", line, column + len(command) + 1)
+            _git_options(scanner, command)
+            branches[name] = {"kind": "branch", "id": name, "nodes": [], "line": line, "parent": current}
+            diagram.groups.append(branches[name])
+            current = name
+            diagram.statements.append(Statement("branch", line, column, text, {"id": name}))
+        elif command in ("checkout", "switch"):
+            name = scanner.expect("branch", GIT_BRANCH, "branch name")
+            scanner.expect_end()
+            if name.value.strip('"') not in branches:
+                raise MermaidSyntaxError(f"Unknown branch '{name.value}' (create it with 'branch' first)", name.line, name.column)
+            current = name.value.strip('"')
+            diagram.statements.append(Statement("checkout", line, column, text, {"id": current}))
+        elif command == "merge":
+            name = scanner.expect("branch", GIT_BRANCH, "branch name")
+            source = name.value.strip('"')
+            if source not in branches:
+                raise MermaidSyntaxError(f"Unknown branch '{name.value}'", name.line, name.column)
+            if source == current:
+                raise MermaidSyntaxError(f"Cannot merge branch '{source}' into itself", name.line, name.column)
+            options = _git_options(scanner, command)
+            edge = {"source": source, "target": current, "arrow": "merge", "label": options.get("tag")}
+            diagram.edges.append(edge)
+            diagram.statements.append(Statement("merge", line, column, text, edge))
+        elif command == "cherry-pick":
+            options = _git_options(scanner, command)
+            if "id" not in options:
+                scanner.error("Expected id: \"...\" for 'cherry-pick'")
+            diagram.statements.append(Statement("cherry-pick", line, column, text, options))
+        else:
+            raise MermaidSyntaxError(f"Unknown gitGraph command '{command}' (commit, branch, checkout, merge, cherry-pick)", line, column)
+
+    if not diagram.nodes:
+        raise MermaidSyntaxError("Git graph has no commits", statements[-1][1] if statements else 1, 1)
+
+
+# ---------------------------------------------------------------------------
+# Точка входа
+# ---------------------------------------------------------------------------
+
+PARSERS: Dict[str, Callable[[MermaidDiagram, List[Tuple[str, int, int]]], None]] = {
+    "flowchart": _parse_flowchart,
+    "sequence": _parse_sequence,
+    "class": _parse_class,
+    "er": _parse_er,
+    "gantt": _parse_gantt,
+    "state": _parse_state,
+    "pie": _parse_pie,
+    "journey": _parse_journey,
+    "git": _parse_git
+}
+
+SUPPORTED_DIAGRAM_TYPES = tuple(PARSERS)
+
+# Типы, где ';' разделяет операторы в одной строке
+SEMICOLON_SEPARATED = {"flowchart", "state"}
+
+
+def _chain_lines(first: List[Tuple[str, int, int]], rest: Iterator[Tuple[str, int, int]]) -> Iterator[Tuple[str, int, int]]:
+    yield from first
+    yield from rest
+
+
+def parse_mermaid(code: str, diagram_type: Optional[str] = None) -> MermaidDiagram:
+    """Parse mermaid code into a MermaidDiagram.
+
+    If diagram_type is given the header must match it. Raises
+    MermaidSyntaxError with the line and column of the first error.
+    """
+    lines = _logical_lines(code or "")
+    first = next(lines, None)
+    if first is None:
+        raise MermaidSyntaxError("Empty diagram", 1, 1)
+
+    text, line, column = first
+    detected = None
+    for kind, pattern in HEADER_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            detected = kind
+            break
+
+    if detected is None or (diagram_type in PARSERS and detected != diagram_type):
+        expected = HEADER_EXAMPLES.get(diagram_type, "a diagram type keyword")
+        found = text.split(None, 1)[0][:30]
+        raise MermaidSyntaxError(f"Expected '{expected}' header, found '{found}'", line, column)
+
+    groups = match.groupdict()
+    diagram = MermaidDiagram(detected, match.group(), groups.get("direction"))
+    if groups.get("title"):
+        diagram.meta["title"] = groups["title"].strip()
+
+    statements: List[Tuple[str, int, int]] = []
+    remainder = text[match.end():]
+    if remainder.strip():
+        stripped = remainder.lstrip()
+        if detected in SEMICOLON_SEPARATED and stripped.startswith(";"):
+            # graph TD; A-->B; B-->C - вся диаграмма в одной строке
+            lines = _chain_lines([(stripped[1:], line, column + len(text) - len(stripped) + 1)], lines)
+        else:
+            raise MermaidSyntaxError("Unexpected text after header", line, column + match.end())
+
+    for text, line, column in lines:
+        if not text.strip():
+            continue
+        if detected in SEMICOLON_SEPARATED and ";" in text:
+            for part, start in _split_outside_quotes(text, ";"):
+                if part.strip():
+                    statements.append((part.strip(), line, column + start + len(part) - len(part.lstrip())))
+        else:
+            statements.append((text, line, column))
+
+    if not statements:
+        raise MermaidSyntaxError("Diagram has no content after the header", line, column)
+
+    PARSERS[detected](diagram, statements)
+    return diagram
+
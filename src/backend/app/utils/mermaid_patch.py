@@ -0,0 +1,318 @@
+"""Edit operations on parsed Mermaid flowcharts.
+
+For a modification the model returns a short JSON list of operations
+instead of the whole diagram, e.g.
+
+    [{"op": "add_node", "id": "C", "label": "Check stock"},
+     {"op": "add_edge", "from": "B", "to": "C", "label": "yes"}]
+
+apply_edit_operations applies them to the AST of the stored code and writes
+the flowchart back: node declarations grouped by subgraph, then links, then
+classDef/class/style/click/linkStyle with ids and link numbers updated.
+Ids, labels, shapes and order are kept; comments and original line breaks
+are not.
+"""
+import json
+import re
+from typing import Dict, List, Optional
+
+from .mermaid_parser import (
+    parse_mermaid, MermaidDiagram, MermaidSyntaxError, SHAPE_DELIMITERS, FLOW_ID, FLOW_LINK, DIRECTION_PATTERN
+)
+
+# Типы диаграмм, для которых модификация возможна патчем
+PATCHABLE_TYPES = {"flowchart"}
+
+# Больше операций - уже не "небольшая правка", дешевле перегенерировать целиком
+MAX_OPERATIONS = 100
+
+EDGE_OPERATIONS = {"add_edge", "remove_edge", "set_edge_label"}
+NODE_OPERATIONS = {"add_node", "remove_node", "rename_node", "set_label", "set_shape"}
+OPERATIONS = NODE_OPERATIONS | EDGE_OPERATIONS | {"set_direction"}
+
+# Ключевые слова, которые нельзя использовать как id узла
+RESERVED_IDS = {"end", "subgraph", "graph", "flowchart", "style", "class", "classDef", "click", "linkStyle", "direction"}
+
+# Символы, из-за которых подпись узла нужно брать в кавычки
+LABEL_SPECIAL = re.compile(r'[\[\](){}|<>;#&"]|^\s|\s$')
+
+# Операторы со списком id узлов вторым словом
+NODE_LIST_STATEMENTS = ("class", "style", "click")
+
+
+class PatchError(ValueError):
+    """Edit operations cannot be parsed or applied"""
+
+
+def parse_edit_operations(text: str) -> List[dict]:
+    """Extract the operation list from a model answer (bare JSON, fenced or with prose around)"""
+    starts = [index for index in (text.find("["), text.find("{")) if index != -1]
+    if not starts:
+        raise PatchError("No JSON in the answer")
+    start = min(starts)
+    end = text.rfind("]" if text[start] == "[" else "}")
+    if end <= start:
+        raise PatchError("Unterminated JSON in the answer")
+
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError as e:
+        raise PatchError(f"Invalid JSON: {e}")
+    if isinstance(data, dict):
+        data = data.get("operations", [data] if "op" in data else None)
+    if not isinstance(data, list):
+        raise PatchError("Expected a list of operations")
+    if len(data) > MAX_OPERATIONS:
+        raise PatchError(f"Too many operations ({len(data)})")
+
+    for index, operation in enumerate(data):
+        if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+            raise PatchError(f"Operation {index + 1}: unknown operation {operation!r:.80}")
+    return data
+
+
+def _label(label: str) -> str:
+    return '"' + label.replace('"', "#quot;") + '"' if LABEL_SPECIAL.search(label) else label
+
+
+class FlowchartDocument:
+    """Mutable flowchart built from the AST, written back by render()"""
+
+    def __init__(self, diagram: MermaidDiagram, preamble: List[str]):
+        self.preamble = preamble
+        self.keyword = diagram.header.split()[0]
+        self.direction = diagram.direction
+        self.nodes: Dict[str, dict] = {
+            node_id: {"label": node.get("label"), "shape": node.get("shape"), "classes": list(node.get("classes", []))}
+            for node_id, node in diagram.nodes.items()
+        }
+        self.groups = [dict(group) for group in diagram.groups]
+        # Узел принадлежит первому подграфу, где он упомянут
+        self.memberships: Dict[str, str] = {}
+        for group in self.groups:
+            for node_id in group["nodes"]:
+                self.memberships.setdefault(node_id, group["id"])
+        # index - номер связи в исходном коде (для linkStyle), у новых None
+        self.edges = [
+            {"source": edge["source"], "target": edge["target"], "arrow": edge["arrow"], "label": edge["label"], "index": index}
+            for index, edge in enumerate(diagram.edges)
+        ]
+        self.statements = [
+            (statement.kind, statement.text) for statement in diagram.statements
+            if statement.kind in ("classDef", "class", "style", "click", "linkStyle", "accTitle", "accDescr")
+        ]
+
+    # -- операции ------------------------------------------------------------
+
+    def _node(self, operation: dict, key: str = "id") -> str:
+        node_id = operation.get(key)
+        if node_id not in self.nodes:
+            raise PatchError(f"{operation['op']}: unknown node {node_id!r}")
+        return node_id
+
+    def _new_id(self, operation: dict, key: str) -> str:
+        node_id = operation.get(key)
+        if not isinstance(node_id, str) or not FLOW_ID.fullmatch(node_id) or node_id in RESERVED_IDS:
+            raise PatchError(f"{operation['op']}: invalid node id {node_id!r}")
+        if node_id in self.nodes or any(group["id"] == node_id for group in self.groups):
+            raise PatchError(f"{operation['op']}: node {node_id!r} already exists")
+        return node_id
+
+    def _text(self, operation: dict, key: str = "label", required: bool = True) -> Optional[str]:
+        value = operation.get(key)
+        if value is None and not required:
+            return None
+        if not isinstance(value, str) or not value.strip() or "\n" in value:
+            raise PatchError(f"{operation['op']}: invalid {key} {value!r}")
+        return value.strip()
+
+    def _shape(self, operation: dict) -> Optional[str]:
+        shape = operation.get("shape")
+        if shape is not None and shape not in SHAPE_DELIMITERS:
+            raise PatchError(f"{operation['op']}: unknown shape {shape!r}")
+        return shape
+
+    def _edges(self, operation: dict) -> List[dict]:
+        source, target = self._node(operation, "from"), self._node(operation, "to")
+        edges = [edge for edge in self.edges if edge["source"] == source and edge["target"] == target]
+        if not edges:
+            raise PatchError(f"{operation['op']}: no link {source} -> {target}")
+        return edges
+
+    def add_node(self, operation: dict):
+        node_id = self._new_id(operation, "id")
+        self.nodes[node_id] = {"label": self._text(operation, required=False), "shape": self._shape(operation), "classes": []}
+        subgraph = operation.get("subgraph")
+        if subgraph is not None:
+            if not any(group["id"] == subgraph for group in self.groups):
+                raise PatchError(f"add_node: unknown subgraph {subgraph!r}")
+            self.memberships[node_id] = subgraph
+
+    def remove_node(self, operation: dict):
+        node_id = self._node(operation)
+        del self.nodes[node_id]
+        self.memberships.pop(node_id, None)
+        self.edges = [edge for edge in self.edges if node_id not in (edge["source"], edge["target"])]
+        self._rewrite_ids(lambda ids: [i for i in ids if i != node_id])
+
+    def rename_node(self, operation: dict):
+        old_id = self._node(operation)
+        new_id = self._new_id(operation, "new_id")
+        node = self.nodes[old_id]
+        if node["label"] is None:
+            node["label"] = old_id  # Без подписи на схеме был виден id - сохраняем его
+        self.nodes = {new_id if key == old_id else key: value for key, value in self.nodes.items()}
+        if old_id in self.memberships:
+            self.memberships[new_id] = self.memberships.pop(old_id)
+        for edge in self.edges:
+            for key in ("source", "target"):
+                if edge[key] == old_id:
+                    edge[key] = new_id
+        self._rewrite_ids(lambda ids: [new_id if i == old_id else i for i in ids])
+
+    def set_label(self, operation: dict):
+        self.nodes[self._node(operation)]["label"] = self._text(operation)
+
+    def set_shape(self, operation: dict):
+        node = self.nodes[self._node(operation)]
+        node["shape"] = self._shape(operation)
+
+    def add_edge(self, operation: dict):
+        source, target = self._node(operation, "from"), self._node(operation, "to")
+        arrow = operation.get("arrow") or "-->"
+        if not isinstance(arrow, str) or not FLOW_LINK.fullmatch(arrow):
+            raise PatchError(f"add_edge: unsupported arrow {arrow!r}")
+        label = self._text(operation, required=False)
+        self.edges.append({"source": source, "target": target, "arrow": arrow, "label": label, "index": None})
+
+    def remove_edge(self, operation: dict):
+        removed = self._edges(operation)
+        self.edges = [edge for edge in self.edges if edge not in removed]
+
+    def set_edge_label(self, operation: dict):
+        label = self._text(operation, required=False)
+        for edge in self._edges(operation):
+            edge["label"] = label
+
+    def set_direction(self, operation: dict):
+        direction = operation.get("direction")
+        if not isinstance(direction, str) or not DIRECTION_PATTERN.fullmatch(direction):
+            raise PatchError(f"set_direction: invalid direction {direction!r}")
+        self.direction = direction
+
+    def apply(self, operations: List[dict]):
+        for index, operation in enumerate(operations):
+            try:
+                getattr(self, operation["op"])(operation)
+            except PatchError as e:
+                raise PatchError(f"Operation {index + 1}: {e}")
+
+    # -- запись обратно в код ------------------------------------------------
+
+    def _rewrite_ids(self, rewrite):
+        """Apply rewrite to id lists of class/style/click; drop statements left without ids"""
+        statements = []
+        for kind, text in self.statements:
+            if kind in NODE_LIST_STATEMENTS:
+                parts = text.split(None, 2)
+                if len(parts) < 2:
+                    continue
+                ids = rewrite([node_id.strip() for node_id in parts[1].split(",")])
+                if not ids:
+                    continue
+                text = " ".join([parts[0], ",".join(ids)] + parts[2:])
+            statements.append((kind, text))
+        self.statements = statements
+
+    def _link_style(self, text: str, positions: Dict[int, int]) -> Optional[str]:
+        parts = text.split(None, 2)
+        if len(parts) < 2 or parts[1] == "default":
+            return text
+        indexes = [str(positions[int(i)]) for i in parts[1].split(",") if i.isdigit() and int(i) in positions]
+        return " ".join([parts[0], ",".join(indexes)] + parts[2:]) if indexes else None
+
+    def _declaration(self, node_id: str) -> str:
+        node = self.nodes[node_id]
+        text = node_id
+        if node["label"] is not None or node["shape"] is not None:
+            opener, closer = SHAPE_DELIMITERS[node["shape"] or "rect"]
+            text += opener + _label(node["label"] if node["label"] is not None else node_id) + closer
+        return text + "".join(f":::{name}" for name in node["classes"])
+
+    def render(self) -> str:
+        lines = list(self.preamble)
+        lines.append(f"{self.keyword} {self.direction}" if self.direction else self.keyword)
+
+        group_ids = {group["id"] for group in self.groups}
+        linked = {node_id for edge in self.edges for node_id in (edge["source"], edge["target"])}
+
+        def emit(parent: Optional[str], indent: str):
+            for node_id, node in self.nodes.items():
+                if self.memberships.get(node_id) != parent:
+                    continue
+                explicit = node["label"] is not None or node["shape"] is not None or node["classes"]
+                # Узел без подписи вне подграфов объявляют его связи; id подграфа - не узел
+                if node_id in group_ids or (parent is None and not explicit and node_id in linked):
+                    continue
+                lines.append(indent + self._declaration(node_id))
+            for group in self.groups:
+                if group["parent"] != parent:
+                    continue
+                title = group["title"]
+                if title and title != group["id"]:
+                    lines.append(f'{indent}subgraph {group["id"]} [{_label(title)}]')
+                else:
+                    lines.append(f'{indent}subgraph {group["id"]}')
+                if group.get("direction"):
+                    lines.append(f'{indent}    direction {group["direction"]}')
+                emit(group["id"], indent + "    ")
+                lines.append(f"{indent}end")
+
+        emit(None, "    ")
+
+        positions = {}
+        for position, edge in enumerate(self.edges):
+            if edge["index"] is not None:
+                positions[edge["index"]] = position
+            label = f'|{edge["label"].replace("|", "#124;")}|' if edge["label"] else ""
+            lines.append(f'    {edge["source"]} {edge["arrow"]}{label} {edge["target"]}')
+
+        for kind, text in self.statements:
+            if kind == "linkStyle":
+                text = self._link_style(text, positions)
+            if text:
+                lines.append("    " + text)
+        return "\n".join(lines)
+
+
+def _preamble(code: str) -> List[str]:
+    """Front matter and %%{init}%% directives before the header - kept as is"""
+    lines = code.replace("\r\n", "\n").split("\n")
+    preamble = []
+    in_front_matter = False
+    for raw in lines:
+        text = raw.strip()
+        if text == "---" and (in_front_matter or not preamble):
+            in_front_matter = not in_front_matter
+            preamble.append(text)
+        elif in_front_matter or text.startswith("%%{"):
+            preamble.append(raw.rstrip())
+        elif text and not text.startswith("%%"):
+            break
+    return preamble
+
+
+def apply_edit_operations(code: str, operations: List[dict], diagram_type: str = "flowchart") -> str:
+    """Apply edit operations to the diagram code; raises PatchError"""
+    if diagram_type not in PATCHABLE_TYPES:
+        raise PatchError(f"Edit operations are not supported for {diagram_type} diagrams")
+    if not operations:
+        raise PatchError("No operations")
+    try:
+        diagram = parse_mermaid(code, diagram_type)
+    except MermaidSyntaxError as e:
+        raise PatchError(f"Stored diagram does not parse: {e}")
+
+    document = FlowchartDocument(diagram, _preamble(code))
+    document.apply(operations)
+    return document.render()
@@ -1,9 +1,39 @@
 import re
 from typing import Optional, Tuple
 
+from .content_cache import memoize_by_content
+from .mermaid_parser import parse_mermaid, detect_diagram_type, MermaidSyntaxError, SUPPORTED_DIAGRAM_TYPES
+
+# Версия правил валидации - пишется в логи, повышать при изменении парсера (см. app/jobs/revalidate.py)
+VALIDATOR_VERSION = "2"
+
+# Ключевые слова, с которых начинается код диаграммы
+DIAGRAM_START_KEYWORDS = (
+    "flowchart", "graph", "sequenceDiagram", "classDiagram",
+    "erDiagram", "gantt", "stateDiagram", "pie", "journey", "gitGraph"
+)
+
+# Ключевые слова, обязательные для каждого типа диаграммы
+DIAGRAM_TYPE_KEYWORDS = {
+    "flowchart": ["flowchart"],
+    "sequence": ["sequenceDiagram"],
+    "class": ["classDiagram"],
+    "er": ["erDiagram"],
+    "gantt": ["gantt"],
+    "state": ["stateDiagram"],
+    "pie": ["pie"],
+    "journey": ["journey"],
+    "git": ["gitGraph"]
+}
+
+# Рассуждения reasoning-моделей (qwen3, phi-4-mini-reasoning) перед ответом
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+THINK_PATTERN = re.compile(r'<think>.*?</think>', re.DOTALL)
+
 def extract_mermaid_code(text: str) -> str:
     """Extract mermaid code from LLM response"""
-    text = text.strip()
+    text = THINK_PATTERN.sub("", text).strip()
     
     # Remove XXXmermaidXXX wrapper if present (заменить XXX на тройные обратные кавычки)
     mermaid_pattern = r'```mermaid\s*(.*?)\s*```'
@@ -17,39 +47,189 @@ def extract_mermaid_code(text: str) -> str:
     if match:
         return match.group(1).strip()
     
+    # Незакрытая обертка: ответ оборван по stop-последовательности или max_tokens
+    open_pattern = r'```(?:mermaid)?[ \t]*\n(.*)$'
+    match = re.search(open_pattern, text, re.DOTALL)
+    if match:
+        return match.group(1).strip()
+    
     return text
 
-def validate_mermaid_syntax(code: str, diagram_type: str) -> Tuple[bool, Optional[str]]:
-    """Basic validation of mermaid syntax"""
-    if not code or not code.strip():
-        return False, "Empty code"
+class MermaidStreamExtractor:
+    """Incremental counterpart of extract_mermaid_code for streamed LLM output.
+    
+    Feed raw text chunks as they arrive; each call returns the part of the
+    diagram code that is safe to show (code fences and prose outside them
+    are stripped). <think>...</think> reasoning before the code is skipped.
+    Call finish() once the stream ends to flush the rest.
+    """
+    
+    FENCE = "```"
     
-    code = code.strip()
+    def __init__(self):
+        self.buffer = ""
+        self.state = "pre"  # pre -> code -> done
+        self.emitted = ""
+        self.in_reasoning = False
+        self.reasoning_length = 0  # Символов в пропущенных блоках <think>
     
-    # Check for diagram type keywords
-    type_keywords = {
-        "flowchart": ["flowchart"],
-        "sequence": ["sequenceDiagram"],
-        "class": ["classDiagram"],
-        "er": ["erDiagram"],
-        "gantt": ["gantt"]
-    }
+    def _starts_like_diagram(self, text: str) -> bool:
+        first_word = text.lstrip().split(None, 1)[0] if text.strip() else ""
+        return any(first_word.startswith(keyword) for keyword in DIAGRAM_START_KEYWORDS)
     
-    expected_keywords = type_keywords.get(diagram_type, [])
-    if expected_keywords:
-        has_keyword = any(keyword in code for keyword in expected_keywords)
-        if not has_keyword:
-            return False, f"Missing {diagram_type} keyword"
+    def _skip_reasoning(self):
+        while True:
+            start = self.buffer.find(THINK_OPEN)
+            if start == -1:
+                self.in_reasoning = False
+                return
+            end = self.buffer.find(THINK_CLOSE, start)
+            if end == -1:
+                # Внутри рассуждений тоже бывают ``` - ждем закрывающий тег
+                self.in_reasoning = True
+                return
+            end += len(THINK_CLOSE)
+            self.reasoning_length += end - start
+            self.buffer = self.buffer[:start] + self.buffer[end:]
     
-    # Basic syntax checks
-    lines = code.split('\n')
-    non_empty_lines = [line.strip() for line in lines if line.strip()]
+    def feed(self, chunk: str) -> str:
+        """Consume next chunk and return newly extracted code"""
+        if self.state == "done" or not chunk:
+            return ""
+        
+        self.buffer += chunk
+        output = ""
+        
+        if self.state == "pre":
+            self._skip_reasoning()
+            if self.in_reasoning:
+                return ""
+            fence_pos = self.buffer.find(self.FENCE)
+            if fence_pos != -1:
+                # Ждем конца строки с открывающим ``` (там может быть "mermaid")
+                line_end = self.buffer.find("\n", fence_pos)
+                if line_end == -1:
+                    return ""
+                self.buffer = self.buffer[line_end + 1:]
+                self.state = "code"
+            elif "\n" in self.buffer and self._starts_like_diagram(self.buffer):
+                # Ответ без обертки - код начинается сразу
+                self.buffer = self.buffer.lstrip()
+                self.state = "code"
+            else:
+                return ""
+        
+        if self.state == "code":
+            fence_pos = self.buffer.find(self.FENCE)
+            if fence_pos != -1:
+                output = self.buffer[:fence_pos].rstrip()
+                self.buffer = ""
+                self.state = "done"
+            else:
+                # Придерживаем хвост из обратных кавычек - это может быть начало ```
+                keep = len(self.buffer) - len(self.buffer.rstrip("`"))
+                output = self.buffer[:len(self.buffer) - keep]
+                self.buffer = self.buffer[len(self.buffer) - keep:]
+        
+        if not self.emitted:
+            output = output.lstrip()
+        self.emitted += output
+        return output
+    
+    def finish(self) -> str:
+        """Flush whatever is left when the stream ends"""
+        output = ""
+        if self.state == "pre":
+            # Обертки так и не было - отдаем весь текст как код
+            output = extract_mermaid_code(self.buffer)
+        elif self.state == "code":
+            output = self.buffer.rstrip("`").rstrip()
+        
+        if not self.emitted:
+            output = output.lstrip()
+        self.buffer = ""
+        self.state = "done"
+        self.emitted += output
+        return output
+
+
+class MermaidStreamWatchdog:
+    """Decides while tokens stream in whether generation can stop early.
+    
+    feed() returns "complete" once the closing code fence arrives,
+    "invalid" when the diagram clearly cannot pass validation (its first
+    line is the header of another diagram type, or the model keeps
+    writing prose instead of a diagram; <think> reasoning does not count
+    as prose), otherwise "continue". A missing
+    header is not a reason to stop: fix_mermaid_code adds it.
+    """
+    
+    CONTINUE = "continue"
+    COMPLETE = "complete"
+    INVALID = "invalid"
+    
+    def __init__(self, diagram_type: str, max_preamble: int = 600):
+        self.diagram_type = diagram_type
+        self.max_preamble = max_preamble
+        self.extractor = MermaidStreamExtractor()
+        self.raw_length = 0
+        self.first_line_checked = False
+        self.reason: Optional[str] = None
+    
+    def feed(self, chunk: str) -> str:
+        self.raw_length += len(chunk)
+        self.extractor.feed(chunk)
+        
+        if self.extractor.state == "pre":
+            # Рассуждения reasoning-моделей в лимит вступления не входят
+            if self.extractor.in_reasoning:
+                return self.CONTINUE
+            if self.raw_length - self.extractor.reasoning_length > self.max_preamble:
+                self.reason = "No diagram code after preamble"
+                return self.INVALID
+            return self.CONTINUE
+        
+        if not self.first_line_checked:
+            # Первая полная строка кода без комментариев/директив %%
+            complete_lines = self.extractor.emitted.split("\n")[:-1]
+            first_line = next(
+                (line.strip() for line in complete_lines if line.strip() and not line.strip().startswith("%%")),
+                None
+            )
+            if first_line is not None:
+                self.first_line_checked = True
+                if first_line == "---":
+                    return self.CONTINUE  # YAML front matter - заголовок ниже, проверит парсер
+                # Обрываем только заголовок другого типа: пропущенный заголовок и текст перед ним
+                # исправляет mermaid_fixer (graph TD для flowchart тоже подходит)
+                detected = detect_diagram_type(first_line)
+                if self.diagram_type in SUPPORTED_DIAGRAM_TYPES and detected not in (None, self.diagram_type):
+                    self.reason = f"Expected {self.diagram_type} header, got {detected}: {first_line[:40]!r}"
+                    return self.INVALID
+        
+        if self.extractor.state == "done":
+            return self.COMPLETE
+        return self.CONTINUE
+
+
+@memoize_by_content("validate_mermaid_syntax")
+def validate_mermaid_syntax(code: str, diagram_type: str) -> Tuple[bool, Optional[str]]:
+    """Validate mermaid syntax with the grammar parser.
+    
+    The error message carries the line and column of the first problem,
+    e.g. "Line 3, column 12: Unexpected '(' in node label ...".
+    """
+    if not code or not code.strip():
+        return False, "Empty code"
     
-    if len(non_empty_lines) < 2:
-        return False, "Too few lines for a valid diagram"
+    try:
+        parse_mermaid(code, diagram_type)
+    except MermaidSyntaxError as e:
+        return False, str(e)
     
     return True, None
 
+@memoize_by_content("clean_mermaid_code")
 def clean_mermaid_code(code: str) -> str:
     """Clean and format mermaid code"""
     code = extract_mermaid_code(code)
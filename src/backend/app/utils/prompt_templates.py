@@ -1,4 +1,13 @@
-from typing import Dict, Tuple
+from typing import Dict, Optional, Sequence, Tuple
+
+# Версия шаблонов - входит в ключ кэша генераций, повышать при изменении промптов
+PROMPT_TEMPLATE_VERSION = "2"
+
+# Системное сообщение каждого запроса к LLM
+SYSTEM_MESSAGE = "You are an expert at creating Mermaid diagrams. Always follow the exact format requirements and return only the mermaid code."
+
+# Системное сообщение запроса правки в виде операций (ответ - JSON, не код)
+PATCH_SYSTEM_MESSAGE = "You edit Mermaid diagrams by returning edit operations as JSON. Return only the JSON array."
 
 # Системные промпты для каждого типа диаграммы
 SYSTEM_PROMPTS: Dict[str, str] = {
@@ -100,14 +109,92 @@ Requirements:
 Generate the diagram:"""
 }
 
+# Повторный запрос при невалидном результате: только код и ошибка валидатора
+REPAIR_TEMPLATE = """This Mermaid {diagram_type} diagram for "{user_input}" failed validation.
+
+Error: {error}
+
+```mermaid
+{code}
+```
+
+Fix the error and return ONLY the corrected mermaid code."""
+
+# Модификация: текущий код диаграммы и запрос пользователя
+MODIFICATION_TEMPLATE = """
+Current diagram code:
+{code}
+
+Modification request: {modification_prompt}
+
+Please modify the above {diagram_type} diagram according to the request.
+Return only the modified mermaid code.
+"""
+
+# Модификация патчем: модель возвращает только список операций над узлами и связями
+PATCH_MODIFICATION_TEMPLATE = """Current {diagram_type} diagram:
+```mermaid
+{code}
+```
+
+Modification request: {modification_prompt}
+
+Describe the change as a JSON array of edit operations. Use the existing node ids.
+Operations:
+{{"op": "add_node", "id": "NewId", "label": "Text", "shape": "rect|round|rhombus|circle|stadium|...", "subgraph": "SubgraphId"}}
+{{"op": "remove_node", "id": "A"}}  (also removes its links)
+{{"op": "rename_node", "id": "A", "new_id": "B"}}
+{{"op": "set_label", "id": "A", "label": "New text"}}
+{{"op": "set_shape", "id": "A", "shape": "rhombus"}}
+{{"op": "add_edge", "from": "A", "to": "B", "label": "optional text", "arrow": "-->|---|-.->|==>"}}
+{{"op": "remove_edge", "from": "A", "to": "B"}}
+{{"op": "set_edge_label", "from": "A", "to": "B", "label": "New text"}}
+{{"op": "set_direction", "direction": "TD|LR|BT|RL"}}
+Only "op" and ids are required. Return ONLY the JSON array, for example:
+[{{"op": "add_node", "id": "C", "label": "Check"}}, {{"op": "add_edge", "from": "B", "to": "C"}}]
+"""
+
+# Похожие прошлые запросы с валидным результатом - перед основным заданием
+FEW_SHOT_TEMPLATE = """Examples of valid Mermaid {diagram_type} diagrams for similar requests:
+
+{examples}
+"""
+
+FEW_SHOT_EXAMPLE = """Request: {prompt}
+```mermaid
+{code}
+```
+"""
+
 def get_system_prompt(diagram_type: str) -> str:
     """Get system prompt for specific diagram type"""
     return SYSTEM_PROMPTS.get(diagram_type, SYSTEM_PROMPTS["flowchart"])
 
-def get_prompt_template(diagram_type: str, user_input: str) -> str:
-    """Get formatted prompt template for diagram type"""
+def get_prompt_template(diagram_type: str, user_input: str, examples: Optional[Sequence[Tuple[str, str]]] = None) -> str:
+    """Get formatted prompt template for diagram type, optionally preceded by (prompt, code) examples"""
     template = PROMPT_TEMPLATES.get(diagram_type, PROMPT_TEMPLATES["flowchart"])
-    return template.format(user_input=user_input)
+    prompt = template.format(user_input=user_input)
+    if examples:
+        shots = "\n".join(FEW_SHOT_EXAMPLE.format(prompt=example[0], code=example[1]) for example in examples)
+        prompt = FEW_SHOT_TEMPLATE.format(diagram_type=diagram_type, examples=shots) + "\n" + prompt
+    return prompt
+
+def get_repair_prompt(diagram_type: str, user_input: str, code: str, error: str) -> str:
+    """Short follow-up prompt asking the model to fix its own invalid output"""
+    return REPAIR_TEMPLATE.format(
+        diagram_type=diagram_type,
+        user_input=user_input[:300],  # Полный запрос не нужен - только напоминание о смысле
+        code=code,
+        error=error
+    )
+
+def get_modification_prompt(diagram_type: str, code: str, modification_prompt: str) -> str:
+    """Prompt asking to apply modification_prompt to the given diagram code"""
+    return MODIFICATION_TEMPLATE.format(diagram_type=diagram_type, code=code, modification_prompt=modification_prompt)
+
+def get_patch_prompt(diagram_type: str, code: str, modification_prompt: str) -> str:
+    """Prompt asking for edit operations instead of the whole modified diagram"""
+    return PATCH_MODIFICATION_TEMPLATE.format(diagram_type=diagram_type, code=code, modification_prompt=modification_prompt)
 
 def get_available_diagram_types() -> list:
     """Get list of available diagram types"""
@@ -0,0 +1,7 @@
+# src/backend/app/utils/sse.py
+import json
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Format a Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,376 @@
+"""Small pure-Python SVG previews of Mermaid diagrams.
+
+Not a Mermaid replacement: the layout is a simple layered one and labels are
+shortened, which is enough for dashboard thumbnails. Works from the parser's
+AST, so no browser or Node.js is needed. Types without a renderer (gitGraph)
+and code that does not parse give None.
+"""
+import math
+from collections import defaultdict
+from html import escape
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .mermaid_parser import parse_mermaid, MermaidDiagram, MermaidSyntaxError
+
+# Версия отрисовки - входит в адрес превью, повышать при изменении картинки
+RENDERER_VERSION = "1"
+
+THUMBNAIL_WIDTH = 240
+THUMBNAIL_HEIGHT = 160
+
+FONT = "font-family=\"Arial, sans-serif\""
+NODE_FILL = "#ECECFF"
+NODE_STROKE = "#9370DB"
+EDGE_STROKE = "#333333"
+PALETTE = ["#9370DB", "#F4A261", "#2A9D8F", "#E76F51", "#457B9D", "#E9C46A", "#8AB17D", "#B5838D"]
+
+NODE_HEIGHT = 36
+RANK_GAP = 60
+NODE_GAP = 30
+MAX_LABEL = 22
+
+Elements = List[str]
+
+
+def _short(text: Optional[str], limit: int = MAX_LABEL) -> str:
+    text = " ".join((text or "").replace("<br>", " ").replace("<br/>", " ").split())
+    return escape(text if len(text) <= limit else text[:limit - 1] + "…")
+
+
+def _text(x: float, y: float, text: str, size: int = 12, anchor: str = "middle", weight: str = "normal") -> str:
+    return (f'<text x="{x:.1f}" y="{y:.1f}" font-size="{size}" text-anchor="{anchor}" '
+            f'font-weight="{weight}" dominant-baseline="middle">{text}</text>')
+
+
+# ---------------------------------------------------------------------------
+# Графы: flowchart, state, class, er
+# ---------------------------------------------------------------------------
+
+def _ranks(nodes: List[str], edges: List[Tuple[str, str]]) -> Dict[str, int]:
+    """Longest-path layering; back edges found by DFS are ignored to break cycles"""
+    children = defaultdict(list)
+    for source, target in edges:
+        if source != target:
+            children[source].append(target)
+
+    state: Dict[str, int] = {}
+    forward = defaultdict(list)
+    for root in nodes:
+        if root in state:
+            continue
+        stack = [(root, iter(children[root]))]
+        state[root] = 1
+        while stack:
+            node, it = stack[-1]
+            child = next(it, None)
+            if child is None:
+                state[node] = 2
+                stack.pop()
+            elif child not in state:
+                forward[node].append(child)
+                state[child] = 1
+                stack.append((child, iter(children[child])))
+            elif state[child] == 2:
+                forward[node].append(child)  # Ребро вперед/поперек; state == 1 - обратное, пропускаем
+
+    indegree = defaultdict(int)
+    for node in nodes:
+        for child in forward[node]:
+            indegree[child] += 1
+    rank = {node: 0 for node in nodes}
+    queue = [node for node in nodes if indegree[node] == 0]
+    for node in queue:
+        for child in forward[node]:
+            rank[child] = max(rank[child], rank[node] + 1)
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                queue.append(child)
+    return rank
+
+
+def _node_size(diagram: MermaidDiagram, node_id: str) -> Tuple[float, float]:
+    node = diagram.nodes[node_id]
+    if node_id == "[*]":
+        return 16, 16
+    rows = len(node.get("members") or node.get("attributes") or [])
+    label = _short(node.get("label") or node_id)
+    width = min(max(len(label) * 7 + 24, 60), 170)
+    height = NODE_HEIGHT + min(rows, 6) * 14
+    if node.get("shape") in ("rhombus", "circle", "double_circle"):
+        width, height = width * 1.2, max(height, width * 0.6)
+    return width, height
+
+
+def _shape(kind: Optional[str], x: float, y: float, w: float, h: float) -> str:
+    """Node outline centered at (x, y)"""
+    style = f'fill="{NODE_FILL}" stroke="{NODE_STROKE}" stroke-width="1.5"'
+    left, top = x - w / 2, y - h / 2
+    if kind == "start":
+        return f'<circle cx="{x:.1f}" cy="{y:.1f}" r="{w / 2:.1f}" fill="{EDGE_STROKE}"/>'
+    if kind == "rhombus":
+        points = f"{x:.1f},{top:.1f} {left + w:.1f},{y:.1f} {x:.1f},{top + h:.1f} {left:.1f},{y:.1f}"
+        return f'<polygon points="{points}" {style}/>'
+    if kind == "hexagon":
+        d = h / 3
+        points = " ".join(f"{px:.1f},{py:.1f}" for px, py in [
+            (left + d, top), (left + w - d, top), (left + w, y), (left + w - d, top + h), (left + d, top + h), (left, y)
+        ])
+        return f'<polygon points="{points}" {style}/>'
+    if kind in ("circle", "double_circle"):
+        return f'<ellipse cx="{x:.1f}" cy="{y:.1f}" rx="{w / 2:.1f}" ry="{h / 2:.1f}" {style}/>'
+    radius = {"round": 8, "stadium": h / 2, "cylinder": 10}.get(kind, 2)
+    return f'<rect x="{left:.1f}" y="{top:.1f}" width="{w:.1f}" height="{h:.1f}" rx="{radius:.1f}" {style}/>'
+
+
+def _clip(x: float, y: float, w: float, h: float, tx: float, ty: float) -> Tuple[float, float]:
+    """Point where the line from the node center to (tx, ty) leaves the node box"""
+    dx, dy = tx - x, ty - y
+    if dx == 0 and dy == 0:
+        return x, y
+    scale = min((w / 2) / abs(dx) if dx else math.inf, (h / 2) / abs(dy) if dy else math.inf)
+    return x + dx * scale, y + dy * scale
+
+
+def _render_graph(diagram: MermaidDiagram) -> Tuple[Elements, float, float]:
+    nodes = list(diagram.nodes)
+    edges = [(e["source"], e["target"]) for e in diagram.edges if e["source"] in diagram.nodes and e["target"] in diagram.nodes]
+    rank = _ranks(nodes, edges)
+
+    layers: Dict[int, List[str]] = defaultdict(list)
+    for node in nodes:
+        layers[rank[node]].append(node)
+
+    # Порядок внутри слоя - по среднему положению родителей (уменьшает пересечения)
+    parents = defaultdict(list)
+    for source, target in edges:
+        parents[target].append(source)
+    position: Dict[str, float] = {}
+    for level in sorted(layers):
+        layer = layers[level]
+        for index, node in enumerate(layer):
+            placed = [position[p] for p in parents[node] if p in position]
+            position[node] = sum(placed) / len(placed) if placed else index
+        layer.sort(key=lambda node: position[node])
+        for index, node in enumerate(layer):
+            position[node] = index
+
+    horizontal = diagram.direction in ("LR", "RL")
+    sizes = {node: _node_size(diagram, node) for node in nodes}
+    centers: Dict[str, Tuple[float, float]] = {}
+    main_offset = 0.0
+    cross_extent = 0.0
+    for level in sorted(layers):
+        layer = layers[level]
+        # Вдоль слоя узлы идут поперек направления диаграммы
+        cross = [sizes[n][1] if horizontal else sizes[n][0] for n in layer]
+        depth = max(sizes[n][0] if horizontal else sizes[n][1] for n in layer)
+        offset = 0.0
+        for node, extent in zip(layer, cross):
+            center_cross = offset + extent / 2
+            center_main = main_offset + depth / 2
+            centers[node] = (center_main, center_cross) if horizontal else (center_cross, center_main)
+            offset += extent + NODE_GAP
+        cross_extent = max(cross_extent, offset - NODE_GAP)
+        main_offset += depth + RANK_GAP
+    main_extent = main_offset - RANK_GAP
+
+    # Слои центрируются относительно самого широкого
+    for level in sorted(layers):
+        layer = layers[level]
+        last = layer[-1]
+        end = (centers[last][1] + sizes[last][1] / 2) if horizontal else (centers[last][0] + sizes[last][0] / 2)
+        shift = (cross_extent - end) / 2
+        for node in layer:
+            x, y = centers[node]
+            centers[node] = (x, y + shift) if horizontal else (x + shift, y)
+
+    if diagram.direction in ("BT", "RL"):
+        for node, (x, y) in centers.items():
+            centers[node] = (main_extent - x, y) if horizontal else (x, main_extent - y)
+
+    width, height = (main_extent, cross_extent) if horizontal else (cross_extent, main_extent)
+    elements: Elements = []
+
+    for group in diagram.groups:
+        members = [n for n in group.get("nodes", []) if n in centers]
+        if group.get("kind") != "subgraph" or not members:
+            continue
+        left = min(centers[n][0] - sizes[n][0] / 2 for n in members) - 8
+        top = min(centers[n][1] - sizes[n][1] / 2 for n in members) - 18
+        right = max(centers[n][0] + sizes[n][0] / 2 for n in members) + 8
+        bottom = max(centers[n][1] + sizes[n][1] / 2 for n in members) + 8
+        elements.append(f'<rect x="{left:.1f}" y="{top:.1f}" width="{right - left:.1f}" height="{bottom - top:.1f}" '
+                        f'fill="#FFFFDE" stroke="#AAAA33" stroke-width="1"/>')
+        elements.append(_text((left + right) / 2, top + 9, _short(group.get("title") or group["id"]), size=10))
+
+    for edge in diagram.edges:
+        source, target = edge["source"], edge["target"]
+        if source not in centers or target not in centers or source == target:
+            continue
+        (sx, sy), (tx, ty) = centers[source], centers[target]
+        x1, y1 = _clip(sx, sy, *sizes[source], tx, ty)
+        x2, y2 = _clip(tx, ty, *sizes[target], sx, sy)
+        arrow = edge.get("arrow") or ""
+        dash = ' stroke-dasharray="4 3"' if "." in arrow else ""
+        stroke = 2.5 if "=" in arrow else 1.2
+        marker = ' marker-end="url(#arrow)"' if arrow.endswith(">") or arrow in ("-->", "merge") else ""
+        elements.append(f'<line x1="{x1:.1f}" y1="{y1:.1f}" x2="{x2:.1f}" y2="{y2:.1f}" stroke="{EDGE_STROKE}" '
+                        f'stroke-width="{stroke}"{dash}{marker}/>')
+        if edge.get("label"):
+            elements.append(_text((x1 + x2) / 2, (y1 + y2) / 2, _short(edge["label"], 14), size=9))
+
+    for node_id, (x, y) in centers.items():
+        node = diagram.nodes[node_id]
+        w, h = sizes[node_id]
+        if node_id == "[*]":
+            elements.append(_shape("start", x, y, w, h))
+            continue
+        elements.append(_shape(node.get("shape"), x, y, w, h))
+        rows = node.get("members") or [
+            f"{a['type']} {a['name']}" for a in node.get("attributes") or []
+        ]
+        if rows:
+            top = y - h / 2
+            elements.append(_text(x, top + 14, _short(node.get("label") or node_id), weight="bold"))
+            elements.append(f'<line x1="{x - w / 2:.1f}" y1="{top + 26:.1f}" x2="{x + w / 2:.1f}" y2="{top + 26:.1f}" '
+                            f'stroke="{NODE_STROKE}"/>')
+            for index, row in enumerate(rows[:6]):
+                elements.append(_text(x - w / 2 + 6, top + 36 + index * 14, _short(row, 24), size=10, anchor="start"))
+        else:
+            elements.append(_text(x, y, _short(node.get("label") or node_id)))
+
+    return elements, width, height
+
+
+# ---------------------------------------------------------------------------
+# Sequence, pie, gantt, journey
+# ---------------------------------------------------------------------------
+
+def _render_sequence(diagram: MermaidDiagram) -> Tuple[Elements, float, float]:
+    participants = list(diagram.nodes)
+    column = 130
+    columns = {name: index * column + column / 2 for index, name in enumerate(participants)}
+    width = len(participants) * column
+    height = 60 + len(diagram.edges) * 28 + 20
+
+    elements: Elements = []
+    for name, x in columns.items():
+        elements.append(f'<line x1="{x:.1f}" y1="40" x2="{x:.1f}" y2="{height:.1f}" stroke="#999999" stroke-dasharray="3 3"/>')
+        elements.append(_shape("rect", x, 20, column - 20, 34))
+        elements.append(_text(x, 20, _short(diagram.nodes[name].get("label") or name, 16)))
+
+    for index, message in enumerate(diagram.edges):
+        y = 64 + index * 28
+        x1, x2 = columns[message["source"]], columns[message["target"]]
+        dash = ' stroke-dasharray="4 3"' if message["arrow"].startswith("--") else ""
+        if x1 == x2:
+            elements.append(f'<path d="M{x1:.1f},{y:.1f} h30 v12 h-30" fill="none" stroke="{EDGE_STROKE}"{dash} '
+                            f'marker-end="url(#arrow)"/>')
+        else:
+            elements.append(f'<line x1="{x1:.1f}" y1="{y:.1f}" x2="{x2:.1f}" y2="{y:.1f}" stroke="{EDGE_STROKE}"{dash} '
+                            f'marker-end="url(#arrow)"/>')
+        if message.get("label"):
+            elements.append(_text((x1 + x2) / 2 + (40 if x1 == x2 else 0), y - 8, _short(message["label"], 20), size=9))
+    return elements, width, height
+
+
+def _render_pie(diagram: MermaidDiagram) -> Tuple[Elements, float, float]:
+    slices = [(node.get("label") or node_id, node.get("value") or 0) for node_id, node in diagram.nodes.items()]
+    total = sum(value for _, value in slices) or 1
+    cx, cy, radius = 110, 120, 90
+    elements: Elements = []
+    if diagram.meta.get("title"):
+        elements.append(_text(160, 14, _short(diagram.meta["title"], 30), size=13, weight="bold"))
+
+    angle = -math.pi / 2
+    for index, (label, value) in enumerate(slices):
+        color = PALETTE[index % len(PALETTE)]
+        sweep = 2 * math.pi * value / total
+        if sweep >= 2 * math.pi - 1e-9:
+            elements.append(f'<circle cx="{cx}" cy="{cy}" r="{radius}" fill="{color}"/>')
+        elif sweep > 0:
+            x1, y1 = cx + radius * math.cos(angle), cy + radius * math.sin(angle)
+            x2, y2 = cx + radius * math.cos(angle + sweep), cy + radius * math.sin(angle + sweep)
+            large = 1 if sweep > math.pi else 0
+            elements.append(f'<path d="M{cx},{cy} L{x1:.1f},{y1:.1f} A{radius},{radius} 0 {large} 1 {x2:.1f},{y2:.1f} Z" '
+                            f'fill="{color}" stroke="#FFFFFF"/>')
+        angle += sweep
+        legend_y = 40 + index * 18
+        elements.append(f'<rect x="220" y="{legend_y - 6}" width="12" height="12" fill="{color}"/>')
+        elements.append(_text(238, legend_y, _short(label, 14), size=11, anchor="start"))
+    return elements, 330, 220
+
+
+def _duration_days(value: Optional[str]) -> float:
+    """Length of a gantt task in days for the preview; dates and 'after' refs count as one day"""
+    if value and value[:-1].replace(".", "", 1).isdigit():
+        number, unit = float(value[:-1]), value[-1]
+        return number * {"w": 7, "M": 30, "y": 365}.get(unit, 1 if unit == "d" else 1 / 24)
+    return 1.0
+
+
+def _render_timeline(diagram: MermaidDiagram) -> Tuple[Elements, float, float]:
+    """Gantt and journey: one row per task, grouped by section"""
+    tasks = list(diagram.nodes.values())
+    sections = [group["title"] for group in diagram.groups if group.get("kind") == "section"]
+    colors = {section: PALETTE[index % len(PALETTE)] for index, section in enumerate(sections)}
+    elements: Elements = []
+    top = 28 if diagram.meta.get("title") else 8
+    if diagram.meta.get("title"):
+        elements.append(_text(10, 14, _short(diagram.meta["title"], 36), size=13, anchor="start", weight="bold"))
+
+    label_width, bar_area = 120, 240
+    if diagram.diagram_type == "gantt":
+        durations = [_duration_days(task.get("end")) for task in tasks]
+        scale = bar_area / (sum(durations) or 1)
+    offset = 0.0
+    for index, task in enumerate(tasks):
+        y = top + index * 20
+        color = colors.get(task.get("section"), PALETTE[0])
+        elements.append(_text(4, y + 8, _short(task.get("label"), 18), size=10, anchor="start"))
+        if diagram.diagram_type == "gantt":
+            width = max(durations[index] * scale, 3)
+            elements.append(f'<rect x="{label_width + offset:.1f}" y="{y}" width="{width:.1f}" height="14" rx="2" fill="{color}"/>')
+            offset += durations[index] * scale
+        else:
+            score = max(min(task.get("score") or 0, 5), 0)
+            elements.append(f'<rect x="{label_width}" y="{y}" width="{bar_area * score / 5:.1f}" height="14" rx="2" fill="{color}"/>')
+    return elements, label_width + bar_area + 10, top + len(tasks) * 20 + 8
+
+
+RENDERERS: Dict[str, Callable[[MermaidDiagram], Tuple[Elements, float, float]]] = {
+    "flowchart": _render_graph,
+    "state": _render_graph,
+    "class": _render_graph,
+    "er": _render_graph,
+    "sequence": _render_sequence,
+    "pie": _render_pie,
+    "gantt": _render_timeline,
+    "journey": _render_timeline
+}
+
+
+def render_svg(code: str, diagram_type: Optional[str] = None,
+               width: int = THUMBNAIL_WIDTH, height: int = THUMBNAIL_HEIGHT) -> Optional[str]:
+    """SVG preview scaled into width x height, or None if the diagram cannot be rendered"""
+    try:
+        diagram = parse_mermaid(code, diagram_type)
+    except MermaidSyntaxError:
+        return None
+
+    renderer = RENDERERS.get(diagram.diagram_type)
+    if renderer is None or not diagram.nodes:
+        return None
+
+    elements, content_width, content_height = renderer(diagram)
+    pad = 10
+    view_box = f"{-pad} {-pad} {max(content_width, 1) + 2 * pad:.1f} {max(content_height, 1) + 2 * pad:.1f}"
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="{view_box}" '
+        f'preserveAspectRatio="xMidYMid meet" {FONT}>'
+        '<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="6" markerHeight="6" orient="auto">'
+        f'<path d="M0,0 L10,5 L0,10 z" fill="{EDGE_STROKE}"/></marker></defs>'
+        '<rect x="-50%" y="-50%" width="200%" height="200%" fill="#FFFFFF"/>'
+        + "".join(elements) +
+        "</svg>"
+    )
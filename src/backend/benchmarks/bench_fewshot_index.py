@@ -0,0 +1,67 @@
+# src/backend/benchmarks/bench_fewshot_index.py
+"""Few-shot index: incremental add cost and lookup latency (select()).
+
+The effect on retries and generation time is measured on real traffic:
+GET /generate/stats/few-shot compares logs with and without examples.
+
+Run from src/backend:
+    python -m benchmarks.bench_fewshot_index --docs 1000 5000 --lookups 2000
+"""
+import argparse
+import random
+import time
+
+from app.core.config import settings
+from app.services.fewshot_service import FewShotService
+
+WORDS = (
+    "order payment user login register cart checkout invoice shipping warehouse stock report approval "
+    "manager employee review ticket support escalation refund notification email sms bank card fraud "
+    "check verify retry timeout cache database api gateway service queue worker deploy release build "
+    "test branch merge incident alert monitor backup restore student course exam grade library book "
+    "заказ оплата пользователь регистрация корзина склад отчет согласование сотрудник заявка возврат"
+).split()
+
+
+def make_prompt(rng: random.Random) -> str:
+    return "Process of " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12)))
+
+
+def make_code(rng: random.Random, index: int) -> str:
+    steps = rng.randint(3, 6)
+    lines = ["flowchart TD"] + [f"    S{i}[{rng.choice(WORDS)} {index}] --> S{i + 1}" for i in range(steps)]
+    return "\n".join(lines)
+
+
+def main(doc_counts: list, lookups: int):
+    settings.fewshot_max_docs_per_type = max(doc_counts)
+    print(f"{'docs':>7} {'add us':>8} {'lookup p50 us':>14} {'p99 us':>8} {'with examples':>14}")
+    for count in doc_counts:
+        rng = random.Random(count)
+        service = FewShotService()
+
+        start = time.perf_counter()
+        added = 0
+        for index in range(count):
+            added += service.add(make_prompt(rng), make_code(rng, index), "flowchart")
+        add_us = (time.perf_counter() - start) / count * 1e6
+
+        timings = []
+        found = 0
+        for _ in range(lookups):
+            query = make_prompt(rng)
+            started = time.perf_counter()
+            examples = service.select(query, "flowchart")
+            timings.append((time.perf_counter() - started) * 1e6)
+            found += bool(examples)
+        timings.sort()
+        p50, p99 = timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+        print(f"{added:>7} {add_us:>8.1f} {p50:>14.1f} {p99:>8.1f} {found / lookups * 100:>13.0f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, nargs="+", default=[1000, 5000], help="indexed examples per type")
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.docs, args.lookups)
@@ -0,0 +1,61 @@
+# src/backend/benchmarks/bench_llm_backends.py
+"""Throughput of LLMService as stub backends are added.
+
+Every stub emulates a GPU box that processes one completion at a time,
+so a single backend caps throughput at 1/latency. Run from src/backend:
+    python -m benchmarks.bench_llm_backends --backends 1 2 4 8
+"""
+import argparse
+import asyncio
+import time
+
+from app.core.config import settings
+from app.services.llm_router import LLMBackend, LLMRouter
+from app.services.llm_service import LLMService
+from benchmarks.stub_llm_server import StubLLMServer
+
+MODEL = "stub-model"
+
+
+async def run(backend_count: int, total: int, latency: float) -> float:
+    servers = [await StubLLMServer(latency=latency, max_parallel=1, models=[MODEL]).start() for _ in range(backend_count)]
+    
+    service = LLMService()
+    service.router = LLMRouter([LLMBackend(server.url, [MODEL]) for server in servers])
+    await service.start()
+    
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        service.generate_diagram(f"prompt {i}", "flowchart", MODEL, user_id=f"user{i % 10}")
+        for i in range(total)
+    ))
+    elapsed = time.perf_counter() - start
+    
+    await service.close()
+    for server in servers:
+        await server.stop()
+    
+    assert all(results), "some generations failed"
+    per_backend = [server.requests for server in servers]
+    print(f"backends={backend_count}: {elapsed:.2f}s, {total / elapsed:.1f} gen/s, requests per backend={per_backend}")
+    return total / elapsed
+
+
+async def main(backend_counts, total: int, latency: float):
+    settings.llm_model_concurrency = {MODEL: 1}
+    settings.llm_queue_max_size = total
+    
+    baseline = None
+    for count in backend_counts:
+        throughput = await run(count, total, latency)
+        baseline = baseline or throughput / count
+        print(f"    scaling efficiency: {throughput / (baseline * count) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backends", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(main(args.backends, args.requests, args.latency))
@@ -0,0 +1,79 @@
+# src/backend/benchmarks/bench_llm_client.py
+"""Per-request HTTP overhead: new AsyncClient per attempt vs shared pooled client.
+
+Run from src/backend:
+    python -m benchmarks.bench_llm_client --concurrency 64 --requests 2000
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.stub_llm_server import StubLLMServer
+
+PAYLOAD = {
+    "model": "stub-model",
+    "messages": [{"role": "user", "content": "flowchart for login"}],
+    "max_tokens": 500,
+    "temperature": 0.1,
+    "stream": False
+}
+
+
+async def run_per_request_clients(url: str, total: int, concurrency: int) -> float:
+    """Old behaviour: a fresh AsyncClient (and TCP connection) per call"""
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def one():
+        async with semaphore:
+            async with httpx.AsyncClient(timeout=httpx.Timeout(45.0)) as client:
+                response = await client.post(f"{url}/v1/chat/completions", json=PAYLOAD)
+                response.raise_for_status()
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return time.perf_counter() - start
+
+
+async def run_shared_client(url: str, total: int, concurrency: int) -> float:
+    """New behaviour: one long-lived pooled client with keep-alive"""
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=httpx.Timeout(45.0)) as client:
+        async def one():
+            async with semaphore:
+                response = await client.post("/v1/chat/completions", json=PAYLOAD)
+                response.raise_for_status()
+        
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        return time.perf_counter() - start
+
+
+async def main(total: int, concurrency: int):
+    results = {}
+    for name, runner in (("per-request client", run_per_request_clients), ("shared pooled client", run_shared_client)):
+        server = await StubLLMServer().start()
+        elapsed = await runner(server.url, total, concurrency)
+        results[name] = (elapsed, server.connections)
+        await server.stop()
+    
+    print(f"requests={total}, concurrency={concurrency}")
+    for name, (elapsed, connections) in results.items():
+        print(
+            f"{name:>22}: {elapsed:.3f}s total, {elapsed / total * 1000:.3f} ms/request, "
+            f"{total / elapsed:.0f} req/s, tcp connections={connections}"
+        )
+    
+    old, new = results["per-request client"][0], results["shared pooled client"][0]
+    print(f"overhead saved: {(old - new) / total * 1000:.3f} ms/request ({old / new:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
@@ -0,0 +1,83 @@
+# src/backend/benchmarks/bench_mermaid_canonical.py
+"""Canonicalization cost on large flowcharts and a check that the structural
+hash ignores node ids, link order and whitespace.
+
+Run from src/backend:
+    python -m benchmarks.bench_mermaid_canonical --edges 1000 5000 --repeat 5
+"""
+import argparse
+import random
+import time
+
+from app.utils.mermaid_canonical import canonicalize_mermaid
+from app.utils.mermaid_parser import parse_mermaid
+
+SHAPES = [("[", "]"), ("{", "}"), ("([", "])"), ("[(", ")]"), ("((", "))")]
+
+
+def make_flowchart(edges: int, seed: int = 1) -> tuple:
+    """Random DAG-ish flowchart: (nodes, edges) with labels, shapes and link texts"""
+    rng = random.Random(seed)
+    nodes = max(edges // 3, 2)
+    node_list = [(f"Step {i % 50}", SHAPES[i % len(SHAPES)]) for i in range(nodes)]
+    edge_list = []
+    for _ in range(edges):
+        source = rng.randrange(nodes - 1)
+        target = rng.randrange(source + 1, nodes)
+        edge_list.append((source, target, rng.choice(["-->", "-.->", "==>"]), rng.choice([None, "yes", "no"])))
+    return node_list, edge_list
+
+
+def render(node_list: list, edge_list: list, ids: list, shuffle_seed: int = None, indent: str = "    ") -> str:
+    """Mermaid code for the graph with the given node ids, optionally with shuffled lines"""
+    declarations = [f"{ids[i]}{opener}{label}{closer}" for i, (label, (opener, closer)) in enumerate(node_list)]
+    links = [f"{ids[s]} {arrow}{f'|{label}|' if label else ''} {ids[t]}" for s, t, arrow, label in edge_list]
+    if shuffle_seed is not None:
+        rng = random.Random(shuffle_seed)
+        rng.shuffle(declarations)
+        rng.shuffle(links)
+    return "\n".join(["flowchart TD"] + [indent + line for line in declarations + links])
+
+
+def timed(code: str, repeat: int) -> float:
+    """Best time of canonicalize_mermaid over repeat runs (memo cache cleared)"""
+    best = float("inf")
+    for _ in range(repeat):
+        canonicalize_mermaid.cache.clear()
+        start = time.perf_counter()
+        canonicalize_mermaid(code, "flowchart")
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(edge_counts: list, repeat: int):
+    print(f"{'edges':>7} {'nodes':>6} {'parse ms':>9} {'canon ms':>9} {'cached us':>10} {'same hash':>10}")
+    for edges in edge_counts:
+        node_list, edge_list = make_flowchart(edges)
+        original = render(node_list, edge_list, [f"N{i}" for i in range(len(node_list))])
+
+        # Те же узлы под другими id, связи в другом порядке, другие отступы
+        renamed_ids = [f"node_{i * 7919 % 100003}" for i in range(len(node_list))]
+        variant = render(node_list, edge_list, renamed_ids, shuffle_seed=42, indent="\t  ")
+
+        start = time.perf_counter()
+        parse_mermaid(original, "flowchart")
+        parse_ms = (time.perf_counter() - start) * 1000
+        canon_ms = timed(original, repeat) * 1000
+
+        start = time.perf_counter()
+        for _ in range(100):
+            canonicalize_mermaid(original, "flowchart")
+        cached_us = (time.perf_counter() - start) / 100 * 1e6
+
+        same = canonicalize_mermaid(original, "flowchart").structural_hash == \
+            canonicalize_mermaid(variant, "flowchart").structural_hash
+        print(f"{edges:>7} {len(node_list):>6} {parse_ms:>9.1f} {canon_ms:>9.1f} {cached_us:>10.1f} {str(same):>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--edges", type=int, nargs="+", default=[1000, 5000], help="link counts to test")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.edges, args.repeat)
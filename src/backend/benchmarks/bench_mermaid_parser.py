@@ -0,0 +1,192 @@
+# src/backend/benchmarks/bench_mermaid_parser.py
+"""Mermaid parser throughput on one core: diagrams/s per diagram type.
+
+Run from src/backend:
+    python -m benchmarks.bench_mermaid_parser --seconds 1 --nodes 200
+"""
+import argparse
+import time
+
+from app.utils.mermaid_parser import parse_mermaid, MermaidSyntaxError
+
+# Типичные ответы LLM по размеру (15-25 строк)
+SAMPLES = {
+    "flowchart": """flowchart TD
+    A([Start]) --> B[Enter login and password]
+    B --> C{Credentials valid?}
+    C -->|Yes| D[Load profile]
+    C -->|No| E[Show error]
+    E --> F{Attempts left?}
+    F -->|Yes| B
+    F -->|No| G[Lock account]
+    D --> H[(Users DB)]
+    H --> I["Open dashboard (home)"]
+    G --> J([End])
+    I --> J
+    subgraph audit [Audit]
+        K[Write log] -.-> L[Notify admin]
+    end
+    C -- timeout --> K
+    classDef danger fill:#f96
+    class G danger""",
+    "sequence": """sequenceDiagram
+    autonumber
+    actor U as User
+    participant F as Frontend
+    participant A as API
+    participant D as Database
+    U->>F: Click login
+    F->>+A: POST /auth/login
+    A->>+D: find user
+    D-->>-A: user record
+    alt password ok
+        A-->>F: 200 token
+        F-->>U: Show dashboard
+    else wrong password
+        A-->>F: 401
+        F-->>U: Show error
+    end
+    Note over A,D: Passwords are hashed
+    A-->>-F: done""",
+    "class": """classDiagram
+    class User {
+        +String id
+        +String email
+        -String passwordHash
+        +login(password) bool
+    }
+    class Diagram {
+        +String title
+        +String code
+        +render() String
+    }
+    class Workspace {
+        +List~Diagram~ diagrams
+        +add(Diagram d) void
+    }
+    User "1" --> "*" Workspace : owns
+    Workspace o-- Diagram
+    Diagram <|-- Flowchart
+    Diagram <|-- SequenceDiagram""",
+    "er": """erDiagram
+    USER ||--o{ DIAGRAM : creates
+    USER ||--o{ GENERATION_LOG : produces
+    DIAGRAM ||--o{ GENERATION_LOG : has
+    USER {
+        string id PK
+        string email UK
+        string password_hash
+    }
+    DIAGRAM {
+        string id PK
+        string user_id FK
+        string title
+        string code
+        datetime created_at
+    }
+    GENERATION_LOG {
+        string id PK
+        string diagram_id FK
+        float generation_time
+    }""",
+    "gantt": """gantt
+    title Release plan
+    dateFormat YYYY-MM-DD
+    excludes weekends
+    section Design
+        Requirements      :done, req, 2024-01-01, 5d
+        Architecture      :active, arch, after req, 7d
+    section Build
+        Backend           :be, after arch, 15d
+        Frontend          :fe, after arch, 12d
+        Integration       :crit, int, after be, 5d
+    section Release
+        Testing           :test, after int, 7d
+        Launch            :milestone, launch, after test, 0d""",
+    "state": """stateDiagram-v2
+    [*] --> Draft
+    Draft --> Review : submit
+    Review --> Draft : changes requested
+    Review --> Approved : approve
+    state Approved {
+        [*] --> Scheduled
+        Scheduled --> Published : publish date
+    }
+    Approved --> Archived : archive
+    Archived --> [*]
+    note right of Review : two reviewers required""",
+    "pie": """pie title Diagram types
+    "Flowchart" : 45
+    "Sequence" : 20
+    "Class" : 15
+    "ER" : 12
+    "Gantt" : 8""",
+    "journey": """journey
+    title Creating a diagram
+    section Prompt
+      Open workspace: 5: User
+      Describe process: 3: User
+    section Generate
+      Wait for LLM: 2: User, System
+      Review result: 4: User
+    section Share
+      Export SVG: 5: User""",
+    "git": """gitGraph
+    commit id: "init"
+    branch develop
+    checkout develop
+    commit id: "parser"
+    branch feature
+    checkout feature
+    commit id: "validator"
+    checkout develop
+    merge feature
+    checkout main
+    merge develop tag: "v1.0"
+    commit"""
+}
+
+
+def make_large_flowchart(nodes: int) -> str:
+    lines = ["flowchart TD"]
+    for i in range(nodes):
+        lines.append(f"    N{i}[Step {i}] -->|next| N{i + 1}{{Check {i + 1}?}}")
+    return "\n".join(lines)
+
+
+def measure(code: str, diagram_type: str, seconds: float) -> float:
+    """Diagrams parsed per second during the given time window"""
+    parse_mermaid(code, diagram_type)  # Прогрев и проверка, что пример валиден
+    count = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for _ in range(50):
+            parse_mermaid(code, diagram_type)
+        count += 50
+    return count / (time.perf_counter() - start)
+
+
+def main(seconds: float, nodes: int):
+    print(f"{'type':>12} {'lines':>6} {'diagrams/s':>12} {'us/diagram':>11}")
+    for diagram_type, code in SAMPLES.items():
+        rate = measure(code, diagram_type, seconds)
+        print(f"{diagram_type:>12} {code.count(chr(10)) + 1:>6} {rate:>12.0f} {1e6 / rate:>11.1f}")
+
+    large = make_large_flowchart(nodes)
+    rate = measure(large, "flowchart", seconds)
+    print(f"{'flowchart+':>12} {nodes + 1:>6} {rate:>12.0f} {1e6 / rate:>11.1f}")
+
+    broken = SAMPLES["flowchart"].replace("[Lock account]", "[Lock (account]")
+    try:
+        parse_mermaid(broken, "flowchart")
+    except MermaidSyntaxError as e:
+        print(f"error example: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=1.0, help="time per diagram type")
+    parser.add_argument("--nodes", type=int, default=200, help="nodes in the large flowchart")
+    args = parser.parse_args()
+    main(args.seconds, args.nodes)
@@ -0,0 +1,78 @@
+# src/backend/benchmarks/bench_modification_context.py
+"""Modification prompt size vs diagram size: whole diagram vs relevance-pruned
+excerpt, plus selection and merge-back cost.
+
+Prefill time is roughly proportional to prompt tokens, so the pruned column
+should stay flat as the diagram grows.
+
+Run from src/backend:
+    python -m benchmarks.bench_modification_context --nodes 100 300 1000 3000
+"""
+import argparse
+import random
+import time
+
+from app.core.config import settings
+from app.services.context_budget import context_budget_manager
+from app.utils.mermaid_context import select_relevant_context, merge_excerpt
+from app.utils.mermaid_validator import validate_mermaid_syntax
+from app.utils.prompt_templates import get_prompt_template, get_modification_prompt
+
+WORDS = "Order Payment Shipping Invoice Stock Review Approve Notify Refund Cancel Archive Audit".split()
+REQUEST = "Rename the payment gateway step to 'Charge card' and send a receipt after it"
+
+
+def make_flowchart(nodes: int, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    target = rng.randrange(nodes)
+    lines = ["flowchart TD"]
+    for i in range(nodes):
+        label = "Payment gateway call" if i == target else f"{rng.choice(WORDS)} step {i}"
+        lines.append(f"    N{i}[{label}]")
+    for i in range(1, nodes):
+        lines.append(f"    N{rng.randrange(max(0, i - 5), i)} --> N{i}")
+    return "\n".join(lines)
+
+
+def prompt_tokens(code: str, model: str) -> int:
+    prompt = get_prompt_template("flowchart", get_modification_prompt("flowchart", code, REQUEST))
+    return context_budget_manager.prompt_tokens(prompt, model)
+
+
+def main(node_counts: list, model: str):
+    print(f"{'nodes':>6} {'full tokens':>12} {'pruned tokens':>14} {'excerpt nodes':>14} {'select ms':>10} {'merge ms':>9}")
+    for count in node_counts:
+        code = make_flowchart(count)
+
+        started = time.perf_counter()
+        selection = select_relevant_context(
+            code, "flowchart", REQUEST,
+            hops=settings.modification_context_hops,
+            max_nodes=settings.modification_context_max_nodes,
+            min_nodes=settings.modification_context_min_nodes
+        )
+        select_ms = (time.perf_counter() - started) * 1000
+        if selection is None:
+            print(f"{count:>6} {prompt_tokens(code, model):>12} {'-':>14} {'-':>14} {select_ms:>10.1f} {'-':>9}")
+            continue
+
+        # Ответ модели: переименованный узел и новый шаг после него
+        edited = selection.code.replace("[Payment gateway call]", "[Charge card]")
+        node_id = next(line.split("[")[0].strip() for line in edited.split("\n") if "[Charge card]" in line)
+        edited += f"\n    {node_id} --> Receipt[Send receipt]"
+
+        started = time.perf_counter()
+        merged = merge_excerpt(code, selection.code, edited, "flowchart")
+        merge_ms = (time.perf_counter() - started) * 1000
+        assert validate_mermaid_syntax(merged, "flowchart")[0] and "Charge card" in merged and "Receipt" in merged
+
+        print(f"{count:>6} {prompt_tokens(code, model):>12} {prompt_tokens(selection.code, model):>14} "
+              f"{selection.nodes:>14} {select_ms:>10.1f} {merge_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, nargs="+", default=[100, 300, 1000, 3000])
+    parser.add_argument("--model", default=settings.default_model)
+    args = parser.parse_args()
+    main(args.nodes, args.model)
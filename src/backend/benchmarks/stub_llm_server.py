@@ -0,0 +1,147 @@
+# src/backend/benchmarks/stub_llm_server.py
+"""Minimal OpenAI-compatible stub server used by the benchmarks.
+
+Speaks just enough HTTP/1.1 (keep-alive included) to answer
+GET /v1/models and POST /v1/chat/completions with a fixed diagram.
+"""
+import asyncio
+import json
+from typing import Optional
+
+DEFAULT_CONTENT = "```mermaid\nflowchart TD\n    A[Start] --> B[Process]\n    B --> C[End]\n```"
+
+
+class StubLLMServer:
+    
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        token_delay: float = 0.0,
+        content: str = DEFAULT_CONTENT,
+        models: Optional[list] = None,
+        max_parallel: Optional[int] = None
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.token_delay = token_delay
+        self.content = content
+        self.models = models or ["stub-model"]
+        self.max_parallel = max_parallel  # Эмуляция GPU: сколько запросов обрабатывается одновременно
+        self.connections = 0
+        self.requests = 0
+        self.healthy = True
+        self._gpu = asyncio.Semaphore(max_parallel) if max_parallel else None
+        self._server: Optional[asyncio.base_events.Server] = None
+    
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+    
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+    
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                
+                body = b""
+                if "content-length" in headers:
+                    body = await reader.readexactly(int(headers["content-length"]))
+                
+                self.requests += 1
+                if method == "POST" and body and json.loads(body).get("stream") and self.healthy:
+                    await self._stream(writer, json.loads(body))
+                    continue
+                
+                status, payload = await self._route(method, path, body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+    
+    async def _stream(self, writer: asyncio.StreamWriter, request: dict):
+        """Answer a streaming completion with SSE chunks (chunked encoding)"""
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: keep-alive\r\n\r\n"
+        )
+        
+        async def send(data: str):
+            frame = f"data: {data}\n\n".encode()
+            writer.write(f"{len(frame):x}\r\n".encode() + frame + b"\r\n")
+            await writer.drain()
+        
+        if self._gpu:
+            async with self._gpu:
+                await self._stream_tokens(send)
+        else:
+            await self._stream_tokens(send)
+        
+        await send(json.dumps({"choices": [{"delta": {}, "finish_reason": "stop"}]}))
+        await send("[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+    
+    async def _stream_tokens(self, send):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        
+        tokens = [self.content[i:i + 4] for i in range(0, len(self.content), 4)]
+        for token in tokens:
+            chunk = {"choices": [{"delta": {"content": token}, "finish_reason": None}]}
+            await send(json.dumps(chunk))
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+    
+    async def _route(self, method: str, path: str, body: bytes):
+        if not self.healthy:
+            return "503 Service Unavailable", {"error": "unhealthy"}
+        
+        if method == "GET" and path == "/v1/models":
+            return "200 OK", {"data": [{"id": model} for model in self.models]}
+        
+        if method == "POST" and path == "/v1/chat/completions":
+            if self._gpu:
+                async with self._gpu:
+                    await asyncio.sleep(self.latency)
+            elif self.latency:
+                await asyncio.sleep(self.latency)
+            return "200 OK", {
+                "choices": [{"message": {"role": "assistant", "content": self.content}, "finish_reason": "stop"}],
+                "usage": {"completion_tokens": len(self.content) // 4}
+            }
+        
+        return "404 Not Found", {"error": "not found"}
@@ -1,13 +1,26 @@
 // frontend/src/components/dashboard/DiagramCard.jsx
 import { Link } from 'react-router-dom'
+import api from '../../services/api'
 
 function DiagramCard({ diagram }) {
   return (
-    <div style={{ border: '1px solid #ccc', padding: '15px', marginBottom: '10px' }}>
-      <h4>{diagram.title}</h4>
-      <p>Type: {diagram.diagram_type}</p>
-      <p>Updated: {new Date(diagram.updated_at).toLocaleDateString()}</p>
-      <Link to={`/workspace/${diagram.id}`}>Open</Link>
+    <div style={{ border: '1px solid #ccc', padding: '15px', marginBottom: '10px', display: 'flex', gap: '15px' }}>
+      {diagram.thumbnail_url && (
+        <img
+          src={`${api.defaults.baseURL}${diagram.thumbnail_url}`}
+          alt={diagram.title}
+          loading="lazy"
+          width={240}
+          height={160}
+          style={{ border: '1px solid #eee', background: '#fff' }}
+        />
+      )}
+      <div>
+        <h4>{diagram.title}</h4>
+        <p>Type: {diagram.diagram_type}</p>
+        <p>Updated: {new Date(diagram.updated_at).toLocaleDateString()}</p>
+        <Link to={`/workspace/${diagram.id}`}>Open</Link>
+      </div>
     </div>
   )
 }
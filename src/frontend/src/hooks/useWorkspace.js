@@ -117,14 +117,29 @@ export const useWorkspace = id => {
     try {
       let result
       if (isNew) {
-        const { data } = await createDiagram({
+        const payload = {
           title: state.title || 'Untitled',
           diagram_type: state.diagramType,
           mermaid_code: state.code,
           original_prompt: state.prompt
-        })
-        result = data.id
-        notify('Diagram created', 'success')
+        }
+        try {
+          const { data } = await createDiagram(payload)
+          result = data.id
+          notify('Diagram created', 'success')
+        } catch (err) {
+          const existing = err.response?.status === 409 ? err.response.data?.detail : null
+          if (!existing) throw err
+          // Такая же по структуре диаграмма уже сохранена: копия или переход к ней
+          if (window.confirm(`You already have this diagram: "${existing.existing_title}". Save a copy anyway?`)) {
+            const { data } = await createDiagram({ ...payload, allow_duplicate: true })
+            result = data.id
+            notify('Diagram created', 'success')
+          } else {
+            result = existing.existing_id
+            notify('Opened the existing diagram', 'info')
+          }
+        }
       } else {
         await updateDiagram(id, {
           title: state.title,